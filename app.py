@@ -1,11 +1,27 @@
+import hashlib
+import json
+import logging
 import os
+import re
+import sqlite3
+import time
 import uuid
-from flask import Flask, render_template, request, jsonify, session
+from datetime import datetime
+import click
+from flask import Flask, Response, g, render_template, request, jsonify, session, stream_with_context
 from flask_session import Session
 from services.claude_service import ClaudeService, APIError
-from services.prd_service import PRDService
+from services.conversation_store import create_conversation_store
+from services.job_service import JobError, JobService
+from services import metrics, tracing
+from services.prd_service import PRDService, iter_sections
 from services.research_service import ResearchService
-from config import SECRET_KEY, REDIS_URL, IS_PRODUCTION
+from services.storage import create_storage
+from config import SECRET_KEY, REDIS_URL, IS_PRODUCTION, RESEARCH_PARALLEL
+from prompts.system_prompts import LOAD_PRD_PREFIX
+
+tracing.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -25,13 +41,16 @@ else:
 
 Session(app)
 
-claude_service = ClaudeService()
-prd_service = PRDService()
-research_service = ResearchService()
+claude_service = ClaudeService(app.config.get("SESSION_REDIS"))
+prd_service = PRDService(create_storage())
+research_service = ResearchService(app.config.get("SESSION_REDIS"))
+
+# Server-side conversation storage (avoids cookie size limits).
+# With Redis configured, history is shared across all gunicorn workers.
+conversation_store = create_conversation_store(app.config.get("SESSION_REDIS"))
 
-# Server-side conversation storage (avoids cookie size limits)
-# Note: In production with multiple workers, consider using Redis for this too
-conversations = {}
+# Long-running research and PRD generation can run as background jobs
+job_service = JobService(app.config.get("SESSION_REDIS"))
 
 
 def get_session_id():
@@ -44,13 +63,31 @@ def get_session_id():
 def get_messages():
     """Get messages for current session."""
     session_id = get_session_id()
-    return conversations.get(session_id, [])
+    return conversation_store.get(session_id)
 
 
 def set_messages(messages):
     """Set messages for current session."""
     session_id = get_session_id()
-    conversations[session_id] = messages
+    conversation_store.set(session_id, messages)
+
+
+def sse_event(payload: dict) -> str:
+    """Format a payload as a Server-Sent Events data frame."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def sse_response(events) -> Response:
+    """Wrap an event generator in a streaming text/event-stream response."""
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop reverse proxies (Railway, nginx) from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
 
 
 @app.route("/")
@@ -88,7 +125,8 @@ def chat():
 
         return jsonify({
             "response": assistant_response,
-            "message_count": len(messages)
+            "message_count": len(messages),
+            "usage": claude_service.last_usage
         })
 
     except APIError as e:
@@ -102,13 +140,50 @@ def chat():
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
 
-@app.route("/api/generate-prd", methods=["POST"])
-def generate_prd():
-    """Generate a PRD from the conversation."""
-    messages = get_messages()
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """Handle chat messages, streaming the reply token-by-token over SSE."""
+    data = request.get_json()
+    user_message = data.get("message", "").strip()
+
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
+
+    # Work on a copy so an aborted stream never leaves a dangling user turn
+    messages = get_messages() + [{"role": "user", "content": user_message}]
+
+    def events():
+        chunks = []
+        try:
+            for text in claude_service.chat_stream(messages):
+                chunks.append(text)
+                yield sse_event({"type": "delta", "text": text})
+        except APIError as e:
+            yield sse_event({"type": "error", "error": str(e)})
+            return
+        except Exception as e:
+            yield sse_event({"type": "error", "error": f"Unexpected error: {str(e)}"})
+            return
+
+        # Only commit the exchange to history once the full reply has arrived
+        messages.append({"role": "assistant", "content": "".join(chunks)})
+        set_messages(messages)
+
+        yield sse_event({
+            "type": "done",
+            "message_count": len(messages),
+            "usage": claude_service.last_usage
+        })
+
+    return sse_response(events())
+
+
+def run_generate_prd(session_id: str) -> tuple[dict, int]:
+    """Generate and save a PRD from a session's conversation; returns (payload, status code)."""
+    messages = conversation_store.get(session_id)
 
     if len(messages) < 2:
-        return jsonify({"error": "Not enough conversation to generate a PRD"}), 400
+        return {"error": "Not enough conversation to generate a PRD"}, 400
 
     try:
         # Generate PRD content
@@ -117,22 +192,164 @@ def generate_prd():
         # Save to file
         filename = prd_service.save_prd(prd_content)
 
-        return jsonify({
+        return {
             "prd": prd_content,
-            "filename": filename
-        })
+            "filename": filename,
+            "usage": claude_service.last_usage
+        }, 200
 
     except APIError as e:
-        return jsonify({"error": str(e)}), 503
+        return {"error": str(e)}, 503
     except Exception as e:
-        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+        return {"error": f"Unexpected error: {str(e)}"}, 500
+
+
+@app.route("/api/generate-prd", methods=["POST"])
+def generate_prd():
+    """Generate a PRD from the conversation."""
+    payload, status = run_generate_prd(get_session_id())
+    return jsonify(payload), status
+
+
+@app.route("/api/generate-prd/stream", methods=["POST"])
+def generate_prd_stream():
+    """Generate a PRD, streaming it section by section over SSE while saving."""
+    messages = get_messages()
+
+    if len(messages) < 2:
+        return jsonify({"error": "Not enough conversation to generate a PRD"}), 400
+
+    def events():
+        # The writer discards its temp file unless commit() is reached,
+        # including when the client disconnects mid-stream
+        with prd_service.open_prd_writer() as writer:
+            try:
+                for section in iter_sections(claude_service.generate_prd_stream(messages)):
+                    writer.write(section)
+                    yield sse_event({"type": "section", "text": section})
+                filename = writer.commit()
+            except APIError as e:
+                yield sse_event({"type": "error", "error": str(e)})
+                return
+            except Exception as e:
+                yield sse_event({"type": "error", "error": f"Unexpected error: {str(e)}"})
+                return
+
+        yield sse_event({
+            "type": "done",
+            "filename": filename,
+            "usage": claude_service.last_usage
+        })
+
+    return sse_response(events())
 
 
 @app.route("/api/prds", methods=["GET"])
 def list_prds():
-    """List all saved PRDs."""
-    prds = prd_service.list_prds()
-    return jsonify({"prds": prds})
+    """
+    List saved PRDs, newest first.
+
+    Optional query parameters: limit and cursor (the previous page's
+    next_cursor) for pagination, and fields (comma-separated) to trim each
+    entry. Responses carry a strong ETag so unchanged listings revalidate
+    with 304 Not Modified.
+    """
+    limit = request.args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = int(limit)
+    fields = request.args.get("fields")
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+
+    # The ETag covers the index state and the query, since each page differs
+    version = prd_service.listing_version()
+    etag = None
+    if version is not None:
+        etag = hashlib.sha256(
+            f"{version}?{request.query_string.decode('utf-8')}".encode("utf-8")
+        ).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+    try:
+        page = prd_service.list_prds_page(limit, request.args.get("cursor"), fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(page)
+    if etag is not None:
+        response.set_etag(etag)
+    # Let the browser keep the listing but revalidate it on every request
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/prds/search", methods=["GET"])
+def search_prds():
+    """Full-text search over saved PRDs and research (?q=...&limit=...)."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Search query is required"}), 400
+    limit = request.args.get("limit", "20")
+    if not limit.isdigit() or not 1 <= int(limit) <= 100:
+        return jsonify({"error": "limit must be between 1 and 100"}), 400
+
+    try:
+        results = prd_service.search(query, int(limit))
+    except sqlite3.Error as e:
+        return jsonify({"error": f"Search unavailable: {str(e)}"}), 503
+    except OSError as e:
+        # The index directory couldn't be created or read
+        return jsonify({"error": f"Search failed: {str(e)}"}), 500
+    return jsonify({"query": query, "results": results})
+
+
+@app.route("/api/prds/archive", methods=["POST"])
+def archive_prds():
+    """Archive several PRDs (with research) and research files in one request."""
+    data = request.get_json(silent=True) or {}
+    filenames = data.get("filenames")
+    if not filenames or not isinstance(filenames, list) or not all(isinstance(f, str) for f in filenames):
+        return jsonify({"error": "filenames must be a non-empty list of strings"}), 400
+
+    result = prd_service.archive_batch(filenames)
+    return jsonify({
+        "success": all(r["success"] for r in result["results"]),
+        "message": f"Archived {result['archived']} file(s)",
+        "results": result["results"]
+    })
+
+
+@app.route("/api/prds/export", methods=["GET", "POST"])
+def export_prds():
+    """
+    Download selected PRDs and their research as a zip.
+
+    Select PRDs with repeated filename= and/or product= (a product prefix,
+    for its whole PRD history), in the query string or a form POST. Large
+    selections must be POSTed: they don't fit in a request line. The zip
+    is streamed as it is built.
+    """
+    filenames = request.values.getlist("filename")
+    products = request.values.getlist("product")
+    if not filenames and not products:
+        return jsonify({"error": "Select at least one filename or product"}), 400
+
+    rows = prd_service.export_rows(filenames, products)
+    if not rows:
+        return jsonify({"error": "No matching PRDs"}), 404
+
+    name = f"prds-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+    return Response(
+        stream_with_context(prd_service.export_zip(rows)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'}
+    )
 
 
 @app.route("/api/prds/<filename>", methods=["GET"])
@@ -165,6 +382,20 @@ def archive_prd(filename):
         return jsonify({"error": "Failed to archive file"}), 404
 
 
+@app.route("/api/prds/<filename>/restore", methods=["POST"])
+def restore_prd(filename):
+    """Restore an archived PRD or research file."""
+    if prd_service.restore_prd(filename):
+        return jsonify({"success": True, "message": f"Restored {filename}"})
+    return jsonify({"error": "Archived file not found or already active"}), 404
+
+
+@app.route("/api/archive/stats", methods=["GET"])
+def archive_stats():
+    """Report archived file counts and the space saved by compression."""
+    return jsonify(prd_service.archive_stats())
+
+
 @app.route("/api/clear", methods=["POST"])
 def clear_conversation():
     """Clear the current conversation."""
@@ -183,7 +414,7 @@ def load_prd(filename):
     messages = [
         {
             "role": "user",
-            "content": f"I have an existing PRD that I'd like to iterate on and improve. Here it is:\n\n{content}"
+            "content": f"{LOAD_PRD_PREFIX}{content}"
         },
         {
             "role": "assistant",
@@ -285,65 +516,96 @@ def research_search():
         return jsonify({"error": f"Search failed: {str(e)}"}), 500
 
 
-@app.route("/api/research/context", methods=["POST"])
-def context_research():
-    """Conduct context-aware research from conversation or existing PRD."""
-    data = request.get_json()
-    source = data.get("source", "conversation")
+def run_context_research(
+    session_id: str, source: str, force_refresh: bool = False, parallel: bool = RESEARCH_PARALLEL
+) -> tuple[dict, int]:
+    """
+    Research competitors for the product in a conversation or saved PRD.
 
+    The findings are appended to the session's conversation so they are
+    included in PRD generation. Returns a (payload, status code) pair; this
+    takes the session ID explicitly so background jobs can run it outside
+    the request context. With parallel set, each report section is a
+    separate concurrent query and per-section timings are returned in debug.
+    """
     try:
         # Extract product context based on source
-        if source == "conversation":
-            messages = get_messages()
-            if not messages:
-                return jsonify({
-                    "error": "no_context",
-                    "message": "No conversation found. Please describe your product idea or select an existing PRD."
-                }), 400
-            context = claude_service.extract_product_context(messages=messages)
-        else:
-            # Source is a PRD filename
-            prd_content = prd_service.get_prd(source)
-            if not prd_content:
-                return jsonify({"error": "PRD not found"}), 404
-            context = claude_service.extract_product_context(prd_content=prd_content)
+        with tracing.span("research.extract_context", source=source):
+            if source == "conversation":
+                messages = conversation_store.get(session_id)
+                if not messages:
+                    return {
+                        "error": "no_context",
+                        "message": "No conversation found. Please describe your product idea or select an existing PRD."
+                    }, 400
+                context = claude_service.extract_product_context(messages=messages)
+                extraction = {"method": "claude"}
+            else:
+                # Source is a PRD filename
+                prd_content = prd_service.get_prd(source)
+                if not prd_content:
+                    return {"error": "PRD not found"}, 404
+                # Saved PRDs are structured enough to read locally; only ask
+                # Claude when the local pass can't find every field
+                context = prd_service.extract_product_context(prd_content)
+                extraction = {"method": "local", "local_confidence": context["confidence"]}
+                if context["confidence"] == "low":
+                    context = claude_service.extract_product_context(prd_content=prd_content)
+                    extraction["method"] = "claude"
 
         # Check if extraction was successful
         if not context.get("product_name") or context.get("confidence") == "none":
-            return jsonify({
+            return {
                 "error": "insufficient_context",
                 "message": "Could not identify a clear product from the source. Please provide more details about what you're building."
-            }), 400
+            }, 400
 
         # Run competitor research using Perplexity
         product_name = context["product_name"]
         product_description = context.get("product_description", product_name)
         # Use search_category for cleaner search queries (removes marketing words)
-        search_term = context.get("search_category", product_name)
-
-        # Perplexity returns the full analysis directly
-        analysis = research_service.research_competitors(
-            search_term,
-            product_description
-        )
-
-        # Debug: log research results
-        print(f"[DEBUG] Product: {product_name}, Search term: {search_term}")
-        print(f"[DEBUG] Analysis length: {len(analysis)} chars")
+        search_term = context.get("search_category") or product_name
+
+        with tracing.span("research.competitors", parallel=parallel, force_refresh=force_refresh):
+            research_debug = {}
+            if parallel:
+                result = research_service.research_competitors_parallel(
+                    search_term,
+                    product_description,
+                    force_refresh=force_refresh
+                )
+                analysis = result["content"]
+                research_debug = {"cached": result["cached"], "sections": result["sections"]}
+            else:
+                # Perplexity returns the full analysis directly
+                analysis = research_service.research_competitors(
+                    search_term,
+                    product_description,
+                    force_refresh=force_refresh
+                )
+
+        logger.info("Context research finished", extra={
+            "product": product_name,
+            "search_term": search_term,
+            "analysis_length": len(analysis),
+            "extraction": extraction["method"],
+            "parallel": parallel
+        })
 
         # Add research to conversation history so it's included in PRD generation
-        messages = get_messages()
-        messages.append({
-            "role": "user",
-            "content": f"I've gathered competitive research for {product_name}."
-        })
-        messages.append({
-            "role": "assistant",
-            "content": analysis
-        })
-        set_messages(messages)
+        with tracing.span("research.update_conversation"):
+            messages = conversation_store.get(session_id)
+            messages.append({
+                "role": "user",
+                "content": f"I've gathered competitive research for {product_name}."
+            })
+            messages.append({
+                "role": "assistant",
+                "content": analysis
+            })
+            conversation_store.set(session_id, messages)
 
-        return jsonify({
+        return {
             "success": True,
             "product_name": product_name,
             "product_description": product_description,
@@ -352,12 +614,113 @@ def context_research():
             "confidence": context.get("confidence", "medium"),
             "debug": {
                 "search_term": search_term,
-                "analysis_length": len(analysis)
+                "analysis_length": len(analysis),
+                "extraction": extraction,
+                "parallel": parallel,
+                **research_debug
             }
-        })
+        }, 200
 
     except Exception as e:
-        return jsonify({"error": f"Research failed: {str(e)}"}), 500
+        return {"error": f"Research failed: {str(e)}"}, 500
+
+
+def research_flags(data: dict):
+    """
+    The force_refresh and parallel options of a research request, or None
+    if either is given as anything but a JSON boolean ("false" is truthy).
+    """
+    flags = (data.get("force_refresh", False), data.get("parallel", RESEARCH_PARALLEL))
+    if not all(isinstance(flag, bool) for flag in flags):
+        return None
+    return flags
+
+
+@app.route("/api/research/context", methods=["POST"])
+def context_research():
+    """Conduct context-aware research from conversation or existing PRD."""
+    data = request.get_json()
+    flags = research_flags(data)
+    if flags is None:
+        return jsonify({"error": "force_refresh and parallel must be booleans"}), 400
+    force_refresh, parallel = flags
+    payload, status = run_context_research(
+        get_session_id(),
+        data.get("source", "conversation"),
+        force_refresh=force_refresh,
+        parallel=parallel
+    )
+    return jsonify(payload), status
+
+
+def as_job(fn, *args):
+    """Adapt a (payload, status code) helper into a job function."""
+    def run():
+        payload, status = fn(*args)
+        if status >= 400:
+            raise JobError(payload)
+        return payload
+    return run
+
+
+def job_response(job: dict) -> dict:
+    """Public view of a job record."""
+    return {key: value for key, value in job.items() if key != "owner"}
+
+
+@app.route("/api/jobs/research", methods=["POST"])
+def submit_research_job():
+    """Queue context-aware research; poll /api/jobs/<job_id> for the result."""
+    data = request.get_json()
+    source = data.get("source", "conversation")
+    session_id = get_session_id()
+
+    # Fail fast on what can be checked without upstream calls
+    flags = research_flags(data)
+    if flags is None:
+        return jsonify({"error": "force_refresh and parallel must be booleans"}), 400
+    if source == "conversation" and not conversation_store.get(session_id):
+        return jsonify({
+            "error": "no_context",
+            "message": "No conversation found. Please describe your product idea or select an existing PRD."
+        }), 400
+
+    job = job_service.submit(
+        "research",
+        as_job(
+            run_context_research,
+            session_id,
+            source,
+            *flags
+        ),
+        owner=session_id
+    )
+    return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+
+
+@app.route("/api/jobs/generate-prd", methods=["POST"])
+def submit_generate_prd_job():
+    """Queue PRD generation; poll /api/jobs/<job_id> for the result."""
+    session_id = get_session_id()
+
+    if len(conversation_store.get(session_id)) < 2:
+        return jsonify({"error": "Not enough conversation to generate a PRD"}), 400
+
+    job = job_service.submit(
+        "generate_prd",
+        as_job(run_generate_prd, session_id),
+        owner=session_id
+    )
+    return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Get the status, and once finished the result or error, of a job."""
+    job = job_service.get(job_id, owner=get_session_id())
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_response(job))
 
 
 @app.route("/api/research/save", methods=["POST"])
@@ -402,15 +765,118 @@ def save_research():
         return jsonify({"error": f"Save failed: {str(e)}"}), 500
 
 
+# Request IDs accepted from clients and proxies; anything else is replaced
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def when_finished(response, callback) -> None:
+    """Run callback once response has been sent."""
+    if response.is_sequence:
+        callback()
+    else:
+        # SSE and zip exports finish when the server closes the response
+        response.call_on_close(callback)
+
+
+def request_route() -> str:
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+@app.before_request
+def start_request_trace():
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    tracing.set_request_id(request_id)
+    trace_id, parent_id = tracing.parse_traceparent(request.headers.get("traceparent"))
+    span = tracing.start_span(
+        f"{request.method} {request_route()}", kind="server", trace_id=trace_id, parent_id=parent_id,
+        **{"http.method": request.method, "http.route": request_route(), "http.target": request.path}
+    )
+    tracing.activate(span)
+    g.request_id, g.trace_span = request_id, span
+
+
+@app.after_request
+def finish_request_trace(response):
+    response.headers["X-Request-ID"] = g.request_id
+    span = g.trace_span
+    span.set_attribute("http.status_code", response.status_code)
+    if response.status_code >= 500:
+        span.status = "error"
+
+    def finish():
+        tracing.finish(span)
+        tracing.activate(None)
+        tracing.set_request_id(None)
+
+    when_finished(response, finish)
+    return response
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_route = request_route()
+    g.metrics_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.labels(g.metrics_route).inc()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    route, started = g.metrics_route, g.metrics_started
+    method, status = request.method, str(response.status_code)
+
+    def record():
+        metrics.HTTP_IN_FLIGHT.labels(route).dec()
+        metrics.HTTP_REQUESTS.labels(method, route, status).inc()
+        metrics.HTTP_DURATION.labels(method, route).observe(time.perf_counter() - started)
+
+    when_finished(response, record)
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus metrics, aggregated across gunicorn workers."""
+    data, content_type = metrics.render()
+    return Response(data, content_type=content_type)
+
+
 @app.route("/health")
 def health():
     """Health check endpoint for Railway/container orchestration."""
     return jsonify({
         "status": "healthy",
-        "service": "prdy"
+        "service": "prdy",
+        "conversations": conversation_store.stats(),
+        "research": research_service.http_stats(),
+        "product_context": claude_service.context_cache.stats()
     })
 
 
+@app.cli.command("rebuild-index")
+def rebuild_index():
+    """Rebuild the PRD metadata index from storage."""
+    count = prd_service.rebuild_index()
+    print(f"Indexed {count} file(s)")
+
+
+@app.cli.command("pack-archive")
+@click.option("--min-files", default=1, show_default=True, help="Only pack once this many files are loose.")
+def pack_archive(min_files):
+    """Bundle loosely archived files into a compressed segment."""
+    result = prd_service.pack_archive(min_files)
+    if result["segment"]:
+        print(f"Packed {result['files']} file(s) into segment {result['segment']}")
+    else:
+        print("Nothing to pack")
+    stats = prd_service.archive_stats()
+    print(
+        f"Archive: {stats['files']} file(s), {stats['original_bytes']} bytes "
+        f"stored in {stats['stored_bytes']} ({stats['saved_bytes']} saved)"
+    )
+
+
 if __name__ == "__main__":
     # Local development only - production uses gunicorn via Procfile
     app.run(debug=True, port=5001, host="127.0.0.1")
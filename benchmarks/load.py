@@ -0,0 +1,397 @@
+"""
+End-to-end load test: gunicorn serving the app against stub upstream APIs.
+
+    python -m benchmarks.load --users 100 --duration 60 --latency 2 --token-rate 80
+
+This starts StubAnthropic and StubPerplexity, launches gunicorn (with
+gunicorn.conf.py) pointed at them through ANTHROPIC_BASE_URL and
+PERPLEXITY_API_URL, and runs virtual users through a mix of streamed
+chat turns, context research and streamed PRD generation. Set REDIS_URL
+to run several workers the way production does. Pass --url to drive an
+app that is already running instead (its upstream settings are then up
+to you).
+
+The report gives throughput and p50/p95/p99 latency per operation, and
+worker saturation: requests in flight, sampled from /metrics, against the
+configured capacity (workers x threads or connections).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+from benchmarks.stubs import StubAnthropic, StubBehavior, StubPerplexity
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {"chat": 6, "research": 2, "generate": 1}
+
+IDEAS = [
+    "A mobile app that helps renters split utility bills",
+    "A kanban board for small construction crews",
+    "A budgeting tool for freelance designers",
+    "A booking system for independent yoga studios",
+    "A habit tracker that pairs friends as accountability partners",
+]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of values (p in 0-100); NaN when empty."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(p / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def parse_mix(text: str) -> dict:
+    """'chat=6,research=2,generate=1' -> {'chat': 6, ...}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class VirtualUser:
+    """
+    One browser session: a conversation that is researched and turned into
+    a PRD, then started over. Operations needing history chat first.
+    """
+
+    def __init__(self, base_url: str, mix: dict, record, timeout: float = 300):
+        self.base_url = base_url
+        self.operations, self.weights = zip(*mix.items())
+        self.record = record
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.turns = 0
+
+    def run(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            operation = random.choices(self.operations, self.weights)[0]
+            if operation != "chat" and self.turns == 0:
+                operation = "chat"
+            self._timed(operation)
+            if operation == "generate":
+                # Next conversation; keeps histories a realistic length
+                self.http.cookies.clear()
+                self.turns = 0
+
+    def _timed(self, operation: str) -> None:
+        started = time.monotonic()
+        try:
+            ok = getattr(self, operation)()
+        except requests.exceptions.RequestException:
+            ok = False
+        self.record(operation, started, time.monotonic(), ok)
+
+    def chat(self) -> bool:
+        message = random.choice(IDEAS) if self.turns == 0 else "Mostly small teams, and it should be cheap."
+        ok = self._stream("/api/chat/stream", {"message": message})
+        self.turns += ok
+        return ok
+
+    def research(self) -> bool:
+        response = self.http.post(
+            f"{self.base_url}/api/research/context",
+            json={"source": "conversation", "force_refresh": True}, timeout=self.timeout
+        )
+        return response.status_code == 200
+
+    def generate(self) -> bool:
+        # Bodiless, like the UI: gunicorn drops the keep-alive connection
+        # after a streamed response whose request body was never read
+        return self._stream("/api/generate-prd/stream")
+
+    def _stream(self, path: str, payload: dict = None) -> bool:
+        """POST to an SSE endpoint and read it to the end; ok if it sent 'done'."""
+        with self.http.post(f"{self.base_url}{path}", json=payload, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                return False
+            for line in response.iter_lines():
+                if line.startswith(b"data: "):
+                    event = json.loads(line[6:])
+                    if event["type"] == "error":
+                        return False
+                    if event["type"] == "done":
+                        return True
+        return False
+
+
+class SaturationSampler:
+    """
+    Polls /metrics for requests and upstream calls in flight.
+
+    A poll needs a free thread itself, so samples under-count a saturated
+    server. busy_seconds (total request time served, from the duration
+    histogram) gives the exact mean: busy seconds / (elapsed x capacity).
+    """
+
+    def __init__(self, base_url: str, interval: float = 0.5):
+        self.url = f"{base_url}/metrics"
+        self.interval = interval
+        self.requests_in_flight = []
+        self.upstream_in_flight = []
+        self.busy_seconds = 0.0
+        self._busy_at_start = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._busy_at_start = self._sample()[2]
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        if self._busy_at_start is not None:
+            self.busy_seconds = self._sample()[2] - self._busy_at_start
+
+    def _sample(self) -> tuple[float, float, float]:
+        """(requests in flight, upstream calls in flight, total request seconds)"""
+        text = requests.get(self.url, timeout=5).text
+        requests_now = upstream_now = busy = 0.0
+        for family in text_string_to_metric_families(text):
+            for sample in family.samples:
+                if sample.labels.get("route") == "/metrics":
+                    continue
+                if sample.name == "prdy_http_requests_in_flight":
+                    requests_now += sample.value
+                elif sample.name == "prdy_upstream_in_flight":
+                    upstream_now += sample.value
+                elif sample.name == "prdy_http_request_duration_seconds_sum":
+                    busy += sample.value
+        return requests_now, upstream_now, busy
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                requests_now, upstream_now, _ = self._sample()
+            except requests.exceptions.RequestException:
+                continue
+            self.requests_in_flight.append(requests_now)
+            self.upstream_in_flight.append(upstream_now)
+
+
+def run_load(base_url: str, users: int, duration: float, mix: dict = None, capacity: int = None,
+             ramp: float = 0.0) -> dict:
+    """
+    Drive base_url with virtual users for duration seconds and return the report.
+
+    Args:
+        capacity: Requests the server can hold at once, for saturation
+        ramp: Seconds over which users are started
+    """
+    mix = mix or DEFAULT_MIX
+    results = []
+    lock = threading.Lock()
+
+    def record(operation, started, finished, ok):
+        with lock:
+            results.append((operation, started, finished, ok))
+
+    sampler = SaturationSampler(base_url)
+    sampler.start()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = []
+    for i in range(users):
+        user = VirtualUser(base_url, mix, record)
+        thread = threading.Thread(target=user.run, args=(deadline,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if ramp:
+            time.sleep(ramp / users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    sampler.stop()
+    return build_report(results, duration, elapsed, sampler, capacity)
+
+
+def build_report(results: list[tuple], duration: float, elapsed: float, sampler: SaturationSampler = None,
+                 capacity: int = None) -> dict:
+    """Summarize (operation, started, finished, ok) results."""
+    window_end = min(started for _, started, _, _ in results) + duration if results else 0
+
+    def summarize(rows):
+        latencies = [finished - started for _, started, finished, ok in rows if ok]
+        completed = sum(1 for _, _, finished, ok in rows if ok and finished <= window_end)
+        return {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if not row[3]),
+            "throughput": round(completed / duration, 2),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3)
+        }
+
+    report = {
+        "duration": duration,
+        "elapsed": round(elapsed, 1),
+        "total": summarize(results),
+        "operations": {
+            operation: summarize([row for row in results if row[0] == operation])
+            for operation in sorted({row[0] for row in results})
+        }
+    }
+    if sampler is not None and sampler.requests_in_flight:
+        saturation = {
+            "capacity": capacity,
+            # Little's law: mean requests being served over the run
+            "mean_in_flight": round(sampler.busy_seconds / elapsed, 1),
+            "peak_in_flight": max(sampler.requests_in_flight),
+            "peak_upstream_in_flight": max(sampler.upstream_in_flight)
+        }
+        if capacity:
+            saturation["mean_utilization"] = round(saturation["mean_in_flight"] / capacity, 3)
+            saturation["peak_utilization"] = round(saturation["peak_in_flight"] / capacity, 3)
+        report["saturation"] = saturation
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{'operation':<10} {'requests':>9} {'errors':>7} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8}"
+    ]
+    for name, row in [*report["operations"].items(), ("total", report["total"])]:
+        lines.append(
+            f"{name:<10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>7.2f} "
+            f"{row['p50']:>7.2f}s {row['p95']:>7.2f}s {row['p99']:>7.2f}s"
+        )
+    saturation = report.get("saturation")
+    if saturation:
+        line = (
+            f"in flight: mean {saturation['mean_in_flight']}, peak {saturation['peak_in_flight']:.0f}; "
+            f"upstream calls peak {saturation['peak_upstream_in_flight']:.0f}"
+        )
+        if saturation.get("capacity"):
+            line += (
+                f"; capacity {saturation['capacity']} "
+                f"({saturation['mean_utilization']:.0%} mean, {saturation['peak_utilization']:.0%} peak)"
+            )
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def start_gunicorn(port: int, env: dict, log_path: str) -> subprocess.Popen:
+    """Start gunicorn with gunicorn.conf.py and wait until /health answers."""
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}; see {log_path}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"gunicorn didn't start; see {log_path}")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--ramp", type=float, default=2, help="seconds to start all users")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. chat=6,research=2,generate=1")
+    parser.add_argument("--url", help="drive an already running app instead of starting gunicorn")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--workers", type=int, help="default 2 with REDIS_URL set, else 1")
+    parser.add_argument("--worker-class", default="gthread", choices=["gthread", "gevent", "sync"])
+    parser.add_argument("--threads", type=int, default=128, help="per gthread worker")
+    parser.add_argument("--connections", type=int, default=500, help="per gevent worker")
+    parser.add_argument("--latency", type=float, default=1.0, help="upstream seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=80, help="upstream output tokens per second")
+    parser.add_argument("--chat-tokens", type=int, default=150, help="tokens per chat reply")
+    parser.add_argument("--prd-tokens", type=int, default=1200, help="tokens per generated PRD")
+    parser.add_argument("--research-tokens", type=int, default=600, help="tokens per Perplexity answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--json", dest="json_path", help="also write the report here")
+    args = parser.parse_args(argv)
+
+    if args.workers is None:
+        # Without Redis each worker keeps its own conversations, so a
+        # user's next request can land on a worker that never saw them
+        args.workers = 2 if os.getenv("REDIS_URL") else 1
+    elif args.workers > 1 and not os.getenv("REDIS_URL") and not args.url:
+        print("warning: without REDIS_URL, research and generation fail when they reach another worker")
+
+    if args.url:
+        report = run_load(args.url.rstrip("/"), args.users, args.duration, args.mix, ramp=args.ramp)
+    else:
+        anthropic = StubAnthropic(StubBehavior(
+            args.latency, args.token_rate, args.error_rate, args.chat_tokens, args.prd_tokens
+        ))
+        perplexity = StubPerplexity(StubBehavior(
+            args.latency, args.token_rate, args.error_rate, args.research_tokens
+        ))
+        per_worker = {"gthread": args.threads, "gevent": args.connections, "sync": 1}[args.worker_class]
+        with tempfile.TemporaryDirectory() as workdir:
+            env = {
+                **os.environ,
+                "ANTHROPIC_BASE_URL": anthropic.base_url,
+                "ANTHROPIC_API_KEY": "stub",
+                "PERPLEXITY_API_URL": perplexity.url,
+                "PERPLEXITY_API_KEY": "stub",
+                # Saved PRDs and caches go to a throwaway directory
+                "RAILWAY_VOLUME_MOUNT_PATH": workdir,
+                "WEB_CONCURRENCY": str(args.workers),
+                "GUNICORN_WORKER_CLASS": args.worker_class,
+                "GUNICORN_THREADS": str(args.threads),
+                "GUNICORN_WORKER_CONNECTIONS": str(args.connections),
+                "LOG_LEVEL": "WARNING",
+            }
+            env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            log_path = os.path.join(workdir, "gunicorn.log")
+            server = start_gunicorn(args.port, env, log_path)
+            try:
+                report = run_load(
+                    f"http://127.0.0.1:{args.port}", args.users, args.duration, args.mix,
+                    capacity=args.workers * per_worker, ramp=args.ramp
+                )
+            finally:
+                server.terminate()
+                server.wait(30)
+                anthropic.close()
+                perplexity.close()
+        report["upstream"] = {
+            "anthropic": {"requests": anthropic.requests, "injected_errors": anthropic.errors},
+            "perplexity": {"requests": perplexity.requests, "injected_errors": perplexity.errors}
+        }
+        report["config"] = {
+            key: value for key, value in vars(args).items() if key not in ("json_path", "url")
+        }
+
+    print(format_report(report))
+    if "upstream" in report:
+        upstream = report["upstream"]
+        print(
+            f"upstream: anthropic {upstream['anthropic']['requests']} calls "
+            f"({upstream['anthropic']['injected_errors']} failed), "
+            f"perplexity {upstream['perplexity']['requests']} calls "
+            f"({upstream['perplexity']['injected_errors']} failed)"
+        )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
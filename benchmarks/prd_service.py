@@ -0,0 +1,413 @@
+"""
+Micro-benchmarks for PRDService over large output directories.
+
+    python -m benchmarks.prd_service --sizes 10000,100000 --check
+
+For each size this synthesizes an output directory of that many PRD and
+research files, named and sized like real ones (several PRD versions and
+competitive analyses per product, mtimes spread over two years, a few
+percent already archived), then times every PRDService operation against
+it. Operations that change the directory are undone outside the timed
+region so each round sees the same tree.
+
+Timings are medians over several rounds. --check compares them with the
+stored baseline and exits 1 when an operation got slower than the
+threshold allows; --update-baseline records the current run instead.
+Baselines are scaled by a short CPU calibration loop so they transfer
+roughly between machines, but compare on the same machine class where
+you can.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from services.prd_service import PRDService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "prd_service_baseline.json")
+DEFAULT_SIZES = (10_000, 100_000)
+# Timings below this many seconds are dominated by noise
+NOISE_FLOOR = 0.002
+
+ADJECTIVES = (
+    "quick", "smart", "open", "bright", "clear", "swift", "true", "green", "solid", "calm",
+    "bold", "lean", "prime", "happy", "urban", "local", "pocket", "team", "cloud", "daily",
+)
+NOUNS = (
+    "task", "budget", "booking", "habit", "kanban", "invoice", "recipe", "fitness", "rental", "travel",
+    "garden", "tutor", "pantry", "closet", "parking", "crew", "shift", "clinic", "studio", "market",
+)
+SUFFIXES = ("app", "hub", "flow", "board", "tracker", "planner", "assistant", "manager")
+
+VOCABULARY = (
+    "users teams onboarding pricing subscription dashboard analytics mobile offline sync "
+    "notifications calendar payments invoices reports export integration privacy security "
+    "performance retention churn activation feedback roadmap milestone stakeholder workflow "
+    "automation template search filter permissions collaboration comments mentions reminders "
+    "scheduling booking inventory checkout accessibility localization compliance audit billing "
+    "competitors market segment persona journey problem metric goal requirement risk launch"
+).split()
+PRD_SECTIONS = (
+    "Overview", "Problem Statement", "Target Users", "Goals and Success Metrics",
+    "Functional Requirements", "Non-Functional Requirements", "User Stories", "Risks", "Timeline",
+)
+RESEARCH_SECTIONS = (
+    "1. Key Competitors", "2. Market Positioning", "3. Pricing Landscape",
+    "4. Feature Gaps", "5. Opportunities",
+)
+
+
+def _paragraphs(rng: random.Random, count: int = 400) -> list[str]:
+    """Pool of paragraphs to build documents from (drawing words per file is too slow)."""
+    pool = []
+    for _ in range(count):
+        sentences = [
+            " ".join(rng.choices(VOCABULARY, k=rng.randint(8, 18))).capitalize() + "."
+            for _ in range(rng.randint(3, 6))
+        ]
+        pool.append(" ".join(sentences))
+    return pool
+
+
+def _document(rng: random.Random, pool: list[str], title: str, sections: tuple, size: int) -> str:
+    parts = [f"# {title}\n\n"]
+    length = len(parts[0])
+    for section in sections:
+        parts.append(f"## {section}\n\n")
+        for paragraph in rng.sample(pool, 2):
+            parts.append(paragraph + "\n\n")
+            length += len(paragraph) + 2
+    while length < size:
+        paragraph = rng.choice(pool)
+        parts.append(f"- {paragraph}\n")
+        length += len(paragraph) + 3
+    return "".join(parts)
+
+
+def product_names(count: int) -> list[tuple[str, str]]:
+    """(display name, filename prefix) pairs, unique for any count."""
+    names = []
+    combos = [(a, n, s) for s in SUFFIXES for a in ADJECTIVES for n in NOUNS]
+    for i in range(count):
+        adjective, noun, suffix = combos[i % len(combos)]
+        name = f"{adjective.title()} {noun.title()} {suffix.title()}"
+        if i >= len(combos):
+            name += f" {i // len(combos) + 1}"
+        names.append((name, name.lower().replace(" ", "-")))
+    return names
+
+
+def synthesize(directory: str, files: int, seed: int = 0, archived: float = 0.02, segments: int = 12) -> dict:
+    """
+    Fill directory with `files` PRD and research files.
+
+    Each product gets one to three PRD versions and up to two competitive
+    analyses. PRDs are around 8KB and research around 5KB, and mtimes
+    follow the timestamps in the filenames. A fraction of the PRDs (with
+    their research) are then archived, most of them packed into `segments`
+    segments, as several periodic packs would leave them.
+
+    Returns:
+        Dict of filename samples used by the benchmarks
+    """
+    rng = random.Random(seed)
+    pool = _paragraphs(rng)
+    now = datetime(2026, 1, 1)
+    prds = []
+    written = 0
+    for name, prefix in product_names(files):
+        if written >= files:
+            break
+        created = now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400))
+        kinds = ["prd"] * rng.randint(1, 3) + ["research"] * rng.choice((0, 1, 1, 2))
+        for kind in kinds[:files - written]:
+            created += timedelta(minutes=rng.randint(5, 600))
+            stamp = created.strftime("%Y%m%d-%H%M%S")
+            if kind == "prd":
+                filename = f"{prefix}-prd-{stamp}.md"
+                content = _document(rng, pool, f"{name} - Product Requirements Document",
+                                    PRD_SECTIONS, int(rng.lognormvariate(9.0, 0.3)))
+                prds.append(filename)
+            else:
+                filename = f"{prefix}-competitive-analysis-{stamp}.md"
+                content = _document(rng, pool, f"{name} - Competitive Analysis",
+                                    RESEARCH_SECTIONS, int(rng.lognormvariate(8.5, 0.3)))
+            path = os.path.join(directory, filename)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.utime(path, (created.timestamp(), created.timestamp()))
+            written += 1
+
+    service = PRDService()
+    service.output_dir = directory
+    rng.shuffle(prds)
+    to_archive = prds[:int(len(prds) * archived)]
+    # Most of the archive is packed; the rest stays loose, as between packs
+    packed, loose = to_archive[:len(to_archive) * 3 // 4], to_archive[len(to_archive) * 3 // 4:]
+    for i in range(segments):
+        batch = packed[i * len(packed) // segments:(i + 1) * len(packed) // segments]
+        if batch:
+            service.archive_batch(batch)
+            service.pack_archive()
+    service.archive_batch(loose)
+    return {"active": prds[len(to_archive):], "packed": packed, "loose": loose}
+
+
+class Case:
+    """One timed operation; setup and teardown run outside the timing."""
+
+    def __init__(self, name: str, run, setup=None, teardown=None, rounds: int = None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.teardown = teardown
+        self.rounds = rounds
+
+
+def measure(case: Case, rounds: int) -> dict:
+    """Time a case over several rounds; summary in seconds."""
+    timings = []
+    for i in range(case.rounds or rounds):
+        arg = case.setup(i) if case.setup else i
+        started = time.perf_counter()
+        result = case.run(arg)
+        timings.append(time.perf_counter() - started)
+        if case.teardown:
+            case.teardown(arg, result)
+    return {"median": statistics.median(timings), "min": min(timings), "rounds": len(timings)}
+
+
+def cases(service: PRDService, samples: dict, seed: int = 0) -> list[Case]:
+    """Every PRDService operation, with setup/teardown keeping the tree stable."""
+    rng = random.Random(seed + 1)
+    active = list(samples["active"])
+    rng.shuffle(active)
+    picks = iter(active)
+    reads = active[:50]
+    pool = _paragraphs(rng, 20)
+    document = _document(rng, pool, "Bench Planner - Product Requirements Document", PRD_SECTIONS, 8000)
+    research = _document(rng, pool, "Bench Planner - Competitive Analysis", RESEARCH_SECTIONS, 5000)
+    product = service._get_product_prefix(active[0])
+
+    def restore(filenames):
+        for filename in filenames:
+            service.restore_prd(filename)
+
+    def archived_result(_, result):
+        restore(result["archived"])
+
+    def deep_cursor(_):
+        half = len(service.list_prds_page(fields=["filename"])["prds"]) // 2
+        return service.list_prds_page(limit=max(half, 1), fields=["filename"])["next_cursor"]
+
+    def touch_outside(i):
+        # A file written by another process: the next listing must resync
+        filename = f"outside-{i}-prd-20260101-000000.md"
+        with open(os.path.join(service.output_dir, filename), "w", encoding="utf-8") as f:
+            f.write(document)
+        return filename
+
+    def append_target(i):
+        filename = reads[i % len(reads)]
+        return filename, os.stat(os.path.join(service.output_dir, filename))
+
+    def truncate_appended(target, _):
+        # Drop the addendum and restore the mtime, which orders the listing
+        filename, stat = target
+        path = os.path.join(service.output_dir, filename)
+        os.truncate(path, stat.st_size)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        service._index_upsert(filename)
+
+    def drop_index(_):
+        shutil.rmtree(service._index_dir(), ignore_errors=True)
+        service._index = None
+
+    def archive_one(_):
+        return service.archive_prd_with_research(next(picks))["archived"]
+
+    def remove_saved(_, filename):
+        os.remove(os.path.join(service.output_dir, filename))
+        service._index_remove(filename)
+
+    return [
+        Case("index_cold_sync", lambda _: service.listing_version(), setup=drop_index, rounds=1),
+        Case("rebuild_index", lambda _: service.rebuild_index(), rounds=1),
+        Case("list_prds", lambda _: service.list_prds()),
+        Case("list_prds_page", lambda _: service.list_prds_page(limit=50)),
+        Case("list_prds_page_deep", lambda cursor: service.list_prds_page(limit=50, cursor=cursor),
+             setup=deep_cursor),
+        Case("list_prds_page_resync", lambda _: service.list_prds_page(limit=50), setup=touch_outside,
+             teardown=lambda filename, _: remove_saved(None, filename)),
+        Case("listing_version", lambda _: service.listing_version()),
+        Case("search", lambda i: service.search(("pricing onboarding", "offline sync", "churn")[i % 3])),
+        Case("get_prd", lambda i: service.get_prd(reads[i % len(reads)])),
+        Case("get_prd_loose_archive", lambda i: service.get_prd(samples["loose"][i % len(samples["loose"])])),
+        Case("get_prd_packed_archive", lambda i: service.get_prd(samples["packed"][i % len(samples["packed"])])),
+        Case("get_prd_missing", lambda i: service.get_prd(f"missing-{i}-prd-20260101-000000.md")),
+        Case("extract_product_context", lambda _: service.extract_product_context(document)),
+        Case("save_prd", lambda i: service.save_prd(document, f"Bench Planner {i}"), teardown=remove_saved),
+        Case("save_research", lambda i: service.save_research(research, f"Bench Planner {i}"),
+             teardown=remove_saved),
+        Case("append_to_prd", lambda target: service.append_to_prd(target[0], "## Addendum\n\nMore."),
+             setup=append_target, teardown=truncate_appended),
+        Case("archive_prd_with_research", lambda _: service.archive_prd_with_research(next(picks)),
+             teardown=archived_result),
+        Case("archive_batch", lambda _: service.archive_batch([next(picks) for _ in range(25)]),
+             teardown=lambda _, result: restore(
+                 [f for r in result["results"] for f in r["archived"]]
+             )),
+        Case("restore_prd", lambda archived: service.restore_prd(archived[0]), setup=archive_one,
+             teardown=lambda archived, _: restore(archived[1:])),
+        Case("export_rows", lambda _: service.export_rows(products=[product])),
+        Case("export_zip", lambda _: sum(map(len, service.export_zip(service.export_rows(products=[product]))))),
+        Case("archive_stats", lambda _: service.archive_stats()),
+    ]
+
+
+def calibrate(rounds: int = 5) -> float:
+    """Seconds for a fixed CPU workload, to scale baselines between machines."""
+    data = b"prdy" * 250_000
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        rng = random.Random(0)
+        sorted(str(rng.random()) for _ in range(100_000))
+        for _ in range(20):
+            hashlib.sha256(data).digest()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run_suite(files: int, rounds: int = 5, workdir: str = None, seed: int = 0, progress=None) -> dict:
+    """Synthesize a directory of `files` files and benchmark every operation on it."""
+    directory = tempfile.mkdtemp(prefix=f"prdy-bench-{files}-", dir=workdir)
+    try:
+        started = time.perf_counter()
+        samples = synthesize(directory, files, seed)
+        if progress:
+            progress(f"{files} files synthesized in {time.perf_counter() - started:.1f}s")
+        service = PRDService()
+        service.output_dir = directory
+        results = {}
+        for case in cases(service, samples, seed):
+            results[case.name] = measure(case, rounds)
+            if progress:
+                progress(f"  {case.name:<28} {format_seconds(results[case.name]['median'])}")
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.5) -> list[dict]:
+    """
+    Compare a run with the baseline, size by size and operation by operation.
+
+    Baseline medians are scaled by the ratio of calibration times. An
+    operation regressed when it is more than `threshold` (a fraction)
+    slower than that and the difference is above the noise floor.
+    Operations or sizes missing from the baseline are reported as new.
+    """
+    scale = current["calibration"] / baseline["calibration"] if baseline.get("calibration") else 1.0
+    rows = []
+    for size, results in current["results"].items():
+        for name, result in results.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            row = {"size": size, "operation": name, "current": result["median"], "baseline": None,
+                   "ratio": None, "status": "new"}
+            if before is not None:
+                expected = before["median"] * scale
+                row.update(baseline=expected, ratio=result["median"] / expected if expected else None)
+                regressed = (
+                    result["median"] > expected * (1 + threshold)
+                    and result["median"] - expected > NOISE_FLOOR
+                )
+                row["status"] = "REGRESSED" if regressed else "ok"
+            rows.append(row)
+    return rows
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.0f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def format_comparison(rows: list[dict]) -> str:
+    lines = [f"{'files':>7} {'operation':<28} {'baseline':>10} {'current':>10} {'ratio':>6}  status"]
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}" if row["ratio"] is not None else "-"
+        lines.append(
+            f"{row['size']:>7} {row['operation']:<28} {format_seconds(row['baseline']):>10} "
+            f"{format_seconds(row['current']):>10} {ratio:>6}  {row['status']}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated file counts")
+    parser.add_argument("--rounds", type=int, default=5, help="timed rounds per operation")
+    parser.add_argument("--workdir", help="where to synthesize directories (default: system temp)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any operation regressed")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--json", dest="json_path", help="also write the results here")
+    args = parser.parse_args(argv)
+
+    current = {"calibration": calibrate(), "results": {}}
+    for size in (int(s) for s in args.sizes.split(",")):
+        current["results"][str(size)] = run_suite(size, args.rounds, args.workdir, progress=print)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    rows = compare(current, baseline, args.threshold)
+    print(format_comparison(rows))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.update_baseline:
+        # Keep baseline sizes this run didn't cover
+        merged = {"calibration": current["calibration"],
+                  "results": {**baseline.get("results", {}), **current["results"]}}
+        if baseline.get("calibration"):
+            scale = current["calibration"] / baseline["calibration"]
+            for size, results in baseline.get("results", {}).items():
+                if size not in current["results"]:
+                    merged["results"][size] = {
+                        name: {**result, "median": result["median"] * scale, "min": result["min"] * scale}
+                        for name, result in results.items()
+                    }
+        with open(args.baseline, "w") as f:
+            json.dump(merged, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    regressed = [row for row in rows if row["status"] == "REGRESSED"]
+    if regressed:
+        print(f"{len(regressed)} operation(s) regressed by more than {args.threshold:.0%}")
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
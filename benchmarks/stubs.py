@@ -0,0 +1,213 @@
+"""
+Local stand-ins for the Anthropic Messages API and Perplexity chat completions.
+
+Each stub answers like the real API after a configurable delay: `latency`
+seconds before the first token, then `token_rate` tokens per second.
+`error_rate` of requests instead get a retryable error status. Responses
+are shaped by what the app asked for, so extraction gets JSON and PRD
+generation gets a sectioned markdown document.
+"""
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prompts.system_prompts import PRD_GENERATION_PROMPT
+
+
+class StubBehavior:
+    """Latency, throughput and failure settings for a stub server."""
+
+    def __init__(self, latency: float = 1.0, token_rate: float = 100.0, error_rate: float = 0.0,
+                 output_tokens: int = 150, prd_tokens: int = 1200):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.output_tokens = output_tokens
+        self.prd_tokens = prd_tokens
+
+    def generation_time(self, tokens: int) -> float:
+        return tokens / self.token_rate if self.token_rate > 0 else 0.0
+
+
+def _words(count: int, seed: int = 0) -> list[str]:
+    vocabulary = (
+        "users need a simple way to plan track and share work across teams while "
+        "keeping costs predictable and onboarding fast for small businesses"
+    ).split()
+    return [vocabulary[(seed + i) % len(vocabulary)] for i in range(count)]
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+
+class _StubServer(ABC):
+    """Threaded HTTP server; subclasses answer POSTs in respond()."""
+
+    error_statuses = (429, 500, 503)
+
+    def __init__(self, behavior: StubBehavior = None, port: int = 0):
+        self.behavior = behavior or StubBehavior()
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub._handle(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _HTTPServer(("127.0.0.1", port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _handle(self, handler: BaseHTTPRequestHandler, body: dict) -> None:
+        with self._lock:
+            self.requests += 1
+            failed = random.random() < self.behavior.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            time.sleep(self.behavior.latency / 10)
+            status = random.choice(self.error_statuses)
+            self._send_json(handler, status, self.error_body(status))
+            return
+        self.respond(handler, body)
+
+    @abstractmethod
+    def respond(self, handler: BaseHTTPRequestHandler, body: dict) -> None:
+        ...
+
+    def error_body(self, status: int) -> dict:
+        return {"error": {"message": f"Stub error {status}"}}
+
+    @staticmethod
+    def _send_json(handler: BaseHTTPRequestHandler, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+class StubAnthropic(_StubServer):
+    """Messages API stand-in (POST /v1/messages), streaming or not."""
+
+    error_statuses = (429, 500, 529)
+
+    def error_body(self, status: int) -> dict:
+        kind = {429: "rate_limit_error", 529: "overloaded_error"}.get(status, "api_error")
+        return {"type": "error", "error": {"type": kind, "message": f"Stub error {status}"}}
+
+    def _reply(self, body: dict) -> list[str]:
+        """The reply as a list of text chunks, one per token."""
+        last = body["messages"][-1]["content"]
+        if isinstance(last, list):
+            last = " ".join(block.get("text", "") for block in last)
+        if "Return ONLY the JSON object" in last:
+            return [json.dumps({
+                "product_name": "StubApp",
+                "product_description": "A project planning tool for small teams.",
+                "search_category": "project management software teams",
+                "confidence": "high"
+            })]
+        if last.startswith(PRD_GENERATION_PROMPT):
+            count = min(self.behavior.prd_tokens, body.get("max_tokens", 8192))
+            sections = ["# StubApp - Product Requirements Document\n"]
+            per_section = max(count // 5, 1)
+            for i, title in enumerate(("Overview", "Goals", "Requirements", "Metrics", "Risks")):
+                sections.append(f"\n## {title}\n")
+                sections.extend(f"{word} " for word in _words(per_section, i))
+            return sections
+        count = min(self.behavior.output_tokens, body.get("max_tokens", 2048))
+        return [f"{word} " for word in _words(count)]
+
+    def respond(self, handler: BaseHTTPRequestHandler, body: dict) -> None:
+        chunks = self._reply(body)
+        usage = {"input_tokens": sum(len(json.dumps(m)) for m in body["messages"]) // 4,
+                 "output_tokens": len(chunks)}
+        time.sleep(self.behavior.latency)
+        if body.get("stream"):
+            self._stream(handler, body, chunks, usage)
+            return
+        time.sleep(self.behavior.generation_time(len(chunks)))
+        self._send_json(handler, 200, {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [{"type": "text", "text": "".join(chunks)}],
+            "stop_reason": "end_turn", "stop_sequence": None, "usage": usage
+        })
+
+    def _stream(self, handler: BaseHTTPRequestHandler, body: dict, chunks: list[str], usage: dict) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def event(name: str, data: dict) -> None:
+            handler.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+            handler.wfile.flush()
+
+        event("message_start", {"type": "message_start", "message": {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": usage["input_tokens"], "output_tokens": 1}
+        }})
+        event("content_block_start", {
+            "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+        })
+        delay = self.behavior.generation_time(1)
+        for chunk in chunks:
+            time.sleep(delay)
+            event("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}
+            })
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {
+            "type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": usage["output_tokens"]}
+        })
+        event("message_stop", {"type": "message_stop"})
+
+
+class StubPerplexity(_StubServer):
+    """Chat completions stand-in (POST /chat/completions)."""
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def respond(self, handler: BaseHTTPRequestHandler, body: dict) -> None:
+        count = min(self.behavior.output_tokens, body.get("max_tokens", 4096))
+        time.sleep(self.behavior.latency + self.behavior.generation_time(count))
+        content = "## 1. Key Competitors\n- **[Trello](https://trello.com)** $5/user\n\n" + " ".join(_words(count))
+        self._send_json(handler, 200, {
+            "id": "stub", "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 200, "completion_tokens": count}
+        })
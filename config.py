@@ -13,6 +13,29 @@ IS_PRODUCTION = RAILWAY_ENVIRONMENT is not None
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
 
+# Perplexity chat completions endpoint (overridable to point at a stub server)
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+
+# Perplexity HTTP client: retries on 429/5xx and connection pool size per worker
+PERPLEXITY_MAX_RETRIES = int(os.getenv("PERPLEXITY_MAX_RETRIES", 3))
+# Seconds one Perplexity call may take across all its attempts and waits
+PERPLEXITY_DEADLINE = float(os.getenv("PERPLEXITY_DEADLINE", 120))
+PERPLEXITY_POOL_SIZE = int(os.getenv("PERPLEXITY_POOL_SIZE", 10))
+
+# Research each report section as its own concurrent Perplexity query by default
+RESEARCH_PARALLEL = os.getenv("RESEARCH_PARALLEL", "false").lower() == "true"
+
+# Logs go to stderr as JSON lines ("json") or plain text ("text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# Request tracing: export finished spans to a JSON-lines file ("file") or an
+# OTLP/HTTP collector ("otlp"); unset exports nothing
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "prdy")
+
 # Session secret - require explicit key in production, generate random for dev
 if IS_PRODUCTION:
     SECRET_KEY = os.getenv("SECRET_KEY")
@@ -21,9 +44,38 @@ if IS_PRODUCTION:
 else:
     SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_hex(32))
 
-# Redis configuration (for session storage in production)
+# Conversation compaction: once history is estimated above this many tokens,
+# older turns are summarized while the most recent messages are kept verbatim
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 40000))
+CONTEXT_KEEP_RECENT = int(os.getenv("CONTEXT_KEEP_RECENT", 6))
+
+# Memoized product context extraction: entries kept per process and, when
+# Redis is configured, seconds a shared entry lives
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", 512))
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", 60 * 60 * 24))
+
+# Identical concurrent extraction and research calls share one upstream
+# call. With Redis configured this spans workers: seconds a worker may hold
+# a call before the others stop waiting for it, and how often they check
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 300))
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 0.1))
+
+# Background jobs: worker threads per process and how long finished results are kept
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 60 * 60))
+# Seconds a job may stay queued or running before it is reported as failed
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", 30 * 60))
+
+# Redis configuration (for session and conversation storage in production)
 REDIS_URL = os.getenv("REDIS_URL")
 
+# Seconds of inactivity before a stored conversation expires
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", 60 * 60 * 24))
+
+# Bounds for the in-process conversation store (used when Redis is not configured)
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", 1000))
+CONVERSATION_MAX_BYTES = int(os.getenv("CONVERSATION_MAX_BYTES", 64 * 1024 * 1024))
+
 # Output directory - use Railway volume if available, otherwise local
 RAILWAY_VOLUME = os.getenv("RAILWAY_VOLUME_MOUNT_PATH")
 if RAILWAY_VOLUME:
@@ -33,3 +85,23 @@ else:
 
 # Ensure output directory exists
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+# Where saved PRDs live: "filesystem" (OUTPUT_DIR), "sqlite" (one database
+# file) or "s3" (any S3-compatible bucket, so several instances can share it).
+# S3 credentials come from the standard AWS_* environment variables.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "filesystem")
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", os.path.join(OUTPUT_DIR, "prds.sqlite3"))
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "prds/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+# Cache directory - also on the Railway volume so caches survive deploys
+if RAILWAY_VOLUME:
+    CACHE_DIR = os.path.join(RAILWAY_VOLUME, "cache")
+else:
+    CACHE_DIR = os.path.join(os.path.dirname(__file__), ".cache")
+
+# Competitor research cache (Perplexity results)
+RESEARCH_CACHE_DIR = os.path.join(CACHE_DIR, "research")
+RESEARCH_CACHE_TTL = int(os.getenv("RESEARCH_CACHE_TTL", 60 * 60 * 24))
+RESEARCH_CACHE_MAX_ENTRIES = int(os.getenv("RESEARCH_CACHE_MAX_ENTRIES", 500))
@@ -0,0 +1,67 @@
+"""
+Gunicorn settings (gunicorn -c gunicorn.conf.py app:app).
+
+Requests spend almost all their time waiting on Claude or Perplexity, so
+each worker runs many threads: a waiting request holds a thread, not a
+process. GUNICORN_WORKER_CLASS=gevent serves requests on greenlets
+instead (GUNICORN_WORKER_CONNECTIONS per process); it benchmarked the
+same and monkey-patches the standard library. See "Deployment" in the
+README for the numbers behind these defaults.
+
+Workers write their Prometheus metrics to PROMETHEUS_MULTIPROC_DIR so
+/metrics reports all of them. Unless it is set, a fresh temporary
+directory is created and removed again at shutdown. A directory set by
+the operator is left alone: clearing it between runs is up to them.
+"""
+import glob
+import os
+import tempfile
+
+# Set before any worker imports prometheus_client
+metrics_dir = None
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    metrics_dir = tempfile.mkdtemp(prefix="prdy-metrics-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+# gthread: concurrent requests per worker
+threads = int(os.getenv("GUNICORN_THREADS", 128))
+# gevent: concurrent requests per worker
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 500))
+
+# Only a worker that stops responding to the arbiter is killed; a long
+# generation on one of its threads or greenlets doesn't count as that
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+def _remove_metric_files():
+    """Delete the metric files in the directory this config created."""
+    if metrics_dir is None:
+        return
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+
+
+def on_starting(server):
+    # Values left over from an earlier run would be added to this one's
+    _remove_metric_files()
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_exit(server):
+    _remove_metric_files()
+    if metrics_dir is not None:
+        try:
+            os.rmdir(metrics_dir)
+        except OSError:
+            pass
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
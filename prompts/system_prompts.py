@@ -106,3 +106,15 @@ Use this structure:
 *Generated with PRDy - AI-Powered PRD Assistant*
 
 Fill in each section based on what we discussed. For sections where we didn't gather specific information, write "[To be defined]" rather than making assumptions. If web research was provided during the conversation, incorporate those competitive insights into the Competitive Analysis section. Be comprehensive but concise."""
+
+LOAD_PRD_PREFIX = "I have an existing PRD that I'd like to iterate on and improve. Here it is:\n\n"
+
+CONVERSATION_SUMMARY_PROMPT = """You are condensing the earlier part of a product discovery conversation between a user and PRDy, a PRD assistant, so the conversation can continue within a limited context window.
+
+Write a dense summary in Markdown that preserves everything needed to later write a complete PRD:
+- The product, its purpose, target users and the problems it solves
+- Every decision, requirement, feature, constraint and success metric the user stated
+- Competitive research findings: named competitors, prices, features, gaps and recommendations
+- Open questions and anything the user explicitly rejected
+
+If a previous summary is provided, merge it with the new conversation into one updated summary. Prefer concrete facts, names and numbers over narrative. Do not invent details. Return only the summary."""
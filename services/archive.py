@@ -0,0 +1,214 @@
+"""Compressed storage for archived PRDs and research."""
+import gzip
+import json
+import struct
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+from services.storage import ARCHIVE_PREFIX, Storage
+
+# Loose archived files are stored as old/<filename>.gz
+GZIP_SUFFIX = ".gz"
+
+# Packed segments: old/segments/<id>.seg holds concatenated gzip members and
+# old/segments/<id>.json maps each filename to [offset, length, size]
+SEGMENT_PREFIX = f"{ARCHIVE_PREFIX}segments/"
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Gzip a stream of chunks incrementally (one gzip member)."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class PRDArchive:
+    """
+    Archived files, gzip-compressed in the PRD storage.
+
+    archive() compresses a file to old/<name>.gz while streaming it, and
+    pack() periodically bundles the loose .gz files into one segment plus a
+    JSON manifest of byte ranges, so an archive of thousands of files is a
+    handful of objects. read() and restore() find a file wherever it lives:
+    loose, packed, or an uncompressed file archived before compression
+    existed.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        # (segment listing, {filename: [(segment id, manifest entry)]})
+        self._segment_map = None
+
+    def archive(self, filename: str) -> bool:
+        """Compress a top-level file into the archive and remove the original."""
+        if not self.storage.exists(filename):
+            return False
+        self.storage.write_bytes(
+            f"{ARCHIVE_PREFIX}{filename}{GZIP_SUFFIX}",
+            gzip_chunks(self.storage.iter_chunks(filename))
+        )
+        self.storage.delete(filename)
+        return True
+
+    def _segment_listing(self) -> tuple:
+        """(name, size, mtime) of every manifest; changes whenever one is written."""
+        listing = []
+        for batch in self.storage.iter_entries(SEGMENT_PREFIX):
+            for entry in batch:
+                if not entry.name.endswith(".json"):
+                    continue
+                if entry.size is None or entry.mtime is None:
+                    # Listing without sizes (the filesystem): stat is cheap there
+                    entry = self.storage.stat(entry.name) or entry
+                listing.append((entry.name, entry.size, entry.mtime))
+        return tuple(sorted(listing))
+
+    def _manifests(self, listing: tuple = None) -> list[tuple[str, dict]]:
+        """(segment id, manifest) pairs, newest segment first."""
+        if listing is None:
+            listing = self._segment_listing()
+        manifests = []
+        for name, _, _ in reversed(listing):
+            data = self.storage.read_bytes(name)
+            if data is not None:
+                manifests.append((name[len(SEGMENT_PREFIX):-len(".json")], json.loads(data)))
+        return manifests
+
+    def _segment_index(self) -> tuple:
+        """
+        (manifest listing, {filename: [(segment id, [offset, length, size])]})
+        with each filename's segments newest first.
+
+        Manifests are read once and kept until the listing changes (a pack,
+        or a file removed from a segment, by any instance), so a lookup
+        costs one listing rather than reading every manifest.
+        """
+        listing = self._segment_listing()
+        cached = self._segment_map
+        if cached is None or cached[0] != listing:
+            located = {}
+            for segment_id, manifest in self._manifests(listing):
+                for name, entry in manifest.items():
+                    located.setdefault(name, []).append((segment_id, entry))
+            cached = self._segment_map = (listing, located)
+        return cached
+
+    def _segments_for(self, filename: str) -> list[tuple[str, list]]:
+        """(segment id, [offset, length, size]) for each segment holding filename."""
+        return self._segment_index()[1].get(filename, [])
+
+    def read(self, filename: str) -> bytes:
+        """Decompressed content of an archived file, or None if not archived."""
+        data = self.storage.read_bytes(f"{ARCHIVE_PREFIX}{filename}{GZIP_SUFFIX}")
+        if data is not None:
+            return gzip.decompress(data)
+        data = self.storage.read_bytes(f"{ARCHIVE_PREFIX}{filename}")
+        if data is not None:
+            return data
+        for segment_id, (offset, length, _) in self._segments_for(filename):
+            data = self.storage.read_range(f"{SEGMENT_PREFIX}{segment_id}.seg", offset, length)
+            if data is not None:
+                return gzip.decompress(data)
+        return None
+
+    def remove(self, filename: str) -> None:
+        """Drop a file from the archive (after it was restored)."""
+        self.storage.delete(f"{ARCHIVE_PREFIX}{filename}{GZIP_SUFFIX}")
+        self.storage.delete(f"{ARCHIVE_PREFIX}{filename}")
+        # Usually one segment; an interrupted pack can leave it in two
+        for segment_id, _ in self._segments_for(filename):
+            data = self.storage.read_bytes(f"{SEGMENT_PREFIX}{segment_id}.json")
+            if data is None:
+                continue
+            manifest = json.loads(data)
+            if manifest.pop(filename, None) is None:
+                continue
+            # Ours: don't rely on the listing's mtime resolution to notice it
+            self._segment_map = None
+            if manifest:
+                # The member's bytes stay in the segment until it is repacked
+                self.storage.write_bytes(
+                    f"{SEGMENT_PREFIX}{segment_id}.json", json.dumps(manifest).encode("utf-8")
+                )
+            else:
+                self.storage.delete(f"{SEGMENT_PREFIX}{segment_id}.json")
+                self.storage.delete(f"{SEGMENT_PREFIX}{segment_id}.seg")
+
+    def _loose(self) -> list[str]:
+        """Names of archived files not yet packed, .gz or legacy uncompressed."""
+        return sorted(self.storage.list_names(ARCHIVE_PREFIX))
+
+    def pack(self, min_files: int = 1) -> dict:
+        """
+        Bundle loose archived files into a new segment.
+
+        Legacy uncompressed files are compressed on the way in. The segment
+        and its manifest are written before the loose files are deleted, so
+        an interrupted pack leaves duplicates rather than losing data.
+
+        Returns:
+            Dict with the new 'segment' id (None if nothing was packed) and
+            the number of 'files' packed
+        """
+        loose = self._loose()
+        if not loose or len(loose) < min_files:
+            return {"segment": None, "files": 0}
+
+        segment_id = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        manifest = {}
+        offset = 0
+        with self.storage.open_writer() as writer:
+            for name in loose:
+                member = self.storage.read_bytes(name)
+                if member is None:
+                    continue
+                filename = name[len(ARCHIVE_PREFIX):]
+                if filename.endswith(GZIP_SUFFIX):
+                    filename = filename[:-len(GZIP_SUFFIX)]
+                    size = struct.unpack("<I", member[-4:])[0]
+                else:
+                    size = len(member)
+                    member = gzip.compress(member)
+                writer.write(member)
+                manifest[filename] = [offset, len(member), size]
+                offset += len(member)
+            writer.commit(f"{SEGMENT_PREFIX}{segment_id}.seg")
+        self.storage.write_bytes(
+            f"{SEGMENT_PREFIX}{segment_id}.json", json.dumps(manifest).encode("utf-8")
+        )
+        for name in loose:
+            self.storage.delete(name)
+        self._segment_map = None
+        return {"segment": segment_id, "files": len(manifest)}
+
+    def stats(self) -> dict:
+        """Archived file count and bytes before and after compression."""
+        files = original = stored = 0
+        for name in self._loose():
+            entry = self.storage.stat(name)
+            if entry is None:
+                continue
+            files += 1
+            stored += entry.size
+            if name.endswith(GZIP_SUFFIX):
+                # ISIZE: the uncompressed size (mod 2**32) ends every gzip member
+                original += struct.unpack("<I", self.storage.read_range(name, entry.size - 4, 4))[0]
+            else:
+                original += entry.size
+        listing, located = self._segment_index()
+        for segments in located.values():
+            for _, (_, length, size) in segments:
+                files += 1
+                stored += length
+                original += size
+        return {
+            "files": files,
+            "segments": len(listing),
+            "original_bytes": original,
+            "stored_bytes": stored,
+            "saved_bytes": original - stored,
+            "ratio": round(stored / original, 3) if original else None
+        }
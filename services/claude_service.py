@@ -1,8 +1,25 @@
+import asyncio
+import hashlib
 import json
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator
+from contextvars import ContextVar
 import anthropic
-from config import ANTHROPIC_API_KEY
-from prompts.system_prompts import PRD_ASSISTANT_PROMPT, PRD_GENERATION_PROMPT
+from config import ANTHROPIC_API_KEY, CONTEXT_KEEP_RECENT, CONTEXT_TOKEN_BUDGET
+from services import metrics, tracing
+from services.memo_cache import MemoCache
+from services.single_flight import SingleFlight
+from prompts.system_prompts import (
+    CONVERSATION_SUMMARY_PROMPT,
+    LOAD_PRD_PREFIX,
+    PRD_ASSISTANT_PROMPT,
+    PRD_GENERATION_PROMPT,
+)
 
+logger = logging.getLogger(__name__)
 
 PRODUCT_EXTRACTION_PROMPT = """Analyze the following content and extract the product information being discussed.
 
@@ -17,6 +34,28 @@ If there's not enough information to determine the product, return:
 
 Return ONLY the JSON object, no other text."""
 
+# Marks the end of a reusable prompt prefix for Anthropic prompt caching
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# A seed message this long (roughly 1k+ tokens, e.g. a loaded PRD) gets its
+# own cache breakpoint so it stays cached however long the chat grows
+LARGE_SEED_CHARS = 4000
+
+# Rough characters-per-token ratio used to estimate conversation size
+CHARS_PER_TOKEN = 4
+
+# How many conversation summaries each process keeps
+SUMMARY_CACHE_SIZE = 256
+
+
+def _propagate_trace(request) -> None:
+    """httpx request hook tagging each API call with the request ID and span."""
+    request.headers.update(tracing.outgoing_headers())
+
+
+async def _apropagate_trace(request) -> None:
+    _propagate_trace(request)
+
 
 class APIError(Exception):
     """Custom exception for API errors with user-friendly messages."""
@@ -24,9 +63,100 @@ class APIError(Exception):
 
 
 class ClaudeService:
-    def __init__(self):
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    def __init__(self, redis_client=None):
+        self.client = anthropic.Anthropic(
+            api_key=ANTHROPIC_API_KEY,
+            http_client=anthropic.DefaultHttpxClient(event_hooks={"request": [_propagate_trace]})
+        )
+        # One async client per event loop; a client can't be shared across loops
+        self._async_clients = weakref.WeakKeyDictionary()
         self.model = "claude-sonnet-4-20250514"
+        # Token usage of the latest call, per request thread or asyncio task
+        self._usage = ContextVar(f"claude_usage_{id(self)}", default=None)
+        self.context_token_budget = CONTEXT_TOKEN_BUDGET
+        self.context_keep_recent = CONTEXT_KEEP_RECENT
+        # Digest of a summarized history prefix -> its summary
+        self._summaries = OrderedDict()
+        self._summaries_lock = threading.Lock()
+        # Extraction results keyed on a hash of the condensed input
+        self.context_cache = MemoCache(redis_client, prefix="prdy:context:")
+        # Concurrent extractions of the same input share one call
+        self.flights = SingleFlight(redis_client, prefix="prdy:flight:context:")
+
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        """
+        This event loop's async client, for the a* counterparts of each call.
+
+        Its connections belong to the loop: await aclose() before the loop
+        ends to close them.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = anthropic.AsyncAnthropic(
+                api_key=ANTHROPIC_API_KEY,
+                http_client=anthropic.DefaultAsyncHttpxClient(event_hooks={"request": [_apropagate_trace]})
+            )
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close this event loop's async client, if it made one."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    @property
+    def last_usage(self) -> dict:
+        """Token usage (including prompt cache reads/writes) of this thread's or task's last call."""
+        return self._usage.get()
+
+    def _record_usage(self, operation: str, usage) -> None:
+        """Remember and log the token usage reported for a call."""
+        recorded = {
+            "operation": operation,
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0
+        }
+        self._usage.set(recorded)
+        metrics.record_tokens(operation, recorded)
+        logger.info("Claude usage", extra=recorded)
+
+    def _cached_system(self, system: str) -> list[dict]:
+        """Wrap a system prompt as a content block with a cache breakpoint."""
+        return [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+
+    def _with_cache_breakpoints(self, messages: list[dict]) -> list[dict]:
+        """
+        Return a copy of messages with cache breakpoints on the stable prefix.
+
+        The last message is always marked, so the next turn (which resends
+        this exact prefix) reads it from the prompt cache. A large first
+        message, such as a PRD seeded by /api/load-prd, is marked as well.
+        Together with the system prompt this stays within the API's limit
+        of four breakpoints per request.
+        """
+        if not messages:
+            return messages
+        marked = list(messages)
+        marked[-1] = self._mark_for_cache(marked[-1])
+        first = marked[0]
+        if len(marked) > 1 and isinstance(first["content"], str) and len(first["content"]) >= LARGE_SEED_CHARS:
+            marked[0] = self._mark_for_cache(first)
+        return marked
+
+    def _mark_for_cache(self, message: dict) -> dict:
+        """Copy a message with a cache breakpoint on its last content block."""
+        content = message["content"]
+        if isinstance(content, str):
+            blocks = [{"type": "text", "text": content}]
+        else:
+            blocks = [dict(block) for block in content]
+        blocks[-1]["cache_control"] = CACHE_CONTROL
+        return {**message, "content": blocks}
 
     def _handle_api_error(self, e: Exception) -> None:
         """Convert API errors to user-friendly messages."""
@@ -52,45 +182,263 @@ class ClaudeService:
         else:
             raise APIError(f"API error: {error_message}")
 
-    def chat(self, messages: list[dict]) -> str:
-        """Send a message and get a response, maintaining conversation history."""
+    def _estimate_tokens(self, messages: list[dict]) -> int:
+        """Cheap token estimate for a message list."""
+        chars = 0
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                chars += len(content)
+            else:
+                chars += sum(len(block.get("text", "")) for block in content)
+        return chars // CHARS_PER_TOKEN
+
+    def compact_messages(self, messages: list[dict]) -> list[dict]:
+        """
+        Keep the history sent to Claude within the context token budget.
+
+        Past the budget, older turns are replaced by a summary exchange while
+        the latest turns and any PRD loaded via /api/load-prd stay verbatim.
+        Summaries are cached by the exact prefix they cover and reused while
+        the conversation fits, so a new summary is only requested when the
+        history outgrows the budget again. The stored history is untouched.
+        """
+        if self._estimate_tokens(messages) <= self.context_token_budget:
+            return messages
+
+        pinned = messages[:2] if self._is_loaded_prd(messages) else []
+        body = messages[len(pinned):]
+
+        covered, summary = self._find_summary(body)
+        compacted = messages
+        if summary is not None:
+            compacted = pinned + self._summary_turns(summary) + body[covered:]
+            if self._estimate_tokens(compacted) <= self.context_token_budget:
+                return compacted
+
+        cut = self._summary_cut(body)
+        if cut <= covered:
+            # Everything old enough to fold in is already summarized
+            return compacted
+
         try:
+            summary = self._summarize(summary, body[covered:cut])
+        except anthropic.APIError as e:
+            # Sending the longer history beats failing the user's turn
+            logger.warning("Conversation compaction failed", extra={"error": str(e)})
+            return compacted
+
+        self._store_summary(body[:cut], summary)
+        return pinned + self._summary_turns(summary) + body[cut:]
+
+    def _is_loaded_prd(self, messages: list[dict]) -> bool:
+        """Whether the conversation was seeded with an existing PRD."""
+        first = messages[0]["content"] if messages else ""
+        return isinstance(first, str) and first.startswith(LOAD_PRD_PREFIX)
+
+    def _summary_cut(self, body: list[dict]) -> int:
+        """Index where verbatim history starts; always a user turn."""
+        cut = len(body) - self.context_keep_recent
+        while cut > 0 and body[cut]["role"] != "user":
+            cut -= 1
+        return max(cut, 0)
+
+    def _summary_turns(self, summary: str) -> list[dict]:
+        """Present a summary as a user/assistant exchange to keep roles alternating."""
+        return [
+            {
+                "role": "user",
+                "content": f"Here is a summary of our conversation so far:\n\n{summary}"
+            },
+            {
+                "role": "assistant",
+                "content": "Thanks, I have the full context from our earlier discussion. Let's continue."
+            }
+        ]
+
+    def _prefix_digests(self, messages: list[dict]) -> Iterator[tuple[int, str]]:
+        """Yield (length, digest) for every prefix of messages."""
+        digest = hashlib.sha256()
+        for i, message in enumerate(messages):
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            yield i + 1, digest.hexdigest()
+
+    def _find_summary(self, body: list[dict]) -> tuple[int, str]:
+        """Return the longest summarized prefix of body as (length, summary)."""
+        best = (0, None)
+        with self._summaries_lock:
+            for length, key in self._prefix_digests(body):
+                if key in self._summaries:
+                    self._summaries.move_to_end(key)
+                    best = (length, self._summaries[key])
+        return best
+
+    def _store_summary(self, prefix: list[dict], summary: str) -> None:
+        *_, (_, key) = self._prefix_digests(prefix)
+        with self._summaries_lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > SUMMARY_CACHE_SIZE:
+                self._summaries.popitem(last=False)
+
+    def _summarize(self, previous_summary: str, messages: list[dict]) -> str:
+        """Ask Claude to fold messages into the running summary."""
+        transcript = "\n\n".join(
+            f"{m['role'].upper()}: {m['content']}" for m in messages
+        )
+        content = f"{CONVERSATION_SUMMARY_PROMPT}\n\n"
+        if previous_summary:
+            content += f"Previous summary:\n{previous_summary}\n\n"
+        content += f"Conversation:\n{transcript}"
+
+        with metrics.track_upstream("claude", "compact"):
             response = self.client.messages.create(
                 model=self.model,
                 max_tokens=2048,
-                system=PRD_ASSISTANT_PROMPT,
-                messages=messages
+                messages=[{"role": "user", "content": content}]
             )
-            return response.content[0].text
-        except anthropic.APIError as e:
-            self._handle_api_error(e)
+        self._record_usage("compact", response.usage)
+        return response.content[0].text
 
-    def generate_prd(self, messages: list[dict]) -> str:
-        """Generate a final PRD document from the conversation."""
-        generation_messages = messages + [
+    def _chat_params(self, messages: list[dict]) -> dict:
+        return {
+            "model": self.model,
+            "max_tokens": 2048,
+            "system": self._cached_system(PRD_ASSISTANT_PROMPT),
+            "messages": self._with_cache_breakpoints(messages)
+        }
+
+    def _generation_params(self, messages: list[dict]) -> dict:
+        # The breakpoint sits before the generation prompt so the conversation
+        # prefix cached by earlier chat turns is reused
+        generation_messages = self._with_cache_breakpoints(messages) + [
             {
                 "role": "user",
                 "content": PRD_GENERATION_PROMPT
             }
         ]
+        return {
+            "model": self.model,
+            "max_tokens": 8192,
+            "system": self._cached_system(PRD_ASSISTANT_PROMPT),
+            "messages": generation_messages
+        }
 
+    def chat(self, messages: list[dict]) -> str:
+        """Send a message and get a response, maintaining conversation history."""
+        self._usage.set(None)
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=8192,
-                system=PRD_ASSISTANT_PROMPT,
-                messages=generation_messages
-            )
+            messages = self.compact_messages(messages)
+            with metrics.track_upstream("claude", "chat"):
+                response = self.client.messages.create(**self._chat_params(messages))
+            self._record_usage("chat", response.usage)
             return response.content[0].text
         except anthropic.APIError as e:
             self._handle_api_error(e)
 
+    def chat_stream(self, messages: list[dict]) -> Iterator[str]:
+        """Stream a chat response, yielding text deltas as they arrive."""
+        self._usage.set(None)
+        try:
+            messages = self.compact_messages(messages)
+            with metrics.track_upstream("claude", "chat"):
+                with self.client.messages.stream(**self._chat_params(messages)) as stream:
+                    for text in stream.text_stream:
+                        yield text
+                    self._record_usage("chat", stream.get_final_message().usage)
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
+    def generate_prd(self, messages: list[dict]) -> str:
+        """Generate a final PRD document from the conversation."""
+        messages = self.compact_messages(messages)
+        self._usage.set(None)
+        try:
+            with metrics.track_upstream("claude", "generate_prd"):
+                response = self.client.messages.create(**self._generation_params(messages))
+            self._record_usage("generate_prd", response.usage)
+            return response.content[0].text
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
+    def generate_prd_stream(self, messages: list[dict]) -> Iterator[str]:
+        """Stream a PRD document from the conversation as text deltas."""
+        messages = self.compact_messages(messages)
+        self._usage.set(None)
+        try:
+            with metrics.track_upstream("claude", "generate_prd"):
+                with self.client.messages.stream(**self._generation_params(messages)) as stream:
+                    for text in stream.text_stream:
+                        yield text
+                    self._record_usage("generate_prd", stream.get_final_message().usage)
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
+    # Async counterparts, for callers running on an event loop. Compaction
+    # (rare, and itself a blocking call) and memo cache reads and writes
+    # (Redis when configured) run in a thread.
+
+    async def achat(self, messages: list[dict]) -> str:
+        """Async counterpart of chat."""
+        self._usage.set(None)
+        try:
+            messages = await asyncio.to_thread(self.compact_messages, messages)
+            with metrics.track_upstream("claude", "chat"):
+                response = await self.async_client.messages.create(**self._chat_params(messages))
+            self._record_usage("chat", response.usage)
+            return response.content[0].text
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
+    async def achat_stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """Async counterpart of chat_stream."""
+        self._usage.set(None)
+        try:
+            messages = await asyncio.to_thread(self.compact_messages, messages)
+            with metrics.track_upstream("claude", "chat"):
+                async with self.async_client.messages.stream(**self._chat_params(messages)) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    self._record_usage("chat", (await stream.get_final_message()).usage)
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
+    async def agenerate_prd(self, messages: list[dict]) -> str:
+        """Async counterpart of generate_prd."""
+        messages = await asyncio.to_thread(self.compact_messages, messages)
+        self._usage.set(None)
+        try:
+            with metrics.track_upstream("claude", "generate_prd"):
+                response = await self.async_client.messages.create(**self._generation_params(messages))
+            self._record_usage("generate_prd", response.usage)
+            return response.content[0].text
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
+    async def agenerate_prd_stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """Async counterpart of generate_prd_stream."""
+        messages = await asyncio.to_thread(self.compact_messages, messages)
+        self._usage.set(None)
+        try:
+            with metrics.track_upstream("claude", "generate_prd"):
+                async with self.async_client.messages.stream(**self._generation_params(messages)) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    self._record_usage("generate_prd", (await stream.get_final_message()).usage)
+        except anthropic.APIError as e:
+            self._handle_api_error(e)
+
     def extract_product_context(
         self, messages: list[dict] = None, prd_content: str = None
     ) -> dict:
         """
         Extract product name and description from conversation or PRD content.
 
+        Results are memoized on a hash of the model, prompt and condensed
+        input, so repeat research on an unchanged PRD or conversation skips
+        the API call. Failed extractions are not cached. Concurrent calls
+        for the same input (in this process or, with Redis, any worker)
+        share one API call.
+
         Args:
             messages: Conversation history (list of message dicts)
             prd_content: Raw PRD markdown content
@@ -98,60 +446,112 @@ class ClaudeService:
         Returns:
             Dict with product_name, product_description, and confidence level
         """
-        # Build content to analyze
-        if prd_content:
-            # Use first 4000 chars of PRD for extraction
-            content_to_analyze = f"PRD Document:\n{prd_content[:4000]}"
-        elif messages:
-            # Build condensed conversation (last 10 messages, truncated)
-            content_to_analyze = "Conversation:\n" + "\n".join([
-                f"{m['role'].upper()}: {m['content'][:500]}"
-                for m in messages[-10:]
-            ])
-        else:
+        content_to_analyze = self._extraction_input(messages, prd_content)
+        if content_to_analyze is None:
             return {
                 "product_name": None,
                 "product_description": None,
                 "confidence": "none"
             }
 
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=256,
-                system="You are a product context extractor. Extract product information and return valid JSON only. Do not wrap in markdown code blocks.",
-                messages=[{
-                    "role": "user",
-                    "content": f"{PRODUCT_EXTRACTION_PROMPT}\n\n{content_to_analyze}"
-                }]
-            )
+        cache_key = MemoCache.make_key(self.model, PRODUCT_EXTRACTION_PROMPT, content_to_analyze)
+        cached = self.context_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        return self.flights.do(
+            cache_key, "extract_product_context", self._extract_product_context, cache_key, content_to_analyze
+        )
 
-            # Parse JSON response - strip markdown code blocks if present
-            response_text = response.content[0].text.strip()
-
-            # Remove markdown code fences if present
-            if response_text.startswith("```"):
-                # Remove opening fence (```json or ```)
-                lines = response_text.split("\n")
-                lines = lines[1:]  # Remove first line with ```
-                # Find and remove closing fence
-                if lines and lines[-1].strip() == "```":
-                    lines = lines[:-1]
-                response_text = "\n".join(lines).strip()
-
-            result = json.loads(response_text)
+    def _extract_product_context(self, cache_key: str, content_to_analyze: str) -> dict:
+        try:
+            with metrics.track_upstream("claude", "extract_product_context"):
+                response = self.client.messages.create(**self._extraction_params(content_to_analyze))
+            self._record_usage("extract_product_context", response.usage)
+            result = self._parse_extraction(response.content[0].text)
+            self.context_cache.set(cache_key, result)
             return result
         except json.JSONDecodeError as e:
-            return {
-                "product_name": None,
-                "product_description": None,
-                "confidence": "none",
-                "error": f"Failed to parse extraction response: {str(e)}"
-            }
+            return self._extraction_error(f"Failed to parse extraction response: {str(e)}")
         except anthropic.APIError as e:
+            return self._extraction_error(str(e))
+
+    async def aextract_product_context(
+        self, messages: list[dict] = None, prd_content: str = None
+    ) -> dict:
+        """Async counterpart of extract_product_context, sharing its memo cache and flights."""
+        content_to_analyze = self._extraction_input(messages, prd_content)
+        if content_to_analyze is None:
             return {
                 "product_name": None,
                 "product_description": None,
-                "confidence": "none",
-                "error": str(e)
+                "confidence": "none"
             }
+
+        cache_key = MemoCache.make_key(self.model, PRODUCT_EXTRACTION_PROMPT, content_to_analyze)
+        cached = await asyncio.to_thread(self.context_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        return await self.flights.ado(
+            cache_key, "extract_product_context", self._aextract_product_context, cache_key, content_to_analyze
+        )
+
+    async def _aextract_product_context(self, cache_key: str, content_to_analyze: str) -> dict:
+        try:
+            with metrics.track_upstream("claude", "extract_product_context"):
+                response = await self.async_client.messages.create(**self._extraction_params(content_to_analyze))
+            self._record_usage("extract_product_context", response.usage)
+            result = self._parse_extraction(response.content[0].text)
+            await asyncio.to_thread(self.context_cache.set, cache_key, result)
+            return result
+        except json.JSONDecodeError as e:
+            return self._extraction_error(f"Failed to parse extraction response: {str(e)}")
+        except anthropic.APIError as e:
+            return self._extraction_error(str(e))
+
+    @staticmethod
+    def _extraction_input(messages: list[dict], prd_content: str) -> str:
+        """Condensed content to extract from, or None if there is nothing."""
+        if prd_content:
+            # Use first 4000 chars of PRD for extraction
+            return f"PRD Document:\n{prd_content[:4000]}"
+        if messages:
+            # Build condensed conversation (last 10 messages, truncated)
+            return "Conversation:\n" + "\n".join([
+                f"{m['role'].upper()}: {m['content'][:500]}"
+                for m in messages[-10:]
+            ])
+        return None
+
+    def _extraction_params(self, content_to_analyze: str) -> dict:
+        return {
+            "model": self.model,
+            "max_tokens": 256,
+            "system": "You are a product context extractor. Extract product information and return valid JSON only. Do not wrap in markdown code blocks.",
+            "messages": [{
+                "role": "user",
+                "content": f"{PRODUCT_EXTRACTION_PROMPT}\n\n{content_to_analyze}"
+            }]
+        }
+
+    @staticmethod
+    def _parse_extraction(response_text: str) -> dict:
+        """Parse the extraction JSON, stripping markdown code fences if present."""
+        response_text = response_text.strip()
+        if response_text.startswith("```"):
+            # Remove opening fence (```json or ```)
+            lines = response_text.split("\n")
+            lines = lines[1:]  # Remove first line with ```
+            # Find and remove closing fence
+            if lines and lines[-1].strip() == "```":
+                lines = lines[:-1]
+            response_text = "\n".join(lines).strip()
+        return json.loads(response_text)
+
+    @staticmethod
+    def _extraction_error(error: str) -> dict:
+        return {
+            "product_name": None,
+            "product_description": None,
+            "confidence": "none",
+            "error": error
+        }
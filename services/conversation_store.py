@@ -0,0 +1,199 @@
+"""Conversation history storage, pluggable so multiple workers can share it."""
+import json
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from config import CONVERSATION_MAX_BYTES, CONVERSATION_MAX_SESSIONS, CONVERSATION_TTL
+
+
+def serialize_messages(messages: list[dict]) -> bytes:
+    """Encode a message list as compact, zlib-compressed JSON."""
+    payload = json.dumps(messages, separators=(",", ":"), ensure_ascii=False)
+    return zlib.compress(payload.encode("utf-8"))
+
+
+def deserialize_messages(data: bytes) -> list[dict]:
+    """Decode a message list produced by serialize_messages."""
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class ConversationStore(ABC):
+    """
+    Interface for per-session conversation history.
+
+    get() always returns a fresh list: callers mutate it and hand it back
+    through set(), which is the only way changes are persisted.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def set(self, session_id: str, messages: list[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    def stats(self) -> dict:
+        """Usage counters for the health endpoint."""
+        return {}
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Process-local store for development and single-node deployments.
+
+    The store is bounded by session count, total bytes and idle time.
+    Sessions are kept in least-recently-used order, so eviction always
+    starts with the conversation that has gone untouched the longest.
+    Byte usage is measured on the compressed serialized form, which is
+    also what is held in memory.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = CONVERSATION_MAX_SESSIONS,
+        max_bytes: int = CONVERSATION_MAX_BYTES,
+        idle_ttl: int = CONVERSATION_TTL,
+        clock=time.monotonic
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        # session_id -> (serialized messages, last access time), oldest first
+        self._conversations = OrderedDict()
+        # Threaded gunicorn workers share one store per process
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> list[dict]:
+        with self._lock:
+            self._expire_idle()
+            entry = self._conversations.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return []
+            self.hits += 1
+            self._conversations[session_id] = (entry[0], self._clock())
+            self._conversations.move_to_end(session_id)
+            data = entry[0]
+        return deserialize_messages(data)
+
+    def set(self, session_id: str, messages: list[dict]) -> None:
+        if not messages:
+            self.delete(session_id)
+            return
+        data = serialize_messages(messages)
+        with self._lock:
+            self._remove(session_id)
+            self._conversations[session_id] = (data, self._clock())
+            self.bytes_used += len(data)
+            self._expire_idle()
+            self._evict_over_limits()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._remove(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._conversations),
+                "bytes": self.bytes_used,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._conversations.pop(session_id, None)
+        if entry is not None:
+            self.bytes_used -= len(entry[0])
+
+    def _expire_idle(self) -> None:
+        """Drop sessions idle longer than the TTL (they sit at the front)."""
+        cutoff = self._clock() - self.idle_ttl
+        while self._conversations:
+            session_id, (_, last_access) = next(iter(self._conversations.items()))
+            if last_access > cutoff:
+                break
+            self._remove(session_id)
+            self.expirations += 1
+
+    def _evict_over_limits(self) -> None:
+        """Evict least recently used sessions, always keeping the newest one."""
+        while len(self._conversations) > 1 and (
+            len(self._conversations) > self.max_sessions
+            or self.bytes_used > self.max_bytes
+        ):
+            session_id = next(iter(self._conversations))
+            self._remove(session_id)
+            self.evictions += 1
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    Redis-backed store shared by every gunicorn worker.
+
+    Each session lives under its own key with a sliding TTL, refreshed on
+    every read and write, so abandoned conversations expire on their own.
+    """
+
+    def __init__(self, client, ttl: int = CONVERSATION_TTL, prefix: str = "prdy:conversation:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def get(self, session_id: str) -> list[dict]:
+        data = self.client.getex(self._key(session_id), ex=self.ttl)
+        if data is None:
+            self.misses += 1
+            return []
+        self.hits += 1
+        return deserialize_messages(data)
+
+    def set(self, session_id: str, messages: list[dict]) -> None:
+        if not messages:
+            self.delete(session_id)
+            return
+        self.client.set(self._key(session_id), serialize_messages(messages), ex=self.ttl)
+
+    def delete(self, session_id: str) -> None:
+        self.client.delete(self._key(session_id))
+
+    def stats(self) -> dict:
+        # Eviction is Redis's job (TTL plus its maxmemory policy); the
+        # hit/miss counters are for this worker only
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def create_conversation_store(redis_client=None) -> ConversationStore:
+    """Use Redis when a client is available, otherwise keep history in-process."""
+    if redis_client is not None:
+        return RedisConversationStore(redis_client)
+    return InMemoryConversationStore()
@@ -0,0 +1,165 @@
+"""Background jobs for long-running research and PRD generation."""
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config import JOB_RESULT_TTL, JOB_TIMEOUT, JOB_WORKERS
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """Raised by a job function to fail the job with a structured payload."""
+
+    def __init__(self, payload: dict):
+        super().__init__(payload.get("error", "Job failed"))
+        self.payload = payload
+
+
+class InMemoryJobStore:
+    """Process-local job records; finished jobs are pruned after the TTL."""
+
+    def __init__(self, ttl: int = JOB_RESULT_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: dict) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            cutoff = time.time() - self.ttl
+            expired = [
+                job_id for job_id, record in self._jobs.items()
+                if record["finished"] and record["finished"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class RedisJobStore:
+    """Job records in Redis so a poll can land on any worker."""
+
+    def __init__(self, client, ttl: int = JOB_RESULT_TTL, prefix: str = "prdy:job:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def save(self, job: dict) -> None:
+        self.client.set(f"{self.prefix}{job['id']}", json.dumps(job), ex=self.ttl)
+
+    def get(self, job_id: str) -> dict:
+        data = self.client.get(f"{self.prefix}{job_id}")
+        return json.loads(data) if data else None
+
+
+class JobService:
+    """
+    Run long tasks off the request thread and track their status.
+
+    Work executes in a thread pool inside the worker that accepted the job,
+    which frees the request thread immediately. Job records live in the
+    job store: with Redis configured, any worker can answer status polls.
+    A job still queued or running after `timeout` seconds (its worker died,
+    or the store was unreachable when it finished) is reported as failed.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        max_workers: int = JOB_WORKERS,
+        result_ttl: int = JOB_RESULT_TTL,
+        timeout: int = JOB_TIMEOUT
+    ):
+        if redis_client is not None:
+            self.store = RedisJobStore(redis_client, result_ttl)
+        else:
+            self.store = InMemoryJobStore(result_ttl)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        # Created on first submit so each forked gunicorn worker gets its own threads
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._futures = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="prdy-job"
+                )
+            return self._executor
+
+    def submit(self, kind: str, fn, *args, owner: str = None) -> dict:
+        """
+        Queue fn(*args) and return the new job record.
+
+        Args:
+            kind: Job type shown to clients (e.g. "research")
+            fn: Callable returning a JSON-serializable result, or raising
+                JobError to fail with a payload
+            owner: Session ID allowed to read the job
+        """
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "owner": owner,
+            "status": "queued",
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None
+        }
+        self.store.save(job)
+        # The job keeps the submitting request's ID and trace
+        future = self._get_executor().submit(tracing.bind(self._run), job, fn, args)
+        self._futures[job["id"]] = future
+        # Runs at once if the job already finished
+        future.add_done_callback(lambda _: self._futures.pop(job["id"], None))
+        return job
+
+    def _save(self, job: dict) -> None:
+        """Store a job update; failures are logged, and the timeout covers them."""
+        try:
+            self.store.save(job)
+        except Exception as e:
+            logger.warning("Job store error", extra={"job_id": job["id"], "status": job["status"], "error": str(e)})
+
+    def _run(self, job: dict, fn, args: tuple) -> None:
+        job = dict(job, status="running", started=time.time())
+        self._save(job)
+        try:
+            with tracing.span(f"job.{job['kind']}", job_id=job["id"]):
+                job["result"] = fn(*args)
+            job["status"] = "succeeded"
+        except JobError as e:
+            job["status"] = "failed"
+            job["error"] = e.payload
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = {"error": f"Job failed: {str(e)}"}
+        job["finished"] = time.time()
+        self._save(job)
+
+    def get(self, job_id: str, owner: str = None) -> dict:
+        """Return a job record, or None if unknown or owned by another session."""
+        job = self.store.get(job_id)
+        if job is None or job.get("owner") != owner:
+            return None
+        if job["status"] in ("queued", "running") and time.time() - job["created"] > self.timeout:
+            job.update(status="failed", error={"error": "Job timed out"})
+        return job
+
+    def wait(self, job_id: str, timeout: float = None) -> None:
+        """Block until a job submitted by this process has finished."""
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
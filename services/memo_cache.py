@@ -0,0 +1,95 @@
+"""Content-addressed memoization for deterministic LLM calls."""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from redis.exceptions import RedisError
+from config import CONTEXT_CACHE_MAX_ENTRIES, CONTEXT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class MemoCache:
+    """
+    LRU of JSON-serializable results keyed on a hash of their input.
+
+    Entries always live in a bounded in-process LRU. With a Redis client
+    the cache is also shared, so a result computed by one gunicorn worker
+    is reused by the others; Redis entries expire after ttl seconds.
+    Redis errors are logged and treated as misses.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        max_entries: int = CONTEXT_CACHE_MAX_ENTRIES,
+        ttl: int = CONTEXT_CACHE_TTL,
+        prefix: str = "prdy:memo:"
+    ):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Hash the parts of a call's input (e.g. model, prompt, content)."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Return a fresh copy of the value stored under key, or None."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+
+        if data is None and self.redis is not None:
+            try:
+                data = self.redis.get(f"{self.prefix}{key}")
+            except RedisError as e:
+                logger.warning("Memo cache Redis error", extra={"error": str(e)})
+            if data is not None:
+                self._remember(key, data)
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(data)
+
+    def set(self, key: str, value) -> None:
+        """Store value under key locally and, if configured, in Redis."""
+        data = json.dumps(value)
+        self._remember(key, data)
+        if self.redis is not None:
+            try:
+                self.redis.set(f"{self.prefix}{key}", data, ex=self.ttl)
+            except RedisError as e:
+                logger.warning("Memo cache Redis error", extra={"error": str(e)})
+
+    def _remember(self, key: str, data) -> None:
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Entry count and hit/miss counters for the health endpoint."""
+        with self._lock:
+            return {
+                "backend": "redis" if self.redis is not None else "memory",
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
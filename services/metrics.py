@@ -0,0 +1,131 @@
+"""
+Prometheus metrics for requests, upstream API calls and PRD storage.
+
+Under gunicorn each worker process keeps its own values. gunicorn.conf.py
+points PROMETHEUS_MULTIPROC_DIR at a shared directory before the workers
+fork, so prometheus_client writes them to per-process files and /metrics
+aggregates all workers. Without it (the Flask dev server, tests) the
+metrics live in the default in-process registry.
+"""
+import functools
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from services import tracing
+
+# LLM calls take seconds to minutes, so the buckets reach further than the
+# client library's defaults
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+HTTP_REQUESTS = Counter(
+    "prdy_http_requests_total", "HTTP requests by route and status.",
+    ["method", "route", "status"]
+)
+HTTP_DURATION = Histogram(
+    "prdy_http_request_duration_seconds",
+    "Time from request start until the response (including a stream) finished.",
+    ["method", "route"], buckets=REQUEST_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "prdy_http_requests_in_flight", "Requests currently being served.",
+    ["route"], multiprocess_mode="livesum"
+)
+UPSTREAM_DURATION = Histogram(
+    "prdy_upstream_duration_seconds", "Claude and Perplexity call latency by outcome.",
+    ["service", "operation", "outcome"], buckets=UPSTREAM_BUCKETS
+)
+UPSTREAM_ERRORS = Counter(
+    "prdy_upstream_errors_total", "Failed Claude and Perplexity calls.",
+    ["service", "operation", "error"]
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "prdy_upstream_in_flight", "Claude and Perplexity calls currently waiting.",
+    ["service", "operation"], multiprocess_mode="livesum"
+)
+TOKENS = Counter(
+    "prdy_tokens_total", "Claude tokens by operation and kind.",
+    ["operation", "kind"]
+)
+COALESCED = Counter(
+    "prdy_coalesced_calls_total",
+    "Calls answered by an identical call already in flight, in this process or another worker.",
+    ["operation", "scope"]
+)
+STORAGE_DURATION = Histogram(
+    "prdy_storage_duration_seconds", "PRDService storage and index operation latency.",
+    ["operation"], buckets=STORAGE_BUCKETS
+)
+
+
+@contextmanager
+def track_upstream(service: str, operation: str):
+    """
+    Time one upstream call (or a whole streamed response) and count failures.
+
+    The outcome is "ok", "error" if the block raised, or "cancelled" if a
+    streaming generator was closed before it finished. The call is also
+    traced as a client span.
+    """
+    in_flight = UPSTREAM_IN_FLIGHT.labels(service, operation)
+    in_flight.inc()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracing.span(f"{service}.{operation}", kind="client", service=service):
+            yield
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    except BaseException as e:
+        UPSTREAM_ERRORS.labels(service, operation, type(e).__name__).inc()
+        raise
+    finally:
+        in_flight.dec()
+        UPSTREAM_DURATION.labels(service, operation, outcome).observe(time.perf_counter() - started)
+
+
+def record_tokens(operation: str, usage: dict) -> None:
+    """Count the tokens from a ClaudeService usage record."""
+    for kind, key in (
+        ("input", "input_tokens"),
+        ("output", "output_tokens"),
+        ("cache_read", "cache_read_input_tokens"),
+        ("cache_write", "cache_creation_input_tokens"),
+    ):
+        count = usage.get(key)
+        if isinstance(count, int) and count > 0:
+            TOKENS.labels(operation, kind).inc(count)
+
+
+def timed_storage(operation: str):
+    """Decorator recording a PRDService method's latency and tracing it as a span."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STORAGE_DURATION.labels(operation).time(), tracing.span(f"storage.{operation}"):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def render() -> tuple[bytes, str]:
+    """Metrics in the Prometheus text format, aggregated across workers."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
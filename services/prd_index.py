@@ -0,0 +1,447 @@
+"""SQLite index of saved PRD and research file metadata."""
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from services.storage import StorageEntry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    product_prefix TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    parent TEXT
+);
+CREATE INDEX IF NOT EXISTS files_by_mtime ON files (mtime DESC);
+CREATE INDEX IF NOT EXISTS files_by_prefix ON files (product_prefix, kind);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Full-text index: one row per markdown section. The FTS rowid packs the
+# document id with the section number so a file's rows can be replaced with
+# a rowid range delete instead of a scan.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT UNIQUE NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections USING fts5(
+    filename UNINDEXED, heading, body, tokenize = 'porter unicode61'
+);
+"""
+SECTION_BITS = 10
+MAX_SECTIONS = 1 << SECTION_BITS
+
+# Matches in a section heading count this many times more than in its body
+HEADING_WEIGHT = 4.0
+
+# Markers around matched terms in search snippets (escaped to HTML by PRDService)
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# Where the index lives inside a filesystem output directory
+INDEX_DIRNAME = ".index"
+
+
+def split_sections(text: str) -> list[tuple[str, str]]:
+    """Split markdown into (heading, body) pairs on #, ## and ### headings."""
+    sections = []
+    heading, body = "", []
+    for line in text.split("\n"):
+        match = re.match(r"^#{1,3}\s+(.*)$", line)
+        if match:
+            if heading or any(part.strip() for part in body):
+                sections.append((heading, "\n".join(body).strip()))
+            heading, body = match.group(1).strip(), []
+        else:
+            body.append(line)
+    if heading or any(part.strip() for part in body):
+        sections.append((heading, "\n".join(body).strip()))
+    # Fold anything past the rowid budget into the last section
+    if len(sections) > MAX_SECTIONS:
+        tail = "\n\n".join(f"{h}\n{b}" for h, b in sections[MAX_SECTIONS - 1:])
+        sections = sections[:MAX_SECTIONS - 1] + [(sections[MAX_SECTIONS - 1][0], tail)]
+    return sections
+
+
+def match_expression(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query: every word must match, and the
+    last one may be a prefix so results update while typing.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class PRDIndex:
+    """
+    Metadata index of PRD storage, so listing doesn't stat every file.
+
+    Rows hold filename, kind ("prd" or "research"), product prefix, mtime,
+    size and, for research, the parent PRD (the newest PRD with the same
+    prefix). PRDService updates rows as it writes, appends and archives.
+
+    Files added or removed behind the service's back (another tool, a
+    manual copy, another app instance sharing the storage) are picked up by
+    comparing the storage's change token (the directory mtime on the
+    filesystem) with the one recorded at the last sync: when it differs,
+    the file names are diffed against the index and only new files are
+    stat'ed. In-place edits by other tools are only seen after rebuild().
+
+    When SQLite has FTS5, the text of every indexed file is also kept in a
+    section-level full-text index for search().
+    """
+
+    def __init__(self, service: "PRDService", index_dir: str):
+        self.service = service
+        self.storage = service.storage
+        os.makedirs(index_dir, exist_ok=True)
+        self.db_path = os.path.join(index_dir, "prds.sqlite3")
+        self._sync_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Distinguishes this index from a deleted and recreated one in version()
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('instance', ?)", (uuid.uuid4().hex,)
+            )
+            had_search = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sections'"
+            ).fetchone() is not None
+            try:
+                conn.executescript(SEARCH_SCHEMA)
+                self.searchable = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: listing works, search doesn't
+                self.searchable = False
+            has_files = conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is not None
+        # An index created before search existed needs its text backfilled
+        if self.searchable and not had_search and has_files:
+            self.rebuild()
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection per operation; safe across threads and forks."""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _kind(self, filename: str) -> str:
+        if self.service._is_prd_file(filename):
+            return "prd"
+        if self.service._is_research_file(filename):
+            return "research"
+        return None
+
+    def _row(self, entry) -> tuple:
+        """Row for a storage entry, stat'ing it if the listing had no metadata."""
+        if entry.size is None:
+            entry = self.storage.stat(entry.name)
+            if entry is None:
+                # Archived between listing and stat
+                return None
+        return (
+            entry.name,
+            self._kind(entry.name),
+            self.service._get_product_prefix(entry.name),
+            entry.mtime,
+            entry.size
+        )
+
+    def _entries(self) -> dict:
+        """Indexable top-level entries in storage, by name."""
+        return {
+            entry.name: entry
+            for batch in self.storage.iter_entries()
+            for entry in batch
+            if entry.name.endswith(".md") and self._kind(entry.name)
+        }
+
+    def _write_rows(self, conn, rows: list[tuple]) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO files (filename, kind, product_prefix, mtime, size) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+
+    @staticmethod
+    def _refresh_parents(conn, prefixes) -> None:
+        """Point research with these prefixes at the newest matching PRD."""
+        conn.executemany(
+            """
+            UPDATE files SET parent = (
+                SELECT filename FROM files AS prd
+                WHERE prd.kind = 'prd' AND prd.product_prefix = ?
+                ORDER BY prd.mtime DESC, prd.filename DESC LIMIT 1
+            )
+            WHERE kind = 'research' AND product_prefix = ?
+            """,
+            [(prefix, prefix) for prefix in set(prefixes)]
+        )
+
+    def _index_text(self, conn, filename: str) -> None:
+        """Replace a file's sections in the full-text index."""
+        if not self.searchable:
+            return
+        text = self.storage.read_text(filename)
+        if text is None:
+            return
+        row = conn.execute("SELECT doc_id FROM documents WHERE filename = ?", (filename,)).fetchone()
+        if row is None:
+            doc_id = conn.execute("INSERT INTO documents (filename) VALUES (?)", (filename,)).lastrowid
+        else:
+            doc_id = row["doc_id"]
+            self._delete_sections(conn, doc_id)
+        conn.executemany(
+            "INSERT INTO sections (rowid, filename, heading, body) VALUES (?, ?, ?, ?)",
+            [
+                ((doc_id << SECTION_BITS) + i, filename, heading, body)
+                for i, (heading, body) in enumerate(split_sections(text))
+            ]
+        )
+
+    def _unindex_text(self, conn, filenames) -> None:
+        if not self.searchable:
+            return
+        for filename in filenames:
+            row = conn.execute("SELECT doc_id FROM documents WHERE filename = ?", (filename,)).fetchone()
+            if row is not None:
+                self._delete_sections(conn, row["doc_id"])
+                conn.execute("DELETE FROM documents WHERE doc_id = ?", (row["doc_id"],))
+
+    @staticmethod
+    def _delete_sections(conn, doc_id: int) -> None:
+        conn.execute(
+            "DELETE FROM sections WHERE rowid >= ? AND rowid < ?",
+            (doc_id << SECTION_BITS, (doc_id + 1) << SECTION_BITS)
+        )
+
+    @staticmethod
+    def _bump(conn) -> None:
+        """Advance the generation counter after any change to the rows."""
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    def upsert(self, filename: str) -> None:
+        """Add or refresh one file's row after the service wrote it."""
+        if self._kind(filename) is None:
+            return
+        row = self._row(StorageEntry(filename))
+        if row is None:
+            return
+        with self._connect() as conn:
+            self._write_rows(conn, [row])
+            self._refresh_parents(conn, [row[2]])
+            self._index_text(conn, filename)
+            self._bump(conn)
+
+    def remove(self, filename: str) -> None:
+        """Drop one file's row after it was archived or deleted."""
+        self.remove_many([filename])
+
+    def remove_many(self, filenames: list[str]) -> None:
+        """Drop several files' rows in one transaction."""
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM files WHERE filename = ?", [(f,) for f in filenames])
+            self._refresh_parents(conn, [self.service._get_product_prefix(f) for f in filenames])
+            self._unindex_text(conn, filenames)
+            self._bump(conn)
+
+    def sync(self) -> None:
+        """Reconcile with files added or removed outside the service."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'change_token'").fetchone()
+        if row is not None and row["value"] == self.storage.change_token():
+            return
+
+        with self._sync_lock:
+            # Record the token seen before listing so later changes trigger another sync
+            token = self.storage.change_token()
+            on_disk = self._entries()
+            with self._connect() as conn:
+                indexed = {r["filename"] for r in conn.execute("SELECT filename FROM files")}
+                added, removed = on_disk.keys() - indexed, indexed - on_disk.keys()
+                rows = [row for row in map(self._row, (on_disk[f] for f in added)) if row]
+                self._write_rows(conn, rows)
+                conn.executemany("DELETE FROM files WHERE filename = ?", [(f,) for f in removed])
+                for row in rows:
+                    self._index_text(conn, row[0])
+                self._unindex_text(conn, removed)
+                if added or removed:
+                    self._refresh_parents(
+                        conn, [self.service._get_product_prefix(f) for f in added | removed]
+                    )
+                    self._bump(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('change_token', ?)", (token,)
+                )
+
+    def rebuild(self) -> int:
+        """Re-stat every file from scratch and return the number indexed."""
+        with self._sync_lock:
+            token = self.storage.change_token()
+            rows = [row for row in map(self._row, self._entries().values()) if row]
+            with self._connect() as conn:
+                conn.execute("DELETE FROM files")
+                self._write_rows(conn, rows)
+                if self.searchable:
+                    conn.execute("DELETE FROM sections")
+                    conn.execute("DELETE FROM documents")
+                    for row in rows:
+                        self._index_text(conn, row[0])
+                self._refresh_parents(conn, [row[2] for row in rows])
+                self._bump(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('change_token', ?)", (token,)
+                )
+        return len(rows)
+
+    def version(self) -> str:
+        """Opaque token that changes whenever any indexed row changes."""
+        self.sync()
+        with self._connect() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return f"{meta['instance']}.{meta.get('generation', 0)}"
+
+    def page(self, limit: int = None, after: tuple = None) -> list[dict]:
+        """
+        One page of PRD rows plus the research rows that belong to them.
+
+        Args:
+            limit: Maximum number of PRDs, or None for all
+            after: (mtime, filename) of the last PRD on the previous page
+        """
+        self.sync()
+        query = "SELECT filename, kind, product_prefix, mtime, size, parent FROM files WHERE kind = 'prd'"
+        params = []
+        if after is not None:
+            query += " AND (mtime, filename) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY mtime DESC, filename DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as conn:
+            prds = [dict(row) for row in conn.execute(query, params)]
+            research_query = (
+                "SELECT filename, kind, product_prefix, mtime, size, parent FROM files "
+                "WHERE kind = 'research' AND parent IS NOT NULL"
+            )
+            research_params = []
+            if limit is not None or after is not None:
+                research_query += f" AND parent IN ({', '.join('?' * len(prds))})"
+                research_params = [prd["filename"] for prd in prds]
+            research = [
+                dict(row) for row in conn.execute(
+                    research_query + " ORDER BY mtime DESC, filename DESC", research_params
+                )
+            ]
+        return prds + research
+
+    def rows(self) -> list[dict]:
+        """All indexed PRD and research rows, newest first."""
+        self.sync()
+        with self._connect() as conn:
+            return [
+                dict(row) for row in conn.execute(
+                    "SELECT filename, kind, product_prefix, mtime, size, parent "
+                    "FROM files ORDER BY mtime DESC, filename DESC"
+                )
+            ]
+
+    def research_for(self, prefixes: list[str]) -> list[dict]:
+        """Research rows with any of these product prefixes, newest first."""
+        self.sync()
+        prefixes = list(set(prefixes))
+        if not prefixes:
+            return []
+        with self._connect() as conn:
+            return [
+                dict(row) for row in conn.execute(
+                    "SELECT filename, kind, product_prefix, mtime, size, parent FROM files "
+                    f"WHERE kind = 'research' AND product_prefix IN ({', '.join('?' * len(prefixes))}) "
+                    "ORDER BY mtime DESC, filename DESC",
+                    prefixes
+                )
+            ]
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        """
+        Rank indexed files against a free-text query.
+
+        Sections are scored with BM25, weighting heading matches by
+        HEADING_WEIGHT; a file ranks by its best section. Each result lists
+        up to three matching sections with the matched terms wrapped in
+        MATCH_START/MATCH_END.
+
+        Raises:
+            sqlite3.NotSupportedError: If SQLite lacks FTS5
+        """
+        if not self.searchable:
+            raise sqlite3.NotSupportedError("Full-text search requires SQLite with FTS5")
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        self.sync()
+
+        with self._connect() as conn:
+            # FTS5 orders by rank itself, so rows (and their highlights) are
+            # only produced as read: stop once `limit` files are found, so a
+            # file with many matching sections can't crowd the others out
+            ranked = conn.execute(
+                """
+                SELECT sections.filename, files.kind, files.mtime, rank AS score,
+                       highlight(sections, 1, ?, ?) AS heading,
+                       snippet(sections, 2, ?, ?, '…', 16) AS snippet
+                FROM sections JOIN files ON files.filename = sections.filename
+                WHERE sections MATCH ? AND rank MATCH ?
+                ORDER BY rank
+                """,
+                (MATCH_START, MATCH_END, MATCH_START, MATCH_END, expression,
+                 f"bm25(0.0, {HEADING_WEIGHT}, 1.0)")
+            )
+            rows, counts = [], {}
+            for row in ranked:
+                filename = row["filename"]
+                if filename not in counts:
+                    if len(counts) == limit:
+                        break
+                    counts[filename] = 0
+                # A file ranks by its best section; keep its three best
+                if counts[filename] < 3:
+                    counts[filename] += 1
+                    rows.append(row)
+            ranked.close()
+
+        results = {}
+        for row in rows:
+            result = results.get(row["filename"])
+            if result is None:
+                # bm25() is lower-is-better; flip it so higher scores rank first
+                result = results[row["filename"]] = {
+                    "filename": row["filename"],
+                    "kind": row["kind"],
+                    "mtime": row["mtime"],
+                    "score": round(-row["score"], 4),
+                    "sections": []
+                }
+            result["sections"].append({"heading": row["heading"], "snippet": row["snippet"]})
+        return list(results.values())
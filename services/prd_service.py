@@ -1,13 +1,190 @@
+import base64
+import hashlib
+import html
+import json
+import logging
 import os
 import re
+import sqlite3
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
 from datetime import datetime
-from config import OUTPUT_DIR
+from config import CACHE_DIR, OUTPUT_DIR
+from services import metrics
+from services.archive import PRDArchive
+from services.prd_index import INDEX_DIRNAME, MATCH_END, MATCH_START, PRDIndex
+from services.storage import (
+    FilesystemStorage,
+    S3Storage,
+    SQLiteStorage,
+    Storage,
+)
+from services.zip_stream import stream_zip
+
+logger = logging.getLogger(__name__)
+
+# Fields a PRD listing can be narrowed to with list_prds_page(fields=...)
+LISTING_FIELDS = {"filename", "name", "date", "created", "size", "product_prefix", "research"}
+
+# Top-level sections that hold a PRD's product description, in preference order
+OVERVIEW_SECTIONS = ["executive summary", "overview", "summary", "product overview"]
+
+# "<name> is a <category> for ..." or "A <category> for ..." - the category
+# is the search-friendly part
+CATEGORY_PATTERN = re.compile(
+    r"(?:^an?|\b(?:is|as) (?:an?|the)) (.+?)(?=[.,;:()]| that | which | to | with | designed | built |$)",
+    re.IGNORECASE
+)
+
+# Words stripped from search categories, mirroring the extraction prompt
+MARKETING_WORDS = {
+    "premium", "deluxe", "pro", "ultimate", "innovative", "revolutionary",
+    "cutting-edge", "next-generation", "next-gen", "powerful", "simple",
+    "seamless", "smart", "best-in-class", "world-class", "modern", "new"
+}
+
+
+def iter_sections(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Regroup streamed text chunks into top-level markdown sections.
+
+    Each yielded piece ends just before the next "## " heading, so the
+    concatenation of all pieces is exactly the concatenation of the chunks.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        # Search from 1 so a heading at the very start doesn't emit an empty piece
+        boundary = buffer.find("\n## ", 1)
+        while boundary != -1:
+            yield buffer[:boundary + 1]
+            buffer = buffer[boundary + 1:]
+            boundary = buffer.find("\n## ", 1)
+    if buffer:
+        yield buffer
+
+
+class PRDWriter:
+    """
+    Write a PRD incrementally through the service's storage.
+
+    The document only appears under its final "*-prd-*.md" name on
+    commit() (an atomic rename on the filesystem, an upload elsewhere), so
+    a half-written PRD never shows up in the sidebar. Used as a context
+    manager, an uncommitted writer cleans up after itself.
+    """
+
+    # Enough of the document to find the "# Title" line
+    HEAD_SIZE = 4096
+
+    def __init__(self, service: "PRDService"):
+        self.service = service
+        self._writer = service.storage.open_writer()
+        self._head = ""
+        self.filename = None
+
+    def write(self, text: str) -> None:
+        """Append text to the pending document."""
+        if len(self._head) < self.HEAD_SIZE:
+            self._head += text[:self.HEAD_SIZE - len(self._head)]
+        self._writer.write(text.encode("utf-8"))
+
+    def commit(self, product_name: str = None) -> str:
+        """Store the document under its final name and return the filename."""
+        if not product_name:
+            product_name = self.service._extract_product_name(self._head)
+        filename = self.service._create_filename(product_name)
+        self._writer.commit(filename)
+        self.filename = filename
+        self.service._index_upsert(filename)
+        return filename
+
+    def abort(self) -> None:
+        """Discard the pending document."""
+        self._writer.abort()
+
+    def __enter__(self) -> "PRDWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.filename is None:
+            self.abort()
 
 
 class PRDService:
-    def __init__(self):
+    def __init__(self, storage: Storage = None):
+        """
+        Args:
+            storage: Where PRDs are kept. By default they are files in
+                output_dir (which tests and scripts may reassign).
+        """
         self.output_dir = OUTPUT_DIR
+        self._storage = storage
+        self._fs_storage = None
+        self._index = None
+        self._archive = None
+
+    @property
+    def storage(self) -> Storage:
+        """The configured storage, or the filesystem under output_dir."""
+        if self._storage is not None:
+            return self._storage
+        if self._fs_storage is None or self._fs_storage.root != self.output_dir:
+            self._fs_storage = FilesystemStorage(self.output_dir)
+        return self._fs_storage
+
+    @property
+    def index(self) -> PRDIndex:
+        """Metadata index for the current storage."""
+        storage = self.storage
+        if self._index is None or self._index.storage is not storage:
+            self._index = PRDIndex(self, self._index_dir())
+        return self._index
+
+    @property
+    def archive(self) -> PRDArchive:
+        """Compressed archive in the current storage."""
+        storage = self.storage
+        # Kept like the index, so its segment map outlives a single lookup
+        if self._archive is None or self._archive.storage is not storage:
+            self._archive = PRDArchive(storage)
+        return self._archive
+
+    def _index_dir(self) -> str:
+        """Local directory for the index database."""
+        if self._storage is None:
+            return os.path.join(self.output_dir, INDEX_DIRNAME)
+        # Remote storage: each instance keeps its own index in the cache dir
+        key = hashlib.sha256(repr(self._storage_identity()).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, "prd-index", key)
+
+    def _storage_identity(self) -> tuple:
+        storage = self._storage
+        if isinstance(storage, S3Storage):
+            return ("s3", storage.bucket, storage.prefix)
+        if isinstance(storage, SQLiteStorage):
+            return ("sqlite", os.path.abspath(storage.path))
+        return (type(storage).__name__, id(storage))
+
+    def _index_upsert(self, filename: str) -> None:
+        # The index resyncs from storage on the next listing, so a failed
+        # update must not fail the write itself
+        try:
+            self.index.upsert(filename)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("PRD index update error", extra={"error": str(e)})
+
+    def _index_remove(self, *filenames: str) -> None:
+        try:
+            self.index.remove_many(list(filenames))
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("PRD index update error", extra={"error": str(e)})
+
+    def rebuild_index(self) -> int:
+        """Rebuild the metadata index from the stored files."""
+        return self.index.rebuild()
 
+    @metrics.timed_storage("save_prd")
     def save_prd(self, content: str, product_name: str = None) -> str:
         """Save PRD content to a markdown file and return the filename."""
         # Extract product name from content if not provided
@@ -16,13 +193,15 @@ class PRDService:
 
         # Create a safe filename
         filename = self._create_filename(product_name)
-        filepath = os.path.join(self.output_dir, filename)
-
-        with open(filepath, "w") as f:
-            f.write(content)
+        self.storage.write_text(filename, content)
+        self._index_upsert(filename)
 
         return filename
 
+    def open_prd_writer(self) -> PRDWriter:
+        """Start an incremental PRD save (see PRDWriter)."""
+        return PRDWriter(self)
+
     def _extract_product_name(self, content: str) -> str:
         """Extract product name from PRD content."""
         # Try to find the title in the first line
@@ -36,6 +215,93 @@ class PRDService:
                 return title
         return "Untitled"
 
+    def extract_product_context(self, content: str) -> dict:
+        """
+        Extract product context from a saved PRD without an LLM call.
+
+        The name comes from the "# Name - Product Requirements Document"
+        heading, the description from the first paragraph of the executive
+        summary/overview, and the search category from the description's
+        "is a <category>" phrase.
+
+        Returns:
+            Dict in the shape of ClaudeService.extract_product_context. The
+            confidence is "high" when all three fields come from a standard
+            PRD, "medium" when the title is non-standard, and "low" when any
+            field is missing (callers should fall back to Claude).
+        """
+        product_name = None
+        standard_title = False
+        for line in content.strip().split("\n"):
+            if line.startswith("# "):
+                title = self._strip_markdown(line[2:])
+                standard_title = title.lower().endswith(" - product requirements document")
+                product_name = title.split(" - ")[0].strip() or None
+                break
+
+        description = self._overview_paragraph(content)
+        search_category = self._search_category(description) if description else None
+
+        if not (product_name and description and search_category):
+            confidence = "low"
+        elif standard_title:
+            confidence = "high"
+        else:
+            confidence = "medium"
+
+        return {
+            "product_name": product_name,
+            "product_description": description,
+            "search_category": search_category,
+            "confidence": confidence
+        }
+
+    @staticmethod
+    def _strip_markdown(text: str) -> str:
+        """Reduce inline markdown (emphasis, code, links) to plain text."""
+        text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+        text = re.sub(r"[*_`]+", "", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    def _overview_paragraph(self, content: str, max_chars: int = 300) -> str:
+        """First paragraph of the overview section, cut to two sentences."""
+        sections = {}
+        current = None
+        for line in content.split("\n"):
+            heading = re.match(r"^(#{1,3})\s+(?:\d+(?:\.\d+)*\.?\s+)?(.+?)\s*$", line)
+            if heading:
+                name = self._strip_markdown(heading.group(2)).lower()
+                current = name if name in OVERVIEW_SECTIONS and name not in sections else None
+                if current:
+                    sections[current] = []
+            elif current:
+                sections[current].append(line)
+
+        for name in OVERVIEW_SECTIONS:
+            paragraph = []
+            for line in sections.get(name, []):
+                if line.strip():
+                    paragraph.append(line.strip().lstrip("-*> ").strip())
+                elif paragraph:
+                    break
+            text = self._strip_markdown(" ".join(paragraph))
+            if text:
+                sentences = re.split(r"(?<=[.!?])\s+", text)
+                return " ".join(sentences[:2])[:max_chars].strip()
+        return None
+
+    @staticmethod
+    def _search_category(description: str, max_words: int = 8) -> str:
+        """Pull a clean product category out of an "X is a <category>" sentence."""
+        match = CATEGORY_PATTERN.search(description)
+        if not match:
+            return None
+        words = [
+            word for word in re.findall(r"[\w-]+", match.group(1).lower())
+            if word not in MARKETING_WORDS
+        ]
+        return " ".join(words[:max_words]) or None
+
     def _create_filename(self, product_name: str) -> str:
         """Create a safe filename from product name."""
         # Remove special characters and replace spaces with hyphens
@@ -68,45 +334,217 @@ class PRDService:
 
     def list_prds(self) -> list[dict]:
         """List all saved PRDs with their associated research files grouped."""
+        return self.list_prds_page()["prds"]
+
+    @metrics.timed_storage("list_prds_page")
+    def list_prds_page(self, limit: int = None, cursor: str = None, fields: list[str] = None) -> dict:
+        """
+        List saved PRDs newest first, a page at a time.
+
+        Args:
+            limit: Maximum number of PRDs to return, or None for all
+            cursor: next_cursor from the previous page
+            fields: Keys to keep in each PRD and research entry (see
+                LISTING_FIELDS), or None for all
+
+        Returns:
+            Dict with 'prds' and 'next_cursor' (None on the last page)
+
+        Raises:
+            ValueError: If the cursor or a field name is invalid
+        """
+        after = self._decode_cursor(cursor) if cursor else None
+        if fields is not None and not set(fields) <= LISTING_FIELDS:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(set(fields) - LISTING_FIELDS))}")
+
+        # Fetch one extra PRD to learn whether another page follows
+        fetch = limit + 1 if limit is not None else None
+        try:
+            rows = self.index.page(fetch, after)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("PRD index unavailable, scanning storage", extra={"error": str(e)})
+            rows = self._page_rows(self._scan_rows(), fetch, after)
+
+        # One pass: rows are newest first, so PRDs and each PRD's research come out sorted
+        prd_rows = []
+        research = defaultdict(list)
+        for row in rows:
+            if row["kind"] == "prd":
+                prd_rows.append(row)
+            elif row["parent"] is not None:
+                research[row["parent"]].append(self._file_info(row, fields))
+
+        next_cursor = None
+        if limit is not None and len(prd_rows) > limit:
+            prd_rows = prd_rows[:limit]
+            next_cursor = self._encode_cursor(prd_rows[-1])
+
         prds = []
-        research_files = []
-
-        if os.path.exists(self.output_dir):
-            for filename in os.listdir(self.output_dir):
-                if filename.endswith(".md"):
-                    filepath = os.path.join(self.output_dir, filename)
-                    stat = os.stat(filepath)
-                    created = datetime.fromtimestamp(stat.st_mtime)
-                    file_info = {
-                        "filename": filename,
-                        "name": self._extract_name_from_filename(filename),
-                        "date": created.strftime("%b %d, %Y"),
-                        "created": created.isoformat(),
-                        "size": stat.st_size,
-                        "product_prefix": self._get_product_prefix(filename)
-                    }
+        for row in prd_rows:
+            prd = self._file_info(row, fields)
+            if fields is None or "research" in fields:
+                prd["research"] = research[row["filename"]]
+            prds.append(prd)
+        return {"prds": prds, "next_cursor": next_cursor}
+
+    def export_rows(self, filenames: list[str] = (), products: list[str] = ()) -> list[dict]:
+        """
+        Rows for an export: the selected PRDs plus their grouped research.
 
-                    if self._is_prd_file(filename):
-                        file_info["research"] = []
-                        prds.append(file_info)
-                    elif self._is_research_file(filename):
-                        research_files.append(file_info)
-
-        # Associate research files with their parent PRDs
-        for research in research_files:
-            for prd in prds:
-                if research["product_prefix"] == prd["product_prefix"]:
-                    prd["research"].append(research)
-                    break
+        PRDs are selected by filename or by product prefix (a product's
+        whole PRD history). Research is grouped exactly as in list_prds,
+        under the newest PRD for its product; research filenames can also
+        be selected directly.
+        """
+        try:
+            rows = self.index.rows()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("PRD index unavailable, scanning storage", extra={"error": str(e)})
+            rows = self._scan_rows()
+
+        filenames, products = set(filenames), set(products)
+        selected = {
+            row["filename"] for row in rows
+            if row["kind"] == "prd" and (row["filename"] in filenames or row["product_prefix"] in products)
+        }
+        return [
+            row for row in rows
+            if row["filename"] in selected or row["filename"] in filenames or row["parent"] in selected
+        ]
+
+    def export_zip(self, rows: list[dict]) -> Iterator[bytes]:
+        """
+        Stream a zip of the given rows' files, one folder per product.
 
-        # Sort PRDs by created date (newest first)
-        prds = sorted(prds, key=lambda x: x["created"], reverse=True)
+        File contents are streamed from storage chunk by chunk, so memory
+        use doesn't grow with the size or number of files.
+        """
+        return stream_zip(
+            (
+                f"{row['product_prefix']}/{row['filename']}",
+                row["mtime"],
+                row["size"],
+                self.storage.iter_chunks(row["filename"])
+            )
+            for row in sorted(rows, key=lambda row: (row["product_prefix"], row["filename"]))
+        )
+
+    def listing_version(self) -> str:
+        """Token that changes whenever the listing would, or None if unknown."""
+        try:
+            return self.index.version()
+        except (sqlite3.Error, OSError):
+            return None
 
-        # Sort research within each PRD by created date (newest first)
-        for prd in prds:
-            prd["research"] = sorted(prd["research"], key=lambda x: x["created"], reverse=True)
+    @metrics.timed_storage("search")
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        """
+        Full-text search over saved PRDs and research, best match first.
 
-        return prds
+        Returns:
+            List of dicts with filename, name, kind ("prd" or "research"),
+            date, score and 'sections' - up to three matching sections with
+            HTML-escaped 'heading' and 'snippet' where matches are wrapped
+            in <mark> tags
+        """
+        results = []
+        for result in self.index.search(query, limit):
+            created = datetime.fromtimestamp(result["mtime"])
+            results.append({
+                "filename": result["filename"],
+                "name": self._extract_name_from_filename(result["filename"]),
+                "kind": result["kind"],
+                "date": created.strftime("%b %d, %Y"),
+                "score": result["score"],
+                "sections": [
+                    {
+                        "heading": self._highlight(section["heading"]),
+                        "snippet": self._highlight(section["snippet"])
+                    }
+                    for section in result["sections"]
+                ]
+            })
+        return results
+
+    @staticmethod
+    def _highlight(text: str) -> str:
+        """Escape indexed text for HTML and turn match markers into <mark> tags."""
+        return html.escape(text).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+    @staticmethod
+    def _encode_cursor(row: dict) -> str:
+        data = json.dumps([row["mtime"], row["filename"]]).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple:
+        try:
+            mtime, filename = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return float(mtime), str(filename)
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    @staticmethod
+    def _page_rows(rows: list[dict], limit: int = None, after: tuple = None) -> list[dict]:
+        """PRDs after the cursor (up to limit) and their research, like PRDIndex.page."""
+        prds = [
+            row for row in rows
+            if row["kind"] == "prd" and (after is None or (row["mtime"], row["filename"]) < after)
+        ][:limit]
+        parents = {row["filename"] for row in prds}
+        return prds + [row for row in rows if row["kind"] == "research" and row["parent"] in parents]
+
+    def _file_info(self, row: dict, fields: list[str] = None) -> dict:
+        """Sidebar entry for an index row, optionally narrowed to fields."""
+        created = datetime.fromtimestamp(row["mtime"])
+        info = {
+            "filename": row["filename"],
+            "name": self._extract_name_from_filename(row["filename"]),
+            "date": created.strftime("%b %d, %Y"),
+            "created": created.isoformat(),
+            "size": row["size"],
+            "product_prefix": row["product_prefix"]
+        }
+        if fields is not None:
+            info = {key: value for key, value in info.items() if key in fields}
+        return info
+
+    def _scan_rows(self) -> list[dict]:
+        """Index rows built straight from storage, newest first."""
+        rows = []
+        for batch in self.storage.iter_entries():
+            for entry in batch:
+                filename = entry.name
+                if not filename.endswith(".md"):
+                    continue
+                if self._is_prd_file(filename):
+                    kind = "prd"
+                elif self._is_research_file(filename):
+                    kind = "research"
+                else:
+                    continue
+                if entry.size is None:
+                    entry = self.storage.stat(filename)
+                    if entry is None:
+                        continue
+                rows.append({
+                    "filename": filename,
+                    "kind": kind,
+                    "product_prefix": self._get_product_prefix(filename),
+                    "mtime": entry.mtime,
+                    "size": entry.size,
+                    "parent": None
+                })
+        rows.sort(key=lambda row: (row["mtime"], row["filename"]), reverse=True)
+
+        newest_prd = {}
+        for row in rows:
+            if row["kind"] == "prd":
+                newest_prd.setdefault(row["product_prefix"], row["filename"])
+        for row in rows:
+            if row["kind"] == "research":
+                row["parent"] = newest_prd.get(row["product_prefix"])
+        return rows
 
     def _extract_name_from_filename(self, filename: str) -> str:
         """Extract a display name from the filename."""
@@ -122,14 +560,16 @@ class PRDService:
         name = name.replace("-", " ").title()
         return name
 
+    @metrics.timed_storage("get_prd")
     def get_prd(self, filename: str) -> str:
-        """Get the content of a saved PRD."""
-        filepath = os.path.join(self.output_dir, filename)
-        if os.path.exists(filepath):
-            with open(filepath, "r") as f:
-                return f.read()
-        return None
-
+        """Get the content of a saved PRD, falling back to the archive."""
+        content = self.storage.read_text(filename)
+        if content is None:
+            data = self.archive.read(filename)
+            content = data.decode("utf-8") if data is not None else None
+        return content
+
+    @metrics.timed_storage("append_to_prd")
     def append_to_prd(self, filename: str, content: str) -> bool:
         """
         Append content (like competitive analysis) to an existing PRD.
@@ -141,17 +581,15 @@ class PRDService:
         Returns:
             True if successful, False otherwise
         """
-        filepath = os.path.join(self.output_dir, filename)
-        if not os.path.exists(filepath):
-            return False
-
         try:
-            with open(filepath, "a") as f:
-                f.write("\n\n" + content)
+            if not self.storage.append(filename, ("\n\n" + content).encode("utf-8")):
+                return False
+            self._index_upsert(filename)
             return True
         except Exception:
             return False
 
+    @metrics.timed_storage("save_research")
     def save_research(self, content: str, product_name: str) -> str:
         """
         Save competitive research as a separate markdown file.
@@ -171,7 +609,6 @@ class PRDService:
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
 
         filename = f"{safe_name}-competitive-analysis-{timestamp}.md"
-        filepath = os.path.join(self.output_dir, filename)
 
         # Add header to content
         full_content = f"# {product_name} - Competitive Analysis\n\n"
@@ -179,14 +616,15 @@ class PRDService:
         full_content += "---\n\n"
         full_content += content
 
-        with open(filepath, "w") as f:
-            f.write(full_content)
+        self.storage.write_text(filename, full_content)
+        self._index_upsert(filename)
 
         return filename
 
+    @metrics.timed_storage("archive_prd")
     def archive_prd(self, filename: str) -> bool:
         """
-        Archive a PRD by moving it to the 'old' subdirectory.
+        Archive a PRD by compressing it into the 'old' subdirectory.
 
         Args:
             filename: The PRD filename to archive
@@ -194,18 +632,10 @@ class PRDService:
         Returns:
             True if successful, False otherwise
         """
-        filepath = os.path.join(self.output_dir, filename)
-        if not os.path.exists(filepath):
-            return False
-
-        # Create old directory if it doesn't exist
-        old_dir = os.path.join(self.output_dir, "old")
-        os.makedirs(old_dir, exist_ok=True)
-
-        # Move file to old directory
-        new_filepath = os.path.join(old_dir, filename)
         try:
-            os.rename(filepath, new_filepath)
+            if not self.archive.archive(filename):
+                return False
+            self._index_remove(filename)
             return True
         except Exception:
             return False
@@ -220,22 +650,108 @@ class PRDService:
         Returns:
             Dict with 'success' bool and 'archived' list of filenames
         """
-        archived = []
+        result = self.archive_batch([filename])["results"][0]
+        return {"success": result["success"], "archived": result["archived"]}
+
+    def _research_by_prefix(self, prefixes: set[str]) -> dict:
+        """Research filenames for each product prefix, from one index query."""
+        research = defaultdict(list)
+        try:
+            rows = self.index.research_for(list(prefixes))
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("PRD index read error, scanning storage", extra={"error": str(e)})
+            rows = [row for row in self._scan_rows() if row["kind"] == "research"]
+        for row in rows:
+            if row["product_prefix"] in prefixes:
+                research[row["product_prefix"]].append(row["filename"])
+        return research
+
+    def _archive_file(self, filename: str) -> bool:
+        """Compress one file into the archive without touching the index."""
+        try:
+            return self.archive.archive(filename)
+        except Exception as e:
+            logger.warning("Archive error", extra={"prd": filename, "error": str(e)})
+            return False
+
+    @metrics.timed_storage("archive_batch")
+    def archive_batch(self, filenames: list[str]) -> dict:
+        """
+        Archive several files at once, cascading from PRDs to their research.
 
-        # Get the product prefix for this PRD
-        product_prefix = self._get_product_prefix(filename)
+        Research for every PRD in the batch is resolved with a single index
+        query and the index is updated in one transaction at the end.
+        Research already archived along with an earlier PRD in the batch is
+        reported as successful with nothing archived.
 
-        # Archive the PRD itself
-        if self.archive_prd(filename):
-            archived.append(filename)
-        else:
-            return {"success": False, "archived": []}
+        Args:
+            filenames: PRD and research filenames to archive
+
+        Returns:
+            Dict with per-file 'results' (filename, success, archived list,
+            and an 'error' on failure) and the total number of files 'archived'
+        """
+        research = self._research_by_prefix(
+            {self._get_product_prefix(f) for f in filenames if self._is_prd_file(f)}
+        )
+        results = []
+        done = set()
+        for filename in dict.fromkeys(filenames):
+            if filename in done:
+                results.append({"filename": filename, "success": True, "archived": []})
+                continue
+            if "/" in filename or "\\" in filename:
+                # Only top-level files can be archived
+                results.append({"filename": filename, "success": False, "archived": [], "error": "Invalid filename"})
+                continue
+            archived = []
+            if self._archive_file(filename):
+                archived.append(filename)
+                if self._is_prd_file(filename):
+                    # Research follows its PRD, as in the single-file archive
+                    archived += [
+                        f for f in research[self._get_product_prefix(filename)]
+                        if f not in done and f != filename and self._archive_file(f)
+                    ]
+            done.update(archived)
+            result = {"filename": filename, "success": bool(archived), "archived": archived}
+            if not archived:
+                result["error"] = "Not found"
+            results.append(result)
+
+        if done:
+            self._index_remove(*done)
+        return {"results": results, "archived": len(done)}
+
+    @metrics.timed_storage("restore_prd")
+    def restore_prd(self, filename: str) -> bool:
+        """
+        Restore an archived PRD or research file to the active list.
+
+        Args:
+            filename: The archived filename
+
+        Returns:
+            True if restored, False if it isn't archived or a file with
+            that name is already active
+        """
+        try:
+            if self.storage.exists(filename):
+                return False
+            data = self.archive.read(filename)
+            if data is None:
+                return False
+            self.storage.write_bytes(filename, data)
+            self.archive.remove(filename)
+            self._index_upsert(filename)
+            return True
+        except Exception:
+            return False
 
-        # Find and archive all research files with matching prefix
-        if os.path.exists(self.output_dir):
-            for f in os.listdir(self.output_dir):
-                if self._is_research_file(f) and self._get_product_prefix(f) == product_prefix:
-                    if self.archive_prd(f):
-                        archived.append(f)
+    def pack_archive(self, min_files: int = 1) -> dict:
+        """Bundle loosely archived files into one segment (see PRDArchive.pack)."""
+        return self.archive.pack(min_files)
 
-        return {"success": True, "archived": archived}
+    def archive_stats(self) -> dict:
+        """Size of the archive and the space saved by compressing it."""
+        return self.archive.stats()
@@ -0,0 +1,91 @@
+"""Disk-backed cache for competitor research results."""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from config import RESEARCH_CACHE_DIR, RESEARCH_CACHE_MAX_ENTRIES, RESEARCH_CACHE_TTL
+
+
+class ResearchCache:
+    """
+    TTL cache of research results stored as one JSON file per entry.
+
+    Living on disk, entries survive restarts and are shared by every
+    gunicorn worker on the node. Writes are atomic (temp file + rename), and
+    once the cache holds more than max_entries files the least recently
+    written ones are evicted.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = RESEARCH_CACHE_DIR,
+        ttl: int = RESEARCH_CACHE_TTL,
+        max_entries: int = RESEARCH_CACHE_MAX_ENTRIES
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """Lowercase and collapse whitespace so trivial variations share an entry."""
+        return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+    @classmethod
+    def make_key(cls, *parts: str) -> str:
+        """Build a cache key from normalized parts (e.g. search term, description, model)."""
+        normalized = json.dumps([cls._normalize(part) for part in parts])
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> str:
+        """Return the cached content for key, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("created", 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("content")
+
+    def set(self, key: str, content: str) -> None:
+        """Store content under key, evicting old entries past max_entries."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"created": time.time(), "content": content}, f)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the oldest entries beyond max_entries."""
+        entries = [
+            entry for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".json")
+        ]
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                # Another worker may have evicted it already
+                pass
@@ -1,87 +1,532 @@
 """Research service using Perplexity AI for competitive intelligence."""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import httpx
 import requests
-from config import PERPLEXITY_API_KEY
+from requests.adapters import HTTPAdapter
+from config import (
+    PERPLEXITY_API_KEY,
+    PERPLEXITY_API_URL,
+    PERPLEXITY_DEADLINE,
+    PERPLEXITY_MAX_RETRIES,
+    PERPLEXITY_POOL_SIZE,
+)
+from services import metrics, tracing
+from services.research_cache import ResearchCache
+from services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Rate limiting and transient server errors are worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Sections of the competitive analysis in report order. {product_name} is
+# filled in per request. The parallel mode issues one query per section.
+COMPETITOR_SECTIONS = [
+    ("1. Key Competitors", """For each major competitor, include:
+- **Company/Product Name**
+- **Product URL** (actual links to product pages)
+- **Price** (in USD)
+- **Key Features** (2-3 bullet points)"""),
+    ("2. Pricing Landscape", """- Price ranges by tier (budget, mid-range, premium)
+- Where {product_name} could be positioned"""),
+    ("3. Feature Comparison", """- Standard features across competitors
+- Premium features that command higher prices"""),
+    ("4. Market Gaps & Opportunities", """- What's missing in current offerings
+- Underserved customer segments"""),
+    ("5. Strategic Recommendations", """- Differentiation opportunities
+- Recommended price point with justification"""),
+]
+
+RESEARCH_GUIDELINES = """IMPORTANT:
+- Focus on products available in the US market
+- Include actual URLs as markdown links
+- Include real prices in USD
+- Only include factual information from your search"""
+
+# Completion budget for a single section in parallel mode
+SECTION_MAX_TOKENS = 1200
+
+# One pooled session per process: gunicorn forks workers after import,
+# and sockets must not be shared across a fork
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Return this process's keep-alive session with a bounded connection pool."""
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=PERPLEXITY_POOL_SIZE,
+                    pool_maxsize=PERPLEXITY_POOL_SIZE,
+                    # Retries are handled by ResearchService so they can be timed
+                    max_retries=0
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions.clear()
+                _sessions[pid] = session
+    return session
 
 
 class ResearchService:
     """Service for conducting AI-powered web research on products and markets."""
 
-    def __init__(self):
+    def __init__(self, redis_client=None):
         self.api_key = PERPLEXITY_API_KEY
-        self.api_url = "https://api.perplexity.ai/chat/completions"
+        self.api_url = PERPLEXITY_API_URL
         self.model = "sonar"
+        self.cache = ResearchCache()
+        # Concurrent research for the same cache key shares one report
+        self.flights = SingleFlight(redis_client, prefix="prdy:flight:research:")
+        self.max_retries = PERPLEXITY_MAX_RETRIES
+        self.deadline = PERPLEXITY_DEADLINE
+        self.backoff_base = 0.5
+        self.backoff_max = 8.0
+        # Per-attempt timings of recent upstream calls, newest last
+        self.attempts = deque(maxlen=100)
+        self.counters = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+        # One async client per event loop; a client can't be shared across loops
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def http_stats(self) -> dict:
+        """Retry counters and recent per-attempt timings for the health endpoint."""
+        with self._stats_lock:
+            return {**self.counters, "recent_attempts": list(self.attempts)}
+
+    def _record_attempt(self, attempt: int, started: float, status: int = None, error: str = None) -> None:
+        with self._stats_lock:
+            self.counters["attempts"] += 1
+            if attempt > 0:
+                self.counters["retries"] += 1
+            self.attempts.append({
+                "attempt": attempt + 1,
+                "status": status,
+                "error": error,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+            })
+
+    def _backoff_delay(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Seconds to wait before the next attempt.
+
+        A Retry-After header (seconds or HTTP date) is honored as given;
+        otherwise use exponential backoff with full jitter, capped at
+        backoff_max. _post gives up rather than wait past its deadline.
+        """
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return max(delay, 0.0)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            **tracing.outgoing_headers()
+        }
+
+    def _post(self, payload: dict, timeout: int = 60) -> requests.Response:
+        """
+        POST to Perplexity, retrying transient failures with bounded backoff.
+
+        Only failures where the request never reached Perplexity (connection
+        errors, connect timeouts) and 429/5xx answers are retried: a read
+        timeout may be a completion still being generated and billed. All
+        attempts and waits fit in self.deadline seconds; a wait that would
+        overrun it (e.g. a long Retry-After) ends the retries instead.
+        """
+        session = get_http_session()
+        with self._stats_lock:
+            self.counters["requests"] += 1
+        deadline = time.monotonic() + self.deadline
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                response = session.post(
+                    self.api_url,
+                    headers=self._headers(),
+                    json=payload,
+                    timeout=max(min(timeout, deadline - started), 0.001)
+                )
+            except requests.exceptions.RequestException as e:
+                self._record_attempt(attempt, started, error=type(e).__name__)
+                # ConnectTimeout is a ConnectionError; ReadTimeout is not
+                delay = self._backoff_delay(attempt)
+                if (
+                    not isinstance(e, requests.exceptions.ConnectionError)
+                    or attempt == self.max_retries
+                    or time.monotonic() + delay >= deadline
+                ):
+                    with self._stats_lock:
+                        self.counters["failures"] += 1
+                    raise
+                time.sleep(delay)
+                continue
+
+            self._record_attempt(attempt, started, status=response.status_code)
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response.headers.get("Retry-After"))
+                if time.monotonic() + delay < deadline:
+                    time.sleep(delay)
+                    continue
+            if response.status_code >= 400:
+                with self._stats_lock:
+                    self.counters["failures"] += 1
+            response.raise_for_status()
+            return response
+
+    def _async_http(self) -> httpx.AsyncClient:
+        """This event loop's pooled async client; aclose() closes it."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=PERPLEXITY_POOL_SIZE,
+                max_keepalive_connections=PERPLEXITY_POOL_SIZE
+            ))
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose(self) -> None:
+        """Close this event loop's async client, if it made one."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def _apost(self, payload: dict, timeout: int = 60) -> httpx.Response:
+        """Async counterpart of _post, with the same retries, deadline and stats."""
+        client = self._async_http()
+        with self._stats_lock:
+            self.counters["requests"] += 1
+        deadline = time.monotonic() + self.deadline
 
-    def research_competitors(self, product_name: str, product_description: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                response = await client.post(
+                    self.api_url,
+                    headers=self._headers(),
+                    json=payload,
+                    timeout=max(min(timeout, deadline - started), 0.001)
+                )
+            except httpx.TransportError as e:
+                self._record_attempt(attempt, started, error=type(e).__name__)
+                delay = self._backoff_delay(attempt)
+                if (
+                    not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                    or attempt == self.max_retries
+                    or time.monotonic() + delay >= deadline
+                ):
+                    with self._stats_lock:
+                        self.counters["failures"] += 1
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            self._record_attempt(attempt, started, status=response.status_code)
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response.headers.get("Retry-After"))
+                if time.monotonic() + delay < deadline:
+                    await asyncio.sleep(delay)
+                    continue
+            if response.status_code >= 400:
+                with self._stats_lock:
+                    self.counters["failures"] += 1
+            response.raise_for_status()
+            return response
+
+    def _payload(self, prompt: str, max_tokens: int) -> dict:
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens
+        }
+
+    def _complete(self, prompt: str, max_tokens: int, operation: str) -> str:
+        """Run a single Perplexity completion and return its text."""
+        with metrics.track_upstream("perplexity", operation):
+            response = self._post(self._payload(prompt, max_tokens), timeout=60)
+            data = response.json()
+            return data["choices"][0]["message"]["content"]
+
+    async def _acomplete(self, prompt: str, max_tokens: int, operation: str) -> str:
+        """Async counterpart of _complete."""
+        with metrics.track_upstream("perplexity", operation):
+            response = await self._apost(self._payload(prompt, max_tokens), timeout=60)
+            data = response.json()
+            return data["choices"][0]["message"]["content"]
+
+    def _cache_result(self, cache_key: str, content: str) -> None:
+        # A cache write error shouldn't fail research
+        try:
+            self.cache.set(cache_key, content)
+        except OSError as e:
+            logger.warning("Research cache write error", extra={"error": str(e)})
+
+    def research_competitors(
+        self, product_name: str, product_description: str, force_refresh: bool = False
+    ) -> str:
         """
         Research competitors using Perplexity AI.
 
+        Successful results are cached on disk, keyed on the normalized
+        product name, description and model. Concurrent calls with the
+        same key (in this process or, with Redis, any worker) share one
+        Perplexity query, even when refreshing.
+
         Args:
             product_name: Name/category of the product
             product_description: Brief description of the product
+            force_refresh: Skip the cache and query Perplexity again
 
         Returns:
             Formatted competitive analysis from Perplexity
         """
-        prompt = f"""Research the competitive landscape for: {product_name}
+        cache_key = ResearchCache.make_key(product_name, product_description, self.model)
+        if not force_refresh:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        return self.flights.do(
+            cache_key, "research_competitors", self._research_competitors, cache_key, product_name, product_description
+        )
+
+    def _research_competitors(self, cache_key: str, product_name: str, product_description: str) -> str:
+        try:
+            content = self._complete(
+                self._competitors_prompt(product_name, product_description), max_tokens=4096,
+                operation="research_competitors"
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning("Perplexity API error", extra={"error": str(e)})
+            return f"Research failed: {str(e)}"
+        except (KeyError, IndexError) as e:
+            logger.warning("Perplexity response parsing error", extra={"error": str(e)})
+            return "Research failed: Unable to parse response"
+
+        # Failures above are never cached
+        self._cache_result(cache_key, content)
+        return content
+
+    # Async counterparts share the cache and flights with the methods above.
+    # Cache reads and writes are file I/O, so they run in a thread.
+
+    async def aresearch_competitors(
+        self, product_name: str, product_description: str, force_refresh: bool = False
+    ) -> str:
+        """Async counterpart of research_competitors."""
+        cache_key = ResearchCache.make_key(product_name, product_description, self.model)
+        if not force_refresh:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        return await self.flights.ado(
+            cache_key, "research_competitors", self._aresearch_competitors, cache_key, product_name, product_description
+        )
+
+    async def _aresearch_competitors(self, cache_key: str, product_name: str, product_description: str) -> str:
+        try:
+            content = await self._acomplete(
+                self._competitors_prompt(product_name, product_description), max_tokens=4096,
+                operation="research_competitors"
+            )
+        except httpx.HTTPError as e:
+            logger.warning("Perplexity API error", extra={"error": str(e)})
+            return f"Research failed: {str(e)}"
+        except (KeyError, IndexError) as e:
+            logger.warning("Perplexity response parsing error", extra={"error": str(e)})
+            return "Research failed: Unable to parse response"
+
+        await asyncio.to_thread(self._cache_result, cache_key, content)
+        return content
+
+    @staticmethod
+    def _competitors_prompt(product_name: str, product_description: str) -> str:
+        sections = "\n\n".join(
+            f"## {title}\n{details.format(product_name=product_name)}"
+            for title, details in COMPETITOR_SECTIONS
+        )
+        return f"""Research the competitive landscape for: {product_name}
 
 Product description: {product_description}
 
 Provide a comprehensive competitive analysis with these sections:
 
-## 1. Key Competitors
-For each major competitor, include:
-- **Company/Product Name**
-- **Product URL** (actual links to product pages)
-- **Price** (in USD)
-- **Key Features** (2-3 bullet points)
+{sections}
 
-## 2. Pricing Landscape
-- Price ranges by tier (budget, mid-range, premium)
-- Where {product_name} could be positioned
+{RESEARCH_GUIDELINES}"""
 
-## 3. Feature Comparison
-- Standard features across competitors
-- Premium features that command higher prices
+    def research_competitors_parallel(
+        self, product_name: str, product_description: str, force_refresh: bool = False
+    ) -> dict:
+        """
+        Research competitors with one concurrent Perplexity query per section.
 
-## 4. Market Gaps & Opportunities
-- What's missing in current offerings
-- Underserved customer segments
+        Wall time is bounded by the slowest section rather than one long
+        generation. Sections are merged back in report order under the same
+        headings as research_competitors; a failed section is replaced by a
+        short note instead of failing the whole report. Only complete
+        reports are cached. Concurrent calls are shared as in
+        research_competitors.
 
-## 5. Strategic Recommendations
-- Differentiation opportunities
-- Recommended price point with justification
+        Args:
+            product_name: Name/category of the product
+            product_description: Brief description of the product
+            force_refresh: Skip the cache and query Perplexity again
 
-IMPORTANT:
-- Focus on products available in the US market
-- Include actual URLs as markdown links
-- Include real prices in USD
-- Only include factual information from your search"""
+        Returns:
+            Dict with 'content' (the merged markdown), 'cached' bool and
+            'sections', a list of per-section 'title', 'ok' and 'elapsed_ms'
+        """
+        cache_key = ResearchCache.make_key(product_name, product_description, self.model, "sections")
+        if not force_refresh:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return {"content": cached, "cached": True, "sections": []}
+        return self.flights.do(
+            cache_key, "research_competitors_parallel", self._research_competitors_parallel,
+            cache_key, product_name, product_description
+        )
+
+    def _research_competitors_parallel(self, cache_key: str, product_name: str, product_description: str) -> dict:
+        with ThreadPoolExecutor(max_workers=len(COMPETITOR_SECTIONS)) as pool:
+            # Each section runs in a copy of this context to keep the request's trace
+            futures = [
+                pool.submit(tracing.bind(self._research_section), product_name, product_description, *section)
+                for section in COMPETITOR_SECTIONS
+            ]
+            results = [future.result() for future in futures]
+        return self._merge_sections(cache_key, results)
+
+    async def aresearch_competitors_parallel(
+        self, product_name: str, product_description: str, force_refresh: bool = False
+    ) -> dict:
+        """Async counterpart of research_competitors_parallel, with the sections on one event loop."""
+        cache_key = ResearchCache.make_key(product_name, product_description, self.model, "sections")
+        if not force_refresh:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return {"content": cached, "cached": True, "sections": []}
+        return await self.flights.ado(
+            cache_key, "research_competitors_parallel", self._aresearch_competitors_parallel,
+            cache_key, product_name, product_description
+        )
+
+    async def _aresearch_competitors_parallel(
+        self, cache_key: str, product_name: str, product_description: str
+    ) -> dict:
+        results = await asyncio.gather(*(
+            self._aresearch_section(product_name, product_description, *section)
+            for section in COMPETITOR_SECTIONS
+        ))
+        return await asyncio.to_thread(self._merge_sections, cache_key, list(results))
+
+    def _merge_sections(self, cache_key: str, results: list[dict]) -> dict:
+        """Merge per-section results in report order, caching complete reports."""
+        failed = [result for result in results if not result["ok"]]
+        if len(failed) == len(results):
+            return {
+                "content": f"Research failed: {failed[0]['error']}",
+                "cached": False,
+                "sections": [self._section_timing(result) for result in results]
+            }
+
+        content = "\n\n".join(
+            f"## {result['title']}\n{result['content']}" if result["ok"]
+            else f"## {result['title']}\n_This section could not be researched ({result['error']})._"
+            for result in results
+        )
+        if not failed:
+            self._cache_result(cache_key, content)
+
+        return {
+            "content": content,
+            "cached": False,
+            "sections": [self._section_timing(result) for result in results]
+        }
+
+    @staticmethod
+    def _section_prompt(product_name: str, product_description: str, title: str, details: str) -> str:
+        return f"""Research the competitive landscape for: {product_name}
+
+Product description: {product_description}
+
+Write only the "{title}" section of a competitive analysis, covering:
+{details.format(product_name=product_name)}
+
+Start directly with the content and do not repeat the section heading.
 
+{RESEARCH_GUIDELINES}"""
+
+    def _research_section(self, product_name: str, product_description: str, title: str, details: str) -> dict:
+        """Research one report section; never raises."""
+        prompt = self._section_prompt(product_name, product_description, title, details)
+        started = time.monotonic()
         try:
-            response = requests.post(
-                self.api_url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "max_tokens": 4096
-                },
-                timeout=60
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+            content = self._complete(prompt, max_tokens=SECTION_MAX_TOKENS, operation="research_section")
+            error = None
         except requests.exceptions.RequestException as e:
-            print(f"Perplexity API error: {e}")
-            return f"Research failed: {str(e)}"
+            logger.warning("Perplexity API error", extra={"section": title, "error": str(e)})
+            content, error = None, str(e)
         except (KeyError, IndexError) as e:
-            print(f"Perplexity response parsing error: {e}")
-            return "Research failed: Unable to parse response"
+            logger.warning("Perplexity response parsing error", extra={"section": title, "error": str(e)})
+            content, error = None, "Unable to parse response"
+        return self._section_result(title, content, error, started)
+
+    async def _aresearch_section(self, product_name: str, product_description: str, title: str, details: str) -> dict:
+        """Async counterpart of _research_section; never raises."""
+        prompt = self._section_prompt(product_name, product_description, title, details)
+        started = time.monotonic()
+        try:
+            content = await self._acomplete(prompt, max_tokens=SECTION_MAX_TOKENS, operation="research_section")
+            error = None
+        except httpx.HTTPError as e:
+            logger.warning("Perplexity API error", extra={"section": title, "error": str(e)})
+            content, error = None, str(e)
+        except (KeyError, IndexError) as e:
+            logger.warning("Perplexity response parsing error", extra={"section": title, "error": str(e)})
+            content, error = None, "Unable to parse response"
+        return self._section_result(title, content, error, started)
+
+    @staticmethod
+    def _section_result(title: str, content: str, error: str, started: float) -> dict:
+        return {
+            "title": title,
+            "ok": error is None,
+            "content": content,
+            "error": error,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+    @staticmethod
+    def _section_timing(result: dict) -> dict:
+        return {key: result[key] for key in ("title", "ok", "elapsed_ms")}
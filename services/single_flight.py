@@ -0,0 +1,244 @@
+"""Coalescing of identical concurrent calls (single-flight)."""
+import asyncio
+import copy
+import json
+import logging
+import threading
+import time
+import uuid
+import weakref
+from redis.exceptions import RedisError
+from config import SINGLE_FLIGHT_LOCK_TTL, SINGLE_FLIGHT_POLL_INTERVAL
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Poll outcomes while another worker holds the lock
+_RUNNING = object()
+_RETRY = object()
+
+
+class _Lock:
+    """A Redis lock token, and whether this worker holds it."""
+
+    def __init__(self, token: str, held: bool):
+        self.token = token
+        self.held = held
+
+
+class _Flight:
+    """One in-process call and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Share one call among concurrent callers asking for the same key.
+
+    The first caller for a key runs the function; callers arriving while
+    it runs wait and get its result (or its exception) instead of making
+    the same upstream call again. Nothing is kept once the call finishes:
+    caching is the caller's business.
+
+    With a Redis client the call is also shared across gunicorn workers.
+    The running worker holds a lock (SET NX, expiring after lock_ttl
+    seconds) and publishes its JSON-serializable result under the lock's
+    token; other workers poll for that result. If the holder fails or dies
+    without publishing, the next waiter takes the lock and runs the call
+    itself. Redis errors are logged and the call runs unshared.
+
+    ado() does the same for coroutines on an event loop, making its Redis
+    calls in a thread.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        prefix: str = "prdy:flight:",
+        lock_ttl: int = SINGLE_FLIGHT_LOCK_TTL,
+        poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL
+    ):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+        # Async callers share futures, which belong to one event loop
+        self._async_flights = weakref.WeakKeyDictionary()
+
+    def do(self, key: str, operation: str, fn, *args, **kwargs):
+        """
+        Return fn(*args, **kwargs), sharing it with concurrent calls for key.
+
+        operation labels the coalesced-call metric (e.g. "research_competitors").
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            metrics.COALESCED.labels(operation, "process").inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # Each caller gets its own copy to modify
+            return copy.deepcopy(flight.value)
+
+        try:
+            flight.value = self._run_shared(key, operation, fn, args, kwargs)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def ado(self, key: str, operation: str, fn, *args, **kwargs):
+        """Async counterpart of do; fn is a coroutine function."""
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        future = flights.get(key)
+        while future is not None:
+            # A cancelled waiter mustn't cancel the call the others wait for
+            value = await asyncio.shield(future)
+            if value is not _RETRY:
+                metrics.COALESCED.labels(operation, "process").inc()
+                return copy.deepcopy(value)
+            # The leader was cancelled: the next waiter runs the call itself
+            future = flights.get(key)
+
+        future = flights[key] = loop.create_future()
+        try:
+            value = await self._arun_shared(key, operation, fn, args, kwargs)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here so a failure nobody waited for isn't logged as lost
+            future.exception()
+            raise
+        finally:
+            del flights[key]
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.prefix}lock:{key}"
+
+    def _result_key(self, key: str, token: str) -> str:
+        return f"{self.prefix}result:{key}:{token}"
+
+    def _run_shared(self, key: str, operation: str, fn, args, kwargs):
+        """Run fn here, or wait for the worker already running it."""
+        while True:
+            lock = self._acquire(key)
+            if lock is None:
+                return fn(*args, **kwargs)
+            if lock.held:
+                try:
+                    value = fn(*args, **kwargs)
+                except BaseException:
+                    self._release(key, lock.token)
+                    raise
+                self._publish(key, lock.token, value)
+                return value
+            value = self._poll(key, lock.token)
+            while value is _RUNNING:
+                time.sleep(self.poll_interval)
+                value = self._poll(key, lock.token)
+            if value is not _RETRY:
+                metrics.COALESCED.labels(operation, "redis").inc()
+                return value
+
+    async def _arun_shared(self, key: str, operation: str, fn, args, kwargs):
+        """Async counterpart of _run_shared; Redis calls run in a thread."""
+        if self.redis is None:
+            return await fn(*args, **kwargs)
+        while True:
+            lock = await asyncio.to_thread(self._acquire, key)
+            if lock is None:
+                return await fn(*args, **kwargs)
+            if lock.held:
+                try:
+                    value = await fn(*args, **kwargs)
+                except BaseException:
+                    await asyncio.to_thread(self._release, key, lock.token)
+                    raise
+                await asyncio.to_thread(self._publish, key, lock.token, value)
+                return value
+            value = await asyncio.to_thread(self._poll, key, lock.token)
+            while value is _RUNNING:
+                await asyncio.sleep(self.poll_interval)
+                value = await asyncio.to_thread(self._poll, key, lock.token)
+            if value is not _RETRY:
+                metrics.COALESCED.labels(operation, "redis").inc()
+                return value
+
+    def _holder(self, key: str) -> str:
+        holder = self.redis.get(self._lock_key(key))
+        return holder.decode() if isinstance(holder, bytes) else holder
+
+    def _acquire(self, key: str):
+        """
+        Take the Redis lock for key, or learn who holds it.
+
+        Returns None to run unshared (no Redis, or it failed), otherwise a
+        _Lock that this worker either holds or should wait on.
+        """
+        if self.redis is None:
+            return None
+        token = uuid.uuid4().hex
+        try:
+            while True:
+                if self.redis.set(self._lock_key(key), token, nx=True, ex=self.lock_ttl):
+                    return _Lock(token, held=True)
+                holder = self._holder(key)
+                if holder is not None:
+                    return _Lock(holder, held=False)
+                # Released between the two calls; try again
+        except RedisError as e:
+            logger.warning("Single-flight Redis error", extra={"error": str(e)})
+            return None
+
+    def _publish(self, key: str, token: str, value) -> None:
+        """Hand this worker's result to the waiters and release the lock."""
+        try:
+            self.redis.set(self._result_key(key, token), json.dumps(value), ex=self.lock_ttl)
+        except (RedisError, TypeError, ValueError) as e:
+            logger.warning("Single-flight publish error", extra={"error": str(e)})
+        self._release(key, token)
+
+    def _release(self, key: str, token: str) -> None:
+        try:
+            # Only release our own lock; it may have expired and been retaken
+            if self._holder(key) == token:
+                self.redis.delete(self._lock_key(key))
+        except RedisError as e:
+            logger.warning("Single-flight Redis error", extra={"error": str(e)})
+
+    def _poll(self, key: str, token: str):
+        """
+        The result published under token, _RUNNING while the holder still
+        runs, or _RETRY once it released the lock without publishing.
+        """
+        try:
+            data = self.redis.get(self._result_key(key, token))
+            if data is None:
+                if self._holder(key) == token:
+                    return _RUNNING
+                # It may have published just before releasing
+                data = self.redis.get(self._result_key(key, token))
+        except RedisError as e:
+            logger.warning("Single-flight Redis error", extra={"error": str(e)})
+            return _RETRY
+        return json.loads(data) if data is not None else _RETRY
@@ -0,0 +1,571 @@
+"""Pluggable storage for saved PRDs and research files."""
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from config import (
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_PREFIX,
+    STORAGE_BACKEND,
+    STORAGE_SQLITE_PATH,
+)
+
+# Chunk size for streaming reads, and the in-memory limit before buffered
+# writes spill to a temp file
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Archived files live under this name prefix
+ARCHIVE_PREFIX = "old/"
+
+
+@dataclass
+class StorageEntry:
+    """A stored file. size and mtime may be None when listing doesn't provide them."""
+    name: str
+    size: int = None
+    mtime: float = None
+
+
+class StorageWriter(ABC):
+    """
+    Streaming write that only becomes visible under its final name on commit().
+
+    Used as a context manager, an uncommitted writer discards its data.
+    """
+
+    @abstractmethod
+    def write(self, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def commit(self, name: str) -> None:
+        ...
+
+    @abstractmethod
+    def abort(self) -> None:
+        ...
+
+    def __enter__(self) -> "StorageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not getattr(self, "committed", False):
+            self.abort()
+
+
+class SpooledWriter(StorageWriter):
+    """Buffer a write in memory (spilling to disk) and hand it to upload() on commit."""
+
+    def __init__(self, upload):
+        self._upload = upload
+        self._buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self.committed = False
+
+    def write(self, data: bytes) -> None:
+        self._buffer.write(data)
+
+    def commit(self, name: str) -> None:
+        size = self._buffer.tell()
+        self._buffer.seek(0)
+        try:
+            self._upload(name, self._buffer, size)
+        finally:
+            self._buffer.close()
+        self.committed = True
+
+    def abort(self) -> None:
+        self._buffer.close()
+
+
+class Storage(ABC):
+    """
+    Interface for PRD storage.
+
+    Names are flat file names ("taskflow-prd-20240113-120000.md"); archived
+    files live under ARCHIVE_PREFIX. Reads and writes are binary and can be
+    streamed; the *_text helpers cover the common whole-document cases.
+    Missing files read as None.
+    """
+
+    @abstractmethod
+    def open_read(self, name: str):
+        """Binary file-like object for name, or None if it doesn't exist."""
+
+    @abstractmethod
+    def open_writer(self) -> StorageWriter:
+        ...
+
+    @abstractmethod
+    def append(self, name: str, data: bytes) -> bool:
+        """Append to an existing file; False if it doesn't exist."""
+
+    @abstractmethod
+    def move(self, name: str, new_name: str) -> bool:
+        """Rename a file; False if it doesn't exist."""
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        ...
+
+    @abstractmethod
+    def stat(self, name: str) -> StorageEntry:
+        """Size and mtime of name, or None if it doesn't exist."""
+
+    @abstractmethod
+    def iter_entries(self, prefix: str = "") -> Iterator[list[StorageEntry]]:
+        """
+        Yield batches of entries whose names start with prefix.
+
+        Only names without a "/" after the prefix are listed, so the
+        top level excludes archived files.
+        """
+
+    @abstractmethod
+    def change_token(self) -> str:
+        """Value that changes whenever top-level files are added or removed."""
+
+    def exists(self, name: str) -> bool:
+        return self.stat(name) is not None
+
+    def list_names(self, prefix: str = "") -> list[str]:
+        return [entry.name for batch in self.iter_entries(prefix) for entry in batch]
+
+    def read_bytes(self, name: str) -> bytes:
+        stream = self.open_read(name)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
+
+    def read_range(self, name: str, offset: int, length: int) -> bytes:
+        """length bytes of name starting at offset, or None if it doesn't exist."""
+        stream = self.open_read(name)
+        if stream is None:
+            return None
+        with stream:
+            stream.seek(offset)
+            return stream.read(length)
+
+    def read_text(self, name: str) -> str:
+        data = self.read_bytes(name)
+        return data.decode("utf-8") if data is not None else None
+
+    def iter_chunks(self, name: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Stream a file's content without holding it all in memory."""
+        stream = self.open_read(name)
+        if stream is None:
+            return
+        with stream:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def write_bytes(self, name: str, data: bytes | Iterable[bytes]) -> None:
+        with self.open_writer() as writer:
+            for chunk in ([data] if isinstance(data, bytes) else data):
+                writer.write(chunk)
+            writer.commit(name)
+
+    def write_text(self, name: str, text: str) -> None:
+        self.write_bytes(name, text.encode("utf-8"))
+
+
+class FilesystemWriter(StorageWriter):
+    """Write to a temp file in the target directory and rename it into place."""
+
+    def __init__(self, root: str):
+        self.root = root
+        fd, self.temp_path = tempfile.mkstemp(prefix=".prd-", suffix=".tmp", dir=root)
+        self._file = os.fdopen(fd, "wb")
+        self.committed = False
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        # Flush so a crash leaves as much as possible in the temp file
+        self._file.flush()
+
+    def commit(self, name: str) -> None:
+        self._file.close()
+        os.makedirs(os.path.dirname(os.path.join(self.root, name)), exist_ok=True)
+        os.replace(self.temp_path, os.path.join(self.root, name))
+        self.committed = True
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class FilesystemStorage(Storage):
+    """Files in a local directory (the default; a Railway volume in production)."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def open_read(self, name: str):
+        try:
+            return open(self._path(name), "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def open_writer(self) -> StorageWriter:
+        return FilesystemWriter(self.root)
+
+    def append(self, name: str, data: bytes) -> bool:
+        if not os.path.isfile(self._path(name)):
+            return False
+        with open(self._path(name), "ab") as f:
+            f.write(data)
+        return True
+
+    def move(self, name: str, new_name: str) -> bool:
+        if not os.path.isfile(self._path(name)):
+            return False
+        os.makedirs(os.path.dirname(self._path(new_name)), exist_ok=True)
+        os.rename(self._path(name), self._path(new_name))
+        return True
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def stat(self, name: str) -> StorageEntry:
+        try:
+            stat = os.stat(self._path(name))
+        except FileNotFoundError:
+            return None
+        return StorageEntry(name, stat.st_size, stat.st_mtime)
+
+    def iter_entries(self, prefix: str = "", batch_size: int = 1000) -> Iterator[list[StorageEntry]]:
+        # Names only: callers stat the entries they actually need
+        directory, _, name_prefix = prefix.rpartition("/")
+        path = os.path.join(self.root, directory)
+        if not os.path.isdir(path):
+            return
+        batch = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                # Dot files are in-progress writes and the index, not stored files
+                if entry.name.startswith(name_prefix) and not entry.name.startswith(".") and entry.is_file():
+                    batch.append(StorageEntry(f"{directory}/{entry.name}" if directory else entry.name))
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def change_token(self) -> str:
+        return str(os.stat(self.root).st_mtime_ns)
+
+
+class SQLiteBlobReader:
+    """Read a stored blob incrementally, closing its connection when done."""
+
+    def __init__(self, conn, blob):
+        self._conn = conn
+        self._blob = blob
+
+    def read(self, size: int = -1) -> bytes:
+        return self._blob.read(size)
+
+    def seek(self, offset: int) -> None:
+        self._blob.seek(offset)
+
+    def close(self) -> None:
+        self._blob.close()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    Files as blobs in one SQLite database.
+
+    Blobs are streamed in and out with incremental blob I/O. A generation
+    counter, bumped on every change, is the change token.
+    """
+
+    def __init__(self, path: str = STORAGE_SQLITE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    name TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS storage_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def _bump(conn) -> None:
+        conn.execute(
+            "INSERT INTO storage_meta (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    def open_read(self, name: str):
+        conn = self._connect()
+        row = conn.execute("SELECT rowid FROM blobs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            conn.close()
+            return None
+        return SQLiteBlobReader(conn, conn.blobopen("blobs", "data", row[0], readonly=True))
+
+    def _upload(self, name: str, stream, size: int) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM blobs WHERE name = ?", (name,))
+                rowid = conn.execute(
+                    "INSERT INTO blobs (name, data, size, mtime) VALUES (?, zeroblob(?), ?, ?)",
+                    (name, size, size, time.time())
+                ).lastrowid
+                with conn.blobopen("blobs", "data", rowid) as blob:
+                    while True:
+                        chunk = stream.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        blob.write(chunk)
+                self._bump(conn)
+        finally:
+            conn.close()
+
+    def open_writer(self) -> StorageWriter:
+        return SpooledWriter(self._upload)
+
+    def append(self, name: str, data: bytes) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                updated = conn.execute(
+                    "UPDATE blobs SET data = CAST(data || ? AS BLOB), size = size + ?, mtime = ? "
+                    "WHERE name = ?",
+                    (data, len(data), time.time(), name)
+                ).rowcount
+                if updated:
+                    self._bump(conn)
+            return bool(updated)
+        finally:
+            conn.close()
+
+    def move(self, name: str, new_name: str) -> bool:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM blobs WHERE name = ?", (new_name,))
+                moved = conn.execute(
+                    "UPDATE blobs SET name = ? WHERE name = ?", (new_name, name)
+                ).rowcount
+                if moved:
+                    self._bump(conn)
+            return bool(moved)
+        finally:
+            conn.close()
+
+    def delete(self, name: str) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                if conn.execute("DELETE FROM blobs WHERE name = ?", (name,)).rowcount:
+                    self._bump(conn)
+        finally:
+            conn.close()
+
+    def stat(self, name: str) -> StorageEntry:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT size, mtime FROM blobs WHERE name = ?", (name,)).fetchone()
+        finally:
+            conn.close()
+        return StorageEntry(name, row[0], row[1]) if row else None
+
+    def iter_entries(self, prefix: str = "", batch_size: int = 1000) -> Iterator[list[StorageEntry]]:
+        # Keyset pagination so a long listing never holds a read transaction open
+        after = ""
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        while True:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT name, size, mtime FROM blobs "
+                    "WHERE name LIKE ? ESCAPE '\\' AND instr(substr(name, ?), '/') = 0 AND name > ? "
+                    "ORDER BY name LIMIT ?",
+                    (f"{pattern}%", len(prefix) + 1, after, batch_size)
+                ).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                return
+            yield [StorageEntry(*row) for row in rows]
+            after = rows[-1][0]
+
+    def change_token(self) -> str:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM storage_meta WHERE key = 'generation'").fetchone()
+        finally:
+            conn.close()
+        return str(row[0] if row else 0)
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket (AWS S3, MinIO, R2, ...).
+
+    Credentials come from the standard AWS environment variables. S3 has
+    no append or rename, so append() rewrites the object and move() is a
+    copy plus delete. Every change also rewrites a small marker object whose
+    ETag serves as the change token, so other instances notice new files
+    with a single HEAD request.
+    """
+
+    MARKER = ".prdy-generation"
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: str = S3_ENDPOINT_URL, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self._errors = client.exceptions
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _touch(self) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(self.MARKER), Body=uuid.uuid4().hex.encode())
+
+    def open_read(self, name: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"]
+        except self._errors.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def read_range(self, name: str, offset: int, length: int) -> bytes:
+        # A ranged GET instead of reading the object from the start
+        try:
+            body = self.client.get_object(
+                Bucket=self.bucket, Key=self._key(name), Range=f"bytes={offset}-{offset + length - 1}"
+            )["Body"]
+        except self._errors.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        with body:
+            return body.read()
+
+    def _upload(self, name: str, stream, size: int) -> None:
+        # upload_fileobj switches to a multipart upload for large bodies
+        self.client.upload_fileobj(stream, self.bucket, self._key(name))
+        self._touch()
+
+    def open_writer(self) -> StorageWriter:
+        return SpooledWriter(self._upload)
+
+    def append(self, name: str, data: bytes) -> bool:
+        existing = self.read_bytes(name)
+        if existing is None:
+            return False
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=existing + data)
+        self._touch()
+        return True
+
+    def move(self, name: str, new_name: str) -> bool:
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=self._key(new_name),
+                CopySource={"Bucket": self.bucket, "Key": self._key(name)}
+            )
+        except self._errors.ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+        self._touch()
+        return True
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+        self._touch()
+
+    def stat(self, name: str) -> StorageEntry:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except self._errors.ClientError as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return StorageEntry(name, head["ContentLength"], head["LastModified"].timestamp())
+
+    def iter_entries(self, prefix: str = "") -> Iterator[list[StorageEntry]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        start = len(self.prefix)
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix), Delimiter="/"):
+            batch = [
+                StorageEntry(obj["Key"][start:], obj["Size"], obj["LastModified"].timestamp())
+                for obj in page.get("Contents", [])
+                if obj["Key"][start:] != self.MARKER
+            ]
+            if batch:
+                yield batch
+
+    def change_token(self) -> str:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(self.MARKER))["ETag"]
+        except self._errors.ClientError as e:
+            if self._is_missing(e):
+                return "0"
+            raise
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    """
+    Storage for the configured backend.
+
+    Returns None for "filesystem": PRDService then stores files under its
+    output_dir.
+    """
+    if backend == "sqlite":
+        return SQLiteStorage(STORAGE_SQLITE_PATH)
+    if backend == "s3":
+        if not S3_BUCKET:
+            raise ValueError("S3_BUCKET is required when STORAGE_BACKEND=s3")
+        return S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+    if backend != "filesystem":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return None
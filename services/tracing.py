@@ -0,0 +1,354 @@
+"""
+Request tracing and structured JSON logs.
+
+Each request gets a route span; upstream calls and storage operations open
+child spans (see services.metrics), so a slow request breaks down into
+where its time went. The current span and request ID live in ContextVars:
+threads started on a request's behalf run their work through bind() to
+inherit them.
+
+Finished spans go to the exporter picked by TRACE_EXPORTER: "file" appends
+one JSON object per line to TRACE_FILE, "otlp" posts OTLP/HTTP JSON batches
+to OTEL_EXPORTER_OTLP_ENDPOINT (a collector, or anything accepting
+/v1/traces). Without one, spans are still created so logs carry trace IDs.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import requests
+from config import (
+    LOG_FORMAT,
+    LOG_LEVEL,
+    OTEL_EXPORTER_OTLP_ENDPOINT,
+    OTEL_SERVICE_NAME,
+    TRACE_EXPORTER,
+    TRACE_FILE,
+)
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("prdy_span", default=None)
+_request_id = contextvars.ContextVar("prdy_request_id", default=None)
+
+# W3C trace context: version-traceid-parentid-flags
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+# OTLP span kinds and status codes
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+STATUS_CODES = {"ok": 1, "error": 2, "cancelled": 2}
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: str = "internal",
+                 attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.request_id = _request_id.get()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "ok"
+        self.error = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return round((end - self.start_ns) / 1e6, 3)
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "request_id": self.request_id,
+            "start": datetime.fromtimestamp(self.start_ns / 1e9, timezone.utc).isoformat(),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class FileExporter:
+    """Append finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def flush(self) -> None:
+        pass
+
+
+class OTLPExporter:
+    """
+    Send finished spans to an OTLP/HTTP collector as JSON.
+
+    Spans are buffered and posted from a background thread every
+    `interval` seconds, or as soon as `batch_size` are waiting. A failed
+    post is logged and the batch dropped; tracing never fails a request.
+    """
+
+    def __init__(self, endpoint: str, service_name: str = OTEL_SERVICE_NAME,
+                 batch_size: int = 256, interval: float = 2.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self._spans = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            full = len(self._spans) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prdy-otlp", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return
+        try:
+            requests.post(self.url, json=self.payload(spans), timeout=5).raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.warning("OTLP export failed", extra={"spans": len(spans), "error": str(e)})
+
+    def payload(self, spans: list[Span]) -> dict:
+        """An OTLP ExportTraceServiceRequest in its JSON encoding."""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "prdy"},
+                    "spans": [self._otlp_span(span) for span in spans]
+                }]
+            }]
+        }
+
+    @staticmethod
+    def _otlp_span(span: Span) -> dict:
+        attributes = dict(span.attributes)
+        if span.request_id:
+            attributes["request.id"] = span.request_id
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": SPAN_KINDS[span.kind],
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(attributes),
+            "status": {"code": STATUS_CODES[span.status], "message": span.error or ""}
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        encoded.append({"key": key, "value": typed})
+    return encoded
+
+
+def create_exporter(name: str = TRACE_EXPORTER):
+    """The exporter for a TRACE_EXPORTER value, or None to export nothing."""
+    if not name:
+        return None
+    if name == "file":
+        return FileExporter(TRACE_FILE)
+    if name == "otlp":
+        return OTLPExporter(OTEL_EXPORTER_OTLP_ENDPOINT)
+    raise ValueError(f"Unknown trace exporter: {name}")
+
+
+exporter = create_exporter()
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if exporter is not None:
+        exporter.flush()
+
+
+def current_span() -> Span:
+    return _current_span.get()
+
+
+def request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(value: str) -> None:
+    _request_id.set(value)
+
+
+def activate(span: Span) -> None:
+    """Make span the parent of spans started in this context (None clears it)."""
+    _current_span.set(span)
+
+
+def parse_traceparent(header: str) -> tuple[str, str]:
+    """(trace_id, parent span_id) from a W3C traceparent header, or (None, None)."""
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    return match.groups() if match else (None, None)
+
+
+def start_span(name: str, kind: str = "internal", trace_id: str = None, parent_id: str = None,
+               **attributes) -> Span:
+    """
+    Start a span under the current one (or trace_id/parent_id, e.g. from an
+    incoming traceparent). It isn't made current; finish() it when done.
+    """
+    parent = _current_span.get()
+    if trace_id is None and parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    return Span(name, trace_id or secrets.token_hex(16), parent_id, kind, attributes)
+
+
+def finish(span: Span) -> None:
+    span.end_ns = time.time_ns()
+    if exporter is not None:
+        try:
+            exporter.export(span)
+        except OSError as e:
+            logger.warning("Span export failed", extra={"error": str(e)})
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Trace the enclosed block as a child of the current span."""
+    current = start_span(name, kind, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except GeneratorExit:
+        # A streaming generator closed before it finished
+        current.status = "cancelled"
+        raise
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A generator finished from another context; nothing to restore
+            pass
+        finish(current)
+
+
+def outgoing_headers() -> dict:
+    """X-Request-ID and traceparent headers for a call made on this request's behalf."""
+    headers = {}
+    if _request_id.get():
+        headers["X-Request-ID"] = _request_id.get()
+    if _current_span.get() is not None:
+        headers["traceparent"] = _current_span.get().traceparent
+    return headers
+
+
+def bind(fn):
+    """fn wrapped to run in a copy of this context, for another thread."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
+
+
+# LogRecord attributes; anything else on a record came from extra=
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per log line, with the request and trace it belongs to."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if _request_id.get():
+            entry["request_id"] = _request_id.get()
+        current = _current_span.get()
+        if current is not None:
+            entry["trace_id"] = current.trace_id
+            entry["span_id"] = current.span_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Send the app's logs to stderr, as JSON lines unless fmt is "text"."""
+    root = logging.getLogger()
+    if any(getattr(handler, "_prdy", False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler._prdy = True
+    if fmt == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level.upper())
@@ -0,0 +1,54 @@
+"""Build zip archives on the fly as a stream of bytes."""
+import zipfile
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+
+
+class _ZipSink:
+    """
+    Write-only buffer zipfile writes into; drain() hands out what it has.
+
+    It has no seek() or tell(), so zipfile writes sizes and CRCs in data
+    descriptors after each member instead of going back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(members: Iterable[tuple[str, float, int, Iterable[bytes]]]) -> Iterator[bytes]:
+    """
+    Yield a deflated zip of members without holding it in memory.
+
+    Args:
+        members: (arcname, mtime, size, chunks) for each file. size may be
+            None; it only decides whether zip64 extensions are needed.
+            chunks is consumed lazily, so only one chunk per file is in
+            memory at a time.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, mtime, size, chunks in members:
+            info = zipfile.ZipInfo(arcname, date_time=datetime.fromtimestamp(mtime).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = size or 0
+            with archive.open(info, "w") as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
@@ -17,6 +17,8 @@ const sidebarToggle = document.getElementById('sidebar-toggle');
 const prdsList = document.getElementById('prds-list');
 const prdsCount = document.getElementById('prds-count');
 const noPrds = document.getElementById('no-prds');
+const prdSearch = document.getElementById('prd-search');
+const prdSearchResults = document.getElementById('prd-search-results');
 const navNew = document.getElementById('nav-new');
 const navPrds = document.getElementById('nav-prds');
 const navHelp = document.getElementById('nav-help');
@@ -26,6 +28,7 @@ const navResearch = document.getElementById('nav-research');
 const researchModal = document.getElementById('research-modal');
 const researchModalClose = document.getElementById('research-modal-close');
 const researchSource = document.getElementById('research-source');
+const researchForceRefresh = document.getElementById('research-force-refresh');
 const runContextResearchBtn = document.getElementById('run-context-research');
 const researchCustomQuery = document.getElementById('research-custom-query');
 const runCustomResearchBtn = document.getElementById('run-custom-research');
@@ -46,6 +49,7 @@ let currentResearchData = null;
 const selectToggle = document.getElementById('select-toggle');
 const bulkActions = document.getElementById('bulk-actions');
 const archiveSelectedBtn = document.getElementById('archive-selected');
+const exportSelectedBtn = document.getElementById('export-selected');
 
 let messageCount = 0;
 let currentPrdContent = '';
@@ -106,7 +110,7 @@ researchModal.addEventListener('click', function(e) {
 runContextResearchBtn.addEventListener('click', async function() {
     const source = researchSource.value;
     researchModal.classList.add('hidden');
-    await runContextResearch(source);
+    await runContextResearch(source, researchForceRefresh.checked);
 });
 
 // Run custom research
@@ -161,7 +165,7 @@ confirmSavePrdBtn.addEventListener('click', async function() {
 
 async function populateResearchDropdown() {
     try {
-        const response = await fetch('/api/prds');
+        const response = await fetch('/api/prds?fields=filename,name,date');
         const data = await response.json();
 
         // Reset dropdown
@@ -183,7 +187,7 @@ async function populateResearchDropdown() {
 
 async function populateSavePrdDropdown() {
     try {
-        const response = await fetch('/api/prds');
+        const response = await fetch('/api/prds?fields=filename,name,date');
         const data = await response.json();
 
         savePrdSelect.innerHTML = '';
@@ -201,25 +205,36 @@ async function populateSavePrdDropdown() {
     }
 }
 
-async function runContextResearch(source) {
+async function runContextResearch(source, forceRefresh = false) {
     showLoading('Analyzing and researching competitors...');
 
     try {
-        const response = await fetch('/api/research/context', {
+        // Research runs as a background job; poll until it finishes
+        const response = await fetch('/api/jobs/research', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ source: source })
+            body: JSON.stringify({ source: source, force_refresh: forceRefresh })
         });
 
-        const data = await response.json();
+        const submitted = await response.json();
 
         if (!response.ok) {
-            addMessage(data.message || data.error || 'Research failed', 'assistant');
+            addMessage(submitted.message || submitted.error || 'Research failed', 'assistant');
+            return;
+        }
+
+        const job = await pollJob(submitted.job_id);
+
+        if (job.status !== 'succeeded') {
+            const error = job.error || {};
+            addMessage(error.message || error.error || 'Research failed', 'assistant');
             return;
         }
 
+        const data = job.result;
+
         // Store research data for saving
         currentResearchData = {
             analysis: data.analysis,
@@ -256,6 +271,22 @@ async function runContextResearch(source) {
     }
 }
 
+// Poll a background job until it succeeds or fails
+async function pollJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const response = await fetch(`/api/jobs/${encodeURIComponent(jobId)}`);
+        const job = await response.json();
+
+        if (!response.ok) {
+            return { status: 'failed', error: job };
+        }
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 async function runCustomSearch(query) {
     showLoading('Searching...');
 
@@ -375,12 +406,15 @@ chatForm.addEventListener('submit', async function(e) {
     messageInput.value = '';
     messageInput.style.height = 'auto';
 
-    // Show loading
+    // Show loading until the first token arrives
     showLoading('Thinking...');
     sendBtn.disabled = true;
 
+    let replyContent = null;
+    let replyText = '';
+
     try {
-        const response = await fetch('/api/chat', {
+        const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -388,19 +422,35 @@ chatForm.addEventListener('submit', async function(e) {
             body: JSON.stringify({ message })
         });
 
-        const data = await response.json();
-
-        if (data.error) {
-            addMessage('Error: ' + data.error, 'assistant');
-        } else {
-            addMessage(data.response, 'assistant');
-            messageCount = data.message_count;
+        if (!response.ok) {
+            const data = await response.json();
+            addMessage('Error: ' + (data.error || 'Request failed'), 'assistant');
+            return;
+        }
 
-            // Enable generate button after a few exchanges
-            if (messageCount >= 4) {
-                generateBtn.disabled = false;
+        await readEventStream(response, event => {
+            if (event.type === 'delta') {
+                if (!replyContent) {
+                    hideLoading();
+                    replyContent = addMessage('', 'assistant');
+                }
+                replyText += event.text;
+                renderMessageContent(replyContent, replyText);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (event.type === 'error') {
+                if (replyContent) {
+                    replyContent.parentElement.remove();
+                }
+                addMessage('Error: ' + event.error, 'assistant');
+            } else if (event.type === 'done') {
+                messageCount = event.message_count;
+
+                // Enable generate button after a few exchanges
+                if (messageCount >= 4) {
+                    generateBtn.disabled = false;
+                }
             }
-        }
+        });
     } catch (error) {
         addMessage('Error: Failed to connect to server', 'assistant');
     } finally {
@@ -410,32 +460,80 @@ chatForm.addEventListener('submit', async function(e) {
     }
 });
 
+// Read a Server-Sent Events response body, calling onEvent for each JSON frame
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        // Frames are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            const data = frame
+                .split('\n')
+                .filter(line => line.startsWith('data: '))
+                .map(line => line.slice(6))
+                .join('\n');
+            if (data) {
+                onEvent(JSON.parse(data));
+            }
+        }
+    }
+}
+
 // Generate PRD
 generateBtn.addEventListener('click', async function() {
     showLoading('Generating PRD...');
     generateBtn.disabled = true;
 
+    let streamedPrd = '';
+
     try {
-        const response = await fetch('/api/generate-prd', {
+        const response = await fetch('/api/generate-prd/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             }
         });
 
-        const data = await response.json();
-
-        if (data.error) {
-            alert('Error: ' + data.error);
-        } else {
-            currentPrdContent = data.prd;
-            prdContent.innerHTML = marked.parse(data.prd);
-            prdFilename.textContent = data.filename;
-            prdPreview.classList.remove('hidden');
-            prdPreview.scrollIntoView({ behavior: 'smooth' });
-            // Refresh the sidebar PRD list
-            loadExistingPrds();
+        if (!response.ok) {
+            const data = await response.json();
+            alert('Error: ' + (data.error || 'Failed to generate PRD'));
+            return;
         }
+
+        await readEventStream(response, event => {
+            if (event.type === 'section') {
+                if (!streamedPrd) {
+                    // Swap the spinner for the preview as soon as content arrives
+                    hideLoading();
+                    prdFilename.textContent = 'Generating...';
+                    prdPreview.classList.remove('hidden');
+                    prdPreview.scrollIntoView({ behavior: 'smooth' });
+                }
+                streamedPrd += event.text;
+                prdContent.innerHTML = marked.parse(streamedPrd);
+            } else if (event.type === 'error') {
+                alert('Error: ' + event.error);
+                if (streamedPrd) {
+                    prdPreview.classList.add('hidden');
+                }
+            } else if (event.type === 'done') {
+                currentPrdContent = streamedPrd;
+                prdFilename.textContent = event.filename;
+                // Refresh the sidebar PRD list
+                loadExistingPrds();
+            }
+        });
     } catch (error) {
         alert('Error: Failed to generate PRD');
     } finally {
@@ -509,6 +607,19 @@ function addMessage(content, role) {
 
     const contentDiv = document.createElement('div');
     contentDiv.className = 'message-content';
+    renderMessageContent(contentDiv, content);
+
+    messageDiv.appendChild(contentDiv);
+    chatMessages.appendChild(messageDiv);
+
+    // Scroll to bottom
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    return contentDiv;
+}
+
+function renderMessageContent(contentDiv, content) {
+    contentDiv.innerHTML = '';
 
     // Split content into paragraphs
     const paragraphs = content.split('\n\n');
@@ -519,12 +630,6 @@ function addMessage(content, role) {
             contentDiv.appendChild(para);
         }
     });
-
-    messageDiv.appendChild(contentDiv);
-    chatMessages.appendChild(messageDiv);
-
-    // Scroll to bottom
-    chatMessages.scrollTop = chatMessages.scrollHeight;
 }
 
 function showLoading(text) {
@@ -536,6 +641,68 @@ function hideLoading() {
     loadingOverlay.classList.add('hidden');
 }
 
+// Full-text search over saved PRDs and research
+let searchTimer = null;
+
+prdSearch.addEventListener('input', () => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => searchPrds(prdSearch.value.trim()), 250);
+});
+
+async function searchPrds(query) {
+    if (!query) {
+        prdSearchResults.classList.add('hidden');
+        prdsList.classList.remove('hidden');
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/prds/search?q=${encodeURIComponent(query)}`);
+        const data = await response.json();
+        // Ignore responses for a query the user has since changed
+        if (prdSearch.value.trim() !== query) return;
+
+        prdSearchResults.innerHTML = '';
+        if (!response.ok || data.results.length === 0) {
+            const message = document.createElement('div');
+            message.className = 'no-prds';
+            message.textContent = response.ok ? 'No matches' : (data.error || 'Search failed');
+            prdSearchResults.appendChild(message);
+        }
+        (data.results || []).forEach(result => {
+            const item = document.createElement('div');
+            item.className = 'prd-item prd-search-result';
+
+            const content = document.createElement('div');
+            content.className = 'prd-item-content';
+
+            const name = document.createElement('span');
+            name.className = 'prd-name';
+            name.textContent = result.kind === 'research' ? `${result.name} (research)` : result.name;
+            content.appendChild(name);
+
+            // Headings and snippets arrive HTML-escaped with <mark> highlights
+            const section = result.sections[0];
+            if (section) {
+                const snippet = document.createElement('span');
+                snippet.className = 'prd-snippet';
+                snippet.innerHTML = section.heading ? `<strong>${section.heading}</strong> ${section.snippet}` : section.snippet;
+                content.appendChild(snippet);
+            }
+
+            content.addEventListener('click', () => loadPrd(result.filename));
+            item.appendChild(content);
+            prdSearchResults.appendChild(item);
+        });
+
+        prdsList.classList.add('hidden');
+        noPrds.classList.add('hidden');
+        prdSearchResults.classList.remove('hidden');
+    } catch (error) {
+        console.error('Search failed:', error);
+    }
+}
+
 // Load and display existing PRDs
 async function loadExistingPrds() {
     try {
@@ -735,21 +902,56 @@ archiveSelectedBtn.addEventListener('click', async () => {
     selectedPrds.clear();
     updateBulkActionsVisibility();
 
-    // Archive all selected (skip reload until the end)
-    for (const filename of filenames) {
-        await doArchivePrd(filename, true);
+    // Archive all selected in one request, then reload the list once
+    try {
+        const response = await fetch('/api/prds/archive', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filenames })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            console.error(data.error || 'Failed to archive selected PRDs');
+        } else {
+            data.results.filter(r => !r.success).forEach(r => {
+                console.error(`Failed to archive ${r.filename}: ${r.error}`);
+            });
+        }
+    } catch (error) {
+        console.error('Archive error:', error);
     }
 
-    // Reload the list once at the end
     await loadExistingPrds();
 });
 
+// Download selected PRDs and their research as a zip
+exportSelectedBtn.addEventListener('click', () => {
+    if (selectedPrds.size === 0) return;
+
+    // A form POST, as a long selection doesn't fit in a URL
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/api/prds/export';
+    selectedPrds.forEach(filename => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = 'filename';
+        input.value = filename;
+        form.appendChild(input);
+    });
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+});
+
 function updateBulkActionsVisibility() {
     if (multiSelectMode) {
         bulkActions.classList.remove('hidden');
         const count = selectedPrds.size;
         archiveSelectedBtn.textContent = count > 0 ? `Archive Selected (${count})` : 'Archive Selected';
         archiveSelectedBtn.disabled = count === 0;
+        exportSelectedBtn.textContent = count > 0 ? `Export Selected (${count})` : 'Export Selected';
+        exportSelectedBtn.disabled = count === 0;
     } else {
         bulkActions.classList.add('hidden');
     }
@@ -802,16 +1004,14 @@ function showArchiveDropdown(filename, name, buttonElement) {
     setTimeout(() => document.addEventListener('click', closeHandler), 0);
 }
 
-async function doArchivePrd(filename, skipReload = false) {
+async function doArchivePrd(filename) {
     try {
         const response = await fetch(`/api/prds/${encodeURIComponent(filename)}/archive`, {
             method: 'POST'
         });
 
         if (response.ok) {
-            if (!skipReload) {
-                await loadExistingPrds();
-            }
+            await loadExistingPrds();
         } else {
             const data = await response.json();
             console.error(data.error || 'Failed to archive PRD');
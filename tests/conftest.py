@@ -2,6 +2,7 @@
 import os
 import tempfile
 import pytest
+from services.storage import FilesystemStorage, S3Storage, SQLiteStorage
 
 
 @pytest.fixture
@@ -18,12 +19,42 @@ def temp_output_dir(monkeypatch):
 def client(temp_output_dir):
     """Create a test client with isolated output directory."""
     # Import app after patching config
-    from app import app, prd_service
+    from app import app, claude_service, prd_service, research_service
+    from services.memo_cache import MemoCache
 
     # Update the prd_service's output_dir to use temp directory
     prd_service.output_dir = temp_output_dir
 
     app.config["TESTING"] = True
     app.config["SECRET_KEY"] = "test-secret-key"
-    with app.test_client() as test_client:
-        yield test_client
+    # Start every test without memoized extraction results
+    claude_service.context_cache = MemoCache()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Keep research cached by tests out of the real cache
+        research_service.cache.cache_dir = cache_dir
+        with app.test_client() as test_client:
+            yield test_client
+
+
+@pytest.fixture
+def s3_client():
+    """A moto-backed S3 bucket."""
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    with moto.mock_aws():
+        client = boto3.client(
+            "s3", region_name="us-east-1",
+            aws_access_key_id="test", aws_secret_access_key="test"
+        )
+        client.create_bucket(Bucket="prdy-test")
+        yield client
+
+
+@pytest.fixture(params=["filesystem", "sqlite", "s3"])
+def storage(request, tmp_path):
+    """Run each storage test against every backend."""
+    if request.param == "filesystem":
+        return FilesystemStorage(str(tmp_path))
+    if request.param == "sqlite":
+        return SQLiteStorage(str(tmp_path / "prds.sqlite3"))
+    return S3Storage("prdy-test", "prds/", client=request.getfixturevalue("s3_client"))
@@ -208,6 +208,84 @@ class TestListPRDsFormat:
         assert data["prds"][0]["filename"] == "newer-prd-20240115-100000.md"
 
 
+class TestListPRDsPagination:
+    """Tests for pagination, field selection and ETags on /api/prds."""
+
+    @staticmethod
+    def _write_prds(temp_output_dir, count):
+        import os
+        for i in range(count):
+            path = os.path.join(temp_output_dir, f"product{i}-prd-20240101-100000.md")
+            with open(path, "w") as f:
+                f.write(f"# Product {i}")
+            os.utime(path, (1000 + i, 1000 + i))
+
+    def test_cursor_pagination_walks_all_prds(self, client, temp_output_dir):
+        self._write_prds(temp_output_dir, 5)
+
+        seen = []
+        url = "/api/prds?limit=2"
+        while url:
+            data = client.get(url).get_json()
+            assert len(data["prds"]) <= 2
+            seen.extend(prd["filename"] for prd in data["prds"])
+            url = f"/api/prds?limit=2&cursor={data['next_cursor']}" if data["next_cursor"] else None
+
+        assert seen == [f"product{i}-prd-20240101-100000.md" for i in range(4, -1, -1)]
+
+    def test_unpaginated_listing_has_no_cursor(self, client, temp_output_dir):
+        self._write_prds(temp_output_dir, 3)
+        data = client.get("/api/prds").get_json()
+        assert len(data["prds"]) == 3
+        assert data["next_cursor"] is None
+
+    def test_research_is_grouped_on_its_page(self, client, temp_output_dir):
+        import os
+        self._write_prds(temp_output_dir, 3)
+        research = os.path.join(temp_output_dir, "product0-competitive-analysis-20240101-110000.md")
+        with open(research, "w") as f:
+            f.write("# Research")
+
+        first = client.get("/api/prds?limit=2").get_json()
+        second = client.get(f"/api/prds?limit=2&cursor={first['next_cursor']}").get_json()
+
+        assert all(prd["research"] == [] for prd in first["prds"])
+        assert second["prds"][0]["research"][0]["filename"].startswith("product0-competitive")
+
+    def test_field_selection(self, client, temp_output_dir):
+        self._write_prds(temp_output_dir, 1)
+        data = client.get("/api/prds?fields=filename,name").get_json()
+        assert data["prds"] == [{"filename": "product0-prd-20240101-100000.md", "name": "Product0"}]
+
+    def test_invalid_parameters(self, client):
+        assert client.get("/api/prds?limit=0").status_code == 400
+        assert client.get("/api/prds?cursor=not-a-cursor").status_code == 400
+        assert client.get("/api/prds?fields=filename,secret").status_code == 400
+
+    def test_unchanged_listing_returns_304(self, client, temp_output_dir):
+        self._write_prds(temp_output_dir, 2)
+        first = client.get("/api/prds")
+        etag = first.headers["ETag"]
+        assert not etag.startswith("W/")
+        assert first.headers["Cache-Control"] == "no-cache"
+
+        second = client.get("/api/prds", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.get_data() == b""
+
+    def test_etag_changes_with_output_and_query(self, client, temp_output_dir):
+        from app import prd_service
+        self._write_prds(temp_output_dir, 1)
+        etag = client.get("/api/prds").headers["ETag"]
+
+        assert client.get("/api/prds?limit=1").headers["ETag"] != etag
+
+        prd_service.append_to_prd("product0-prd-20240101-100000.md", "## More")
+        response = client.get("/api/prds", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+
 class TestResearchEndpoints:
     """Tests for web research endpoints."""
 
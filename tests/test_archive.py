@@ -0,0 +1,334 @@
+"""Tests for the compressed PRD archive, batch archiving and export."""
+import base64
+import gzip
+import io
+import os
+import pytest
+import zipfile
+from unittest.mock import patch
+from services.archive import PRDArchive
+from services.prd_service import PRDService
+
+PRD = "# TaskFlow - Product Requirements Document\n\n" + "## Requirements\n- Kanban boards\n" * 200
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = PRDService()
+    service.output_dir = str(tmp_path)
+    return service
+
+
+class TestPRDArchive:
+    """Compression, packing and reads on every storage backend."""
+
+    def test_archive_compresses(self, storage):
+        storage.write_text("taskflow-prd-20240101-100000.md", PRD)
+        archive = PRDArchive(storage)
+
+        assert archive.archive("taskflow-prd-20240101-100000.md")
+
+        assert storage.list_names() == []
+        assert storage.list_names("old/") == ["old/taskflow-prd-20240101-100000.md.gz"]
+        assert storage.stat("old/taskflow-prd-20240101-100000.md.gz").size < len(PRD) / 10
+        assert archive.read("taskflow-prd-20240101-100000.md").decode("utf-8") == PRD
+        assert not archive.archive("missing.md")
+
+    def test_pack_into_segment(self, storage):
+        archive = PRDArchive(storage)
+        for i in range(3):
+            storage.write_text(f"p{i}-prd-20240101-100000.md", f"{PRD}\nProduct {i}")
+            archive.archive(f"p{i}-prd-20240101-100000.md")
+
+        assert archive.pack(min_files=4)["segment"] is None
+        result = archive.pack()
+
+        assert result["files"] == 3
+        assert storage.list_names("old/") == []
+        assert len(storage.list_names("old/segments/")) == 2
+        for i in range(3):
+            assert archive.read(f"p{i}-prd-20240101-100000.md").decode("utf-8").endswith(f"Product {i}")
+
+    def test_legacy_uncompressed_files(self, storage):
+        """Files archived before compression are still readable and get packed."""
+        storage.write_text("old/legacy-prd-20240101-100000.md", PRD)
+        archive = PRDArchive(storage)
+
+        assert archive.read("legacy-prd-20240101-100000.md").decode("utf-8") == PRD
+        assert archive.pack()["files"] == 1
+        assert archive.read("legacy-prd-20240101-100000.md").decode("utf-8") == PRD
+
+    def test_remove_from_segment(self, storage):
+        archive = PRDArchive(storage)
+        for name in ("a.md", "b.md"):
+            storage.write_text(name, name)
+            archive.archive(name)
+        archive.pack()
+
+        archive.remove("a.md")
+        assert archive.read("a.md") is None
+        assert archive.read("b.md") == b"b.md"
+
+        archive.remove("b.md")
+        assert storage.list_names("old/segments/") == []
+
+    def test_lookups_reuse_manifests(self, storage):
+        """Manifests are read once, not on every lookup of a missing name."""
+        archive = PRDArchive(storage)
+        for i in range(3):
+            storage.write_text(f"p{i}.md", f"Product {i}")
+            archive.archive(f"p{i}.md")
+            archive.pack()
+        assert archive.read("p0.md") == b"Product 0"
+
+        with patch.object(storage, "read_bytes", wraps=storage.read_bytes) as read_bytes:
+            for _ in range(5):
+                assert archive.read("missing.md") is None
+            assert archive.read("p2.md") == b"Product 2"
+
+        assert not [c for c in read_bytes.call_args_list if c.args[0].endswith(".json")]
+
+    def test_sees_segments_changed_by_other_instances(self, storage):
+        archive, other = PRDArchive(storage), PRDArchive(storage)
+        for name in ("a.md", "b.md"):
+            storage.write_text(name, name)
+            archive.archive(name)
+        archive.pack()
+        assert archive.read("a.md") == b"a.md"
+
+        other.remove("a.md")
+        storage.write_text("c.md", "c.md")
+        other.archive("c.md")
+        other.pack()
+
+        assert archive.read("a.md") is None
+        assert archive.read("c.md") == b"c.md"
+
+    def test_stats_report_space_saved(self, storage):
+        archive = PRDArchive(storage)
+        for name in ("a.md", "b.md"):
+            storage.write_text(name, PRD)
+            archive.archive(name)
+        archive.pack()
+        storage.write_text("c.md", PRD)
+        archive.archive("c.md")
+
+        stats = archive.stats()
+
+        assert stats["files"] == 3
+        assert stats["segments"] == 1
+        assert stats["original_bytes"] == 3 * len(PRD)
+        assert stats["stored_bytes"] < stats["original_bytes"]
+        assert stats["saved_bytes"] == stats["original_bytes"] - stats["stored_bytes"]
+        assert 0 < stats["ratio"] < 1
+
+
+class TestPRDServiceArchive:
+    """Archive, read and restore through PRDService."""
+
+    def test_archived_prd_is_still_readable(self, service):
+        prd = service.save_prd(PRD)
+        service.archive_prd(prd)
+
+        assert service.list_prds() == []
+        assert service.get_prd(prd) == PRD
+        with gzip.open(os.path.join(service.output_dir, "old", f"{prd}.gz"), "rt") as f:
+            assert f.read() == PRD
+
+    def test_archive_kept_across_lookups(self, service):
+        prd = service.save_prd(PRD)
+        service.archive_prd(prd)
+        service.pack_archive()
+
+        assert service.archive is service.archive
+        with patch.object(PRDArchive, "_manifests", autospec=True, side_effect=PRDArchive._manifests) as load:
+            for i in range(5):
+                assert service.get_prd(f"missing-{i}-prd-20240101-100000.md") is None
+            assert service.get_prd(prd) == PRD
+            assert service.archive_stats()["files"] == 1
+        assert load.call_count == 1
+
+        # Restoring changes the segment, and the next lookup sees it
+        assert service.restore_prd(prd)
+        assert service.archive_stats()["files"] == 0
+
+    def test_restore(self, service):
+        prd = service.save_prd(PRD)
+        research = service.save_research("## Competitors\n- Trello", "TaskFlow")
+        service.archive_prd_with_research(prd)
+        service.pack_archive()
+
+        assert service.restore_prd(prd)
+        assert service.restore_prd(research)
+
+        prds = service.list_prds()
+        assert [p["filename"] for p in prds] == [prd]
+        assert [r["filename"] for r in prds[0]["research"]] == [research]
+        assert service.search("kanban")[0]["filename"] == prd
+        assert service.archive_stats()["files"] == 0
+
+    def test_restore_missing_or_active(self, service):
+        prd = service.save_prd(PRD)
+        assert not service.restore_prd(prd)
+        assert not service.restore_prd("missing-prd-20240101-100000.md")
+
+
+class TestArchiveEndpoints:
+    """Tests for the restore and archive stats endpoints and the pack command."""
+
+    def test_restore_endpoint(self, client, temp_output_dir):
+        from app import prd_service
+        prd = prd_service.save_prd(PRD)
+        client.post(f"/api/prds/{prd}/archive")
+
+        assert client.get(f"/api/prds/{prd}").status_code == 200
+        assert client.post(f"/api/prds/{prd}/restore").status_code == 200
+        assert client.post(f"/api/prds/{prd}/restore").status_code == 404
+        assert [p["filename"] for p in client.get("/api/prds").get_json()["prds"]] == [prd]
+
+    def test_stats_endpoint(self, client):
+        from app import prd_service
+        prd = prd_service.save_prd(PRD)
+        prd_service.archive_prd(prd)
+
+        stats = client.get("/api/archive/stats").get_json()
+
+        assert stats["files"] == 1
+        assert stats["saved_bytes"] > 0
+
+    def test_pack_archive_command(self, client):
+        from app import app, prd_service
+        prd_service.archive_prd(prd_service.save_prd(PRD))
+
+        result = app.test_cli_runner().invoke(args=["pack-archive"])
+
+        assert "Packed 1 file(s)" in result.output
+        assert "saved" in result.output
+
+
+class TestBatchArchive:
+    """Tests for archiving several files in one call."""
+
+    def test_cascades_and_reports_per_file(self, service):
+        taskflow = service.save_prd("# TaskFlow - PRD")
+        taskflow_research = service.save_research("## Competitors", "TaskFlow")
+        notes = service.save_prd("# Notes - PRD")
+        notes_research = service.save_research("## Competitors", "Notes")
+        keep = service.save_prd("# Keep - PRD")
+
+        result = service.archive_batch([notes_research, taskflow, notes, "missing-prd-20240101-100000.md"])
+
+        assert result["archived"] == 4
+        assert [r["success"] for r in result["results"]] == [True, True, True, False]
+        assert result["results"][1]["archived"] == [taskflow, taskflow_research]
+        # Research archived on its own isn't archived again with its PRD
+        assert result["results"][2]["archived"] == [notes]
+        assert result["results"][3]["error"] == "Not found"
+        assert [p["filename"] for p in service.list_prds()] == [keep]
+
+    def test_research_resolved_with_one_query(self, service):
+        prds = [service.save_prd(f"# Product{i} - PRD") for i in range(5)]
+        for i in range(5):
+            service.save_research("## Competitors", f"Product{i}")
+
+        with patch.object(service.storage, "iter_entries", wraps=service.storage.iter_entries) as listing:
+            result = service.archive_batch(prds)
+
+        assert result["archived"] == 10
+        assert listing.call_count <= 1
+
+    def test_rejects_nested_names(self, service):
+        result = service.archive_batch(["old/x-prd-20240101-100000.md.gz"])
+        assert result["results"][0] == {
+            "filename": "old/x-prd-20240101-100000.md.gz", "success": False,
+            "archived": [], "error": "Invalid filename"
+        }
+
+    def test_batch_endpoint(self, client):
+        from app import prd_service
+        prd = prd_service.save_prd("# TaskFlow - PRD")
+        research = prd_service.save_research("## Competitors", "TaskFlow")
+
+        response = client.post("/api/prds/archive", json={"filenames": [prd, "missing.md"]})
+
+        data = response.get_json()
+        assert response.status_code == 200
+        assert data["success"] is False
+        assert data["results"][0]["archived"] == [prd, research]
+        assert data["results"][1]["success"] is False
+
+    def test_batch_endpoint_validates_input(self, client):
+        assert client.post("/api/prds/archive", json={}).status_code == 400
+        assert client.post("/api/prds/archive", json={"filenames": "a.md"}).status_code == 400
+        assert client.post("/api/prds/archive", json={"filenames": [1]}).status_code == 400
+
+
+class TestExport:
+    """Tests for the streaming zip export."""
+
+    def test_export_rows_follow_listing_groups(self, service):
+        for filename, mtime in [
+            ("taskflow-prd-20240101-100000.md", 1000),
+            ("taskflow-prd-20240102-100000.md", 2000),
+            ("taskflow-competitive-analysis-20240102-110000.md", 3000),
+            ("other-prd-20240101-100000.md", 1000),
+        ]:
+            service.storage.write_text(filename, "# Test")
+            os.utime(os.path.join(service.output_dir, filename), (mtime, mtime))
+        old, new = "taskflow-prd-20240101-100000.md", "taskflow-prd-20240102-100000.md"
+        research = "taskflow-competitive-analysis-20240102-110000.md"
+
+        # Research belongs to the newest PRD, as in the sidebar
+        assert {r["filename"] for r in service.export_rows([new])} == {new, research}
+        assert {r["filename"] for r in service.export_rows([old])} == {old}
+        assert {r["filename"] for r in service.export_rows(products=["taskflow"])} == {old, new, research}
+
+    def test_export_zip_streams_contents(self, service):
+        prd = service.save_prd(PRD)
+        research = service.save_research("## Competitors\n- Trello", "TaskFlow")
+
+        chunks = list(service.export_zip(service.export_rows([prd])))
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == sorted([f"taskflow/{prd}", f"taskflow/{research}"])
+        assert archive.read(f"taskflow/{prd}").decode("utf-8") == PRD
+
+    def test_export_zip_is_streamed_in_chunks(self, service):
+        """Large exports are yielded piecemeal rather than built in memory."""
+        content = base64.b64encode(os.urandom(768 * 1024))
+        for i in range(3):
+            service.storage.write_bytes(f"p{i}-prd-20240101-100000.md", content)
+
+        chunks = list(service.export_zip(service.export_rows(products=["p0", "p1", "p2"])))
+
+        assert max(len(chunk) for chunk in chunks) < 256 * 1024
+        assert len(zipfile.ZipFile(io.BytesIO(b"".join(chunks))).namelist()) == 3
+
+    def test_export_endpoint(self, client):
+        from app import prd_service
+        prd = prd_service.save_prd(PRD)
+
+        response = client.get(f"/api/prds/export?filename={prd}")
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/zip"
+        assert "attachment" in response.headers["Content-Disposition"]
+        assert zipfile.ZipFile(io.BytesIO(response.get_data())).namelist() == [f"taskflow/{prd}"]
+
+    def test_export_endpoint_errors(self, client):
+        assert client.get("/api/prds/export").status_code == 400
+        assert client.get("/api/prds/export?product=missing").status_code == 404
+
+    def test_export_endpoint_accepts_large_posted_selection(self, client):
+        """Selections too long for a request line are sent as a form POST."""
+        from app import prd_service
+        filenames = [f"product-{i:03d}-prd-20240101-100000.md" for i in range(300)]
+        for filename in filenames:
+            prd_service.storage.write_text(filename, "# Test")
+        assert len("&".join(f"filename={f}" for f in filenames)) > 4094
+
+        response = client.post("/api/prds/export", data={"filename": filenames})
+
+        assert response.status_code == 200
+        assert len(zipfile.ZipFile(io.BytesIO(response.get_data())).namelist()) == 300
@@ -1,13 +1,26 @@
 """Tests for chat functionality with mocked API calls."""
+import asyncio
 import os
+import threading
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from services.claude_service import ClaudeService, APIError
 import anthropic
 
 # client fixture is provided by conftest.py
 
 
+def parse_sse_events(response):
+    """Parse the data frames of an SSE response body."""
+    import json
+    body = response.get_data(as_text=True)
+    return [
+        json.loads(frame[len("data: "):])
+        for frame in body.split("\n\n")
+        if frame.startswith("data: ")
+    ]
+
+
 class TestChatWithMockedAPI:
     """Tests for chat endpoint with mocked Claude API."""
 
@@ -108,6 +121,64 @@ class TestChatWithMockedAPI:
         assert response3.get_json()["message_count"] == 4
 
 
+class TestChatStreaming:
+    """Tests for the SSE chat streaming endpoint."""
+
+    def test_stream_requires_message(self, client):
+        """Streaming chat should reject empty messages before streaming."""
+        response = client.post("/api/chat/stream", json={"message": ""})
+        assert response.status_code == 400
+
+    @patch.object(ClaudeService, 'chat_stream')
+    def test_stream_yields_deltas_then_done(self, mock_stream, client):
+        """Streaming chat should emit each delta followed by a done event."""
+        mock_stream.return_value = iter(["Hello", "! What ", "are we building?"])
+
+        response = client.post("/api/chat/stream", json={"message": "Hi"})
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/event-stream"
+        events = parse_sse_events(response)
+        assert [e["text"] for e in events if e["type"] == "delta"] == [
+            "Hello", "! What ", "are we building?"
+        ]
+        assert events[-1]["type"] == "done"
+        assert events[-1]["message_count"] == 2
+
+    @patch.object(ClaudeService, 'chat')
+    @patch.object(ClaudeService, 'chat_stream')
+    def test_stream_appends_full_reply_to_history(self, mock_stream, mock_chat, client):
+        """The concatenated stream should be stored as one assistant message."""
+        mock_stream.return_value = iter(["Part one, ", "part two."])
+        client.post("/api/chat/stream", json={"message": "Hi"}).get_data()
+
+        mock_chat.return_value = "Follow-up"
+        response = client.post("/api/chat", json={"message": "Next"})
+
+        history = mock_chat.call_args[0][0]
+        assert history[1] == {"role": "assistant", "content": "Part one, part two."}
+        assert response.get_json()["message_count"] == 4
+
+    @patch.object(ClaudeService, 'chat_stream')
+    def test_stream_error_does_not_corrupt_history(self, mock_stream, client):
+        """A failed stream should report an error event and leave history untouched."""
+        def failing_stream(messages):
+            yield "Partial"
+            raise APIError("Rate limit exceeded. Please wait a moment and try again.")
+
+        mock_stream.side_effect = failing_stream
+        response = client.post("/api/chat/stream", json={"message": "Hi"})
+
+        events = parse_sse_events(response)
+        assert events[-1]["type"] == "error"
+        assert "Rate limit" in events[-1]["error"]
+
+        mock_stream.side_effect = None
+        mock_stream.return_value = iter(["Recovered"])
+        response = client.post("/api/chat/stream", json={"message": "Again"})
+        assert parse_sse_events(response)[-1]["message_count"] == 2
+
+
 class TestGeneratePRDWithMockedAPI:
     """Tests for PRD generation with mocked Claude API."""
 
@@ -210,6 +281,72 @@ Simplify team task management with intuitive design.
         )
 
 
+class TestGeneratePRDStreaming:
+    """Tests for streaming PRD generation with progressive save."""
+
+    PRD = (
+        "# Task Manager - Product Requirements Document\n\n"
+        "## 1. Executive Summary\nA task app.\n\n"
+        "## 2. Problem Statement\nToo many tools.\n"
+    )
+
+    def test_iter_sections_splits_on_h2_headings(self):
+        """Chunks should be regrouped into sections without losing any text."""
+        from services.prd_service import iter_sections
+
+        chunks = [self.PRD[i:i + 7] for i in range(0, len(self.PRD), 7)]
+        sections = list(iter_sections(chunks))
+
+        assert "".join(sections) == self.PRD
+        assert len(sections) == 3
+        assert sections[1].startswith("## 1. Executive Summary")
+        assert sections[2].startswith("## 2. Problem Statement")
+
+    def test_stream_requires_conversation(self, client):
+        """Streaming generation should require prior conversation."""
+        response = client.post("/api/generate-prd/stream")
+        assert response.status_code == 400
+
+    @patch.object(ClaudeService, 'chat')
+    @patch.object(ClaudeService, 'generate_prd_stream')
+    def test_stream_saves_file_matching_sections(self, mock_stream, mock_chat, client, temp_output_dir):
+        """The saved PRD must exactly match the streamed sections."""
+        mock_chat.return_value = "Tell me about your product."
+        client.post("/api/chat", json={"message": "A task manager app"})
+
+        mock_stream.return_value = iter([self.PRD[:30], self.PRD[30:90], self.PRD[90:]])
+        response = client.post("/api/generate-prd/stream")
+
+        events = parse_sse_events(response)
+        streamed = "".join(e["text"] for e in events if e["type"] == "section")
+        done = events[-1]
+        assert done["type"] == "done"
+        assert done["filename"].startswith("task-manager-prd-")
+
+        with open(os.path.join(temp_output_dir, done["filename"])) as f:
+            assert f.read() == streamed == self.PRD
+        assert not [f for f in os.listdir(temp_output_dir) if f.endswith(".tmp")]
+
+    @patch.object(ClaudeService, 'chat')
+    @patch.object(ClaudeService, 'generate_prd_stream')
+    def test_stream_error_discards_partial_file(self, mock_stream, mock_chat, client, temp_output_dir):
+        """A failed generation should not leave a partial PRD behind."""
+        mock_chat.return_value = "Tell me about your product."
+        client.post("/api/chat", json={"message": "A task manager app"})
+
+        def failing_stream(messages):
+            yield self.PRD[:60]
+            raise APIError("The API is currently overloaded.")
+
+        mock_stream.side_effect = failing_stream
+        response = client.post("/api/generate-prd/stream")
+
+        events = parse_sse_events(response)
+        assert events[-1]["type"] == "error"
+        assert "overloaded" in events[-1]["error"]
+        assert os.listdir(temp_output_dir) == []
+
+
 class TestSessionStorage:
     """Tests for server-side session storage (fixes cookie overflow bug)."""
 
@@ -258,6 +395,195 @@ class TestSessionStorage:
         assert response.get_json()["prd"] == expected_prd
 
 
+class TestPromptCaching:
+    """Tests for prompt cache breakpoints and usage reporting."""
+
+    @staticmethod
+    def _service():
+        """A ClaudeService whose Anthropic client is a mock."""
+        service = ClaudeService()
+        service.client = MagicMock()
+        response = MagicMock()
+        response.content = [MagicMock(text="Sure.")]
+        response.usage = MagicMock(
+            input_tokens=12, output_tokens=5,
+            cache_read_input_tokens=3000, cache_creation_input_tokens=40
+        )
+        service.client.messages.create.return_value = response
+        return service
+
+    @staticmethod
+    def _cache_marks(messages):
+        """Indexes of messages carrying a cache breakpoint."""
+        return [
+            i for i, m in enumerate(messages)
+            if isinstance(m["content"], list) and "cache_control" in m["content"][-1]
+        ]
+
+    def test_system_prompt_is_cached(self):
+        service = self._service()
+        service.chat([{"role": "user", "content": "Hi"}])
+
+        system = service.client.messages.create.call_args.kwargs["system"]
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
+
+    def test_last_message_marks_conversation_prefix(self):
+        service = self._service()
+        messages = [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello"},
+            {"role": "user", "content": "A task app"},
+        ]
+        service.chat(messages)
+
+        sent = service.client.messages.create.call_args.kwargs["messages"]
+        assert self._cache_marks(sent) == [2]
+        assert sent[2]["content"][0]["text"] == "A task app"
+        # The caller's history must not be mutated
+        assert messages[2]["content"] == "A task app"
+
+    def test_loaded_prd_gets_its_own_breakpoint(self):
+        service = self._service()
+        messages = [
+            {"role": "user", "content": "Here is my PRD:\n\n" + "x" * 5000},
+            {"role": "assistant", "content": "I've reviewed your existing PRD."},
+            {"role": "user", "content": "Add a login feature"},
+        ]
+        service.chat(messages)
+
+        sent = service.client.messages.create.call_args.kwargs["messages"]
+        assert self._cache_marks(sent) == [0, 2]
+
+    def test_generate_prd_reuses_conversation_prefix(self):
+        service = self._service()
+        messages = [
+            {"role": "user", "content": "A task app"},
+            {"role": "assistant", "content": "Who is it for?"},
+        ]
+        service.generate_prd(messages)
+
+        sent = service.client.messages.create.call_args.kwargs["messages"]
+        # Breakpoint on the conversation, not the generation prompt after it
+        assert self._cache_marks(sent) == [1]
+        assert isinstance(sent[-1]["content"], str)
+
+    def test_reports_cache_usage(self):
+        service = self._service()
+        service.chat([{"role": "user", "content": "Hi"}])
+
+        assert service.last_usage == {
+            "operation": "chat",
+            "input_tokens": 12,
+            "output_tokens": 5,
+            "cache_read_input_tokens": 3000,
+            "cache_creation_input_tokens": 40
+        }
+
+
+class TestConversationCompaction:
+    """Tests for summarizing old turns once history exceeds the token budget."""
+
+    @staticmethod
+    def _service(budget=1500, keep_recent=4):
+        """A ClaudeService with a mocked client and a small context budget."""
+        service = ClaudeService()
+        service.client = MagicMock()
+        service.context_token_budget = budget
+        service.context_keep_recent = keep_recent
+
+        def create(**kwargs):
+            response = MagicMock()
+            is_summary = "system" not in kwargs
+            response.content = [MagicMock(text="SUMMARY" if is_summary else "Reply")]
+            response.usage = MagicMock(input_tokens=1, output_tokens=1)
+            return response
+
+        service.client.messages.create.side_effect = create
+        return service
+
+    @staticmethod
+    def _history(turns, size=800):
+        """Alternating user/assistant turns of roughly `size` characters each."""
+        return [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "x" * size}
+            for i in range(turns)
+        ]
+
+    @staticmethod
+    def _summary_calls(service):
+        return [
+            c for c in service.client.messages.create.call_args_list
+            if "system" not in c.kwargs
+        ]
+
+    def test_short_history_is_untouched(self):
+        service = self._service()
+        messages = self._history(3, size=100)
+        assert service.compact_messages(messages) is messages
+        assert not self._summary_calls(service)
+
+    def test_long_history_is_summarized_keeping_recent_turns(self):
+        service = self._service()
+        messages = self._history(11)
+
+        compacted = service.compact_messages(messages)
+
+        assert "SUMMARY" in compacted[0]["content"]
+        assert compacted[1]["role"] == "assistant"
+        assert compacted[2:] == messages[-5:]
+        assert compacted[2]["role"] == "user"
+        assert len(self._summary_calls(service)) == 1
+
+    def test_summary_is_reused_on_next_turn(self):
+        service = self._service()
+        messages = self._history(11)
+        service.compact_messages(messages)
+
+        messages += [
+            {"role": "assistant", "content": "short reply"},
+            {"role": "user", "content": "short question"},
+        ]
+        compacted = service.compact_messages(messages)
+
+        assert len(self._summary_calls(service)) == 1
+        assert "SUMMARY" in compacted[0]["content"]
+        assert compacted[-1]["content"] == "short question"
+
+    def test_loaded_prd_is_preserved(self):
+        from prompts.system_prompts import LOAD_PRD_PREFIX
+
+        service = self._service(budget=2000)
+        seed = [
+            {"role": "user", "content": LOAD_PRD_PREFIX + "# My PRD\n" + "p" * 3000},
+            {"role": "assistant", "content": "I've reviewed your existing PRD."},
+        ]
+        messages = seed + self._history(11)
+
+        compacted = service.compact_messages(messages)
+
+        assert compacted[:2] == seed
+        assert "SUMMARY" in compacted[2]["content"]
+        summarized = self._summary_calls(service)[0].kwargs["messages"][0]["content"]
+        assert "# My PRD" not in summarized
+
+    def test_chat_sends_compacted_history(self):
+        service = self._service()
+        service.chat(self._history(11))
+
+        chat_call = service.client.messages.create.call_args_list[-1]
+        sent = chat_call.kwargs["messages"]
+        assert len(sent) == 7
+        assert service.last_usage["operation"] == "chat"
+
+    def test_summary_failure_falls_back_to_full_history(self):
+        service = self._service()
+        service.client.messages.create.side_effect = anthropic.APIError(
+            "overloaded", request=MagicMock(), body=None
+        )
+        messages = self._history(11)
+        assert service.compact_messages(messages) is messages
+
+
 class TestClaudeServiceErrorHandling:
     """Unit tests for ClaudeService error handling."""
 
@@ -317,3 +643,140 @@ class TestClaudeServiceErrorHandling:
 
         assert "API error:" in str(exc_info.value)
         assert "unexpected" in str(exc_info.value)
+
+
+class TestAsyncClaudeService:
+    """Tests for the async counterparts of the Claude calls."""
+
+    class FakeStream:
+        """Async stand-in for the SDK's message stream manager."""
+
+        def __init__(self, deltas, usage):
+            self.deltas = deltas
+            self.usage = usage
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        @property
+        async def text_stream(self):
+            for delta in self.deltas:
+                yield delta
+
+        async def get_final_message(self):
+            return MagicMock(usage=self.usage)
+
+    @staticmethod
+    def _usage():
+        return MagicMock(
+            input_tokens=12, output_tokens=5,
+            cache_read_input_tokens=0, cache_creation_input_tokens=0
+        )
+
+    def _service(self):
+        service = ClaudeService()
+        async_client = MagicMock()
+        response = MagicMock(content=[MagicMock(text="Sure.")], usage=self._usage())
+        async_client.messages.create = AsyncMock(return_value=response)
+        async_client.messages.stream = MagicMock(
+            return_value=self.FakeStream(["Hel", "lo"], self._usage())
+        )
+        return service, async_client
+
+    def test_achat_sends_same_request_as_chat(self):
+        service, async_client = self._service()
+        service.client = MagicMock()
+        service.client.messages.create.return_value = async_client.messages.create.return_value
+        messages = [{"role": "user", "content": "A task app"}]
+
+        with patch.object(ClaudeService, "async_client", new=async_client):
+            assert asyncio.run(service.achat(messages)) == "Sure."
+        service.chat(messages)
+
+        assert async_client.messages.create.call_args == service.client.messages.create.call_args
+
+    def test_achat_stream_yields_deltas_and_usage(self):
+        service, async_client = self._service()
+
+        async def collect():
+            deltas = [delta async for delta in service.achat_stream([{"role": "user", "content": "Hi"}])]
+            return deltas, service.last_usage
+
+        with patch.object(ClaudeService, "async_client", new=async_client):
+            deltas, usage = asyncio.run(collect())
+
+        assert deltas == ["Hel", "lo"]
+        assert usage["operation"] == "chat"
+
+    def test_concurrent_tasks_keep_their_own_usage(self):
+        service, async_client = self._service()
+
+        async def call(operation):
+            if operation == "chat":
+                await service.achat([{"role": "user", "content": "Hi"}])
+            else:
+                await service.agenerate_prd([{"role": "user", "content": "Hi"}])
+            await asyncio.sleep(0)
+            return service.last_usage["operation"]
+
+        async def both():
+            return await asyncio.gather(call("chat"), call("generate_prd"))
+
+        with patch.object(ClaudeService, "async_client", new=async_client):
+            assert asyncio.run(both()) == ["chat", "generate_prd"]
+
+    def test_aextract_product_context_shares_memo_cache(self):
+        service, async_client = self._service()
+        async_client.messages.create.return_value.content = [
+            MagicMock(text='{"product_name": "TaskFlow", "confidence": "high"}')
+        ]
+        service.client = MagicMock()
+
+        with patch.object(ClaudeService, "async_client", new=async_client):
+            result = asyncio.run(service.aextract_product_context(prd_content="# TaskFlow"))
+
+        assert result["product_name"] == "TaskFlow"
+        assert service.extract_product_context(prd_content="# TaskFlow") == result
+        service.client.messages.create.assert_not_called()
+
+    def test_async_api_error_is_friendly(self):
+        service, async_client = self._service()
+        async_client.messages.create = AsyncMock(side_effect=anthropic.APIError(
+            "credit balance is too low", request=MagicMock(), body=None
+        ))
+
+        with patch.object(ClaudeService, "async_client", new=async_client):
+            with pytest.raises(APIError, match="credits"):
+                asyncio.run(service.achat([{"role": "user", "content": "Hi"}]))
+
+    def test_aextract_cache_io_runs_off_the_loop(self):
+        service, async_client = self._service()
+        async_client.messages.create.return_value.content = [
+            MagicMock(text='{"product_name": "TaskFlow", "confidence": "high"}')
+        ]
+        threads = []
+
+        def record(*args):
+            threads.append(threading.current_thread())
+
+        with patch.object(ClaudeService, "async_client", new=async_client), \
+                patch.object(service.context_cache, "get", side_effect=lambda key: record() or None), \
+                patch.object(service.context_cache, "set", side_effect=record):
+            asyncio.run(service.aextract_product_context(prd_content="# TaskFlow"))
+
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+    def test_aclose_closes_the_loops_client(self):
+        service = ClaudeService()
+
+        async def use():
+            client = service.async_client
+            assert service.async_client is client
+            await service.aclose()
+            return client
+
+        assert asyncio.run(use()).is_closed()
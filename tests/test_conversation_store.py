@@ -0,0 +1,203 @@
+"""Tests for the pluggable conversation store."""
+import pytest
+from unittest.mock import patch
+from services.claude_service import ClaudeService
+from services.conversation_store import (
+    ConversationStore,
+    InMemoryConversationStore,
+    RedisConversationStore,
+    create_conversation_store,
+    deserialize_messages,
+    serialize_messages,
+)
+
+
+@pytest.fixture
+def fake_redis():
+    """An in-process Redis stand-in."""
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    """Run each store test against both backends."""
+    if request.param == "memory":
+        return InMemoryConversationStore()
+    return RedisConversationStore(request.getfixturevalue("fake_redis"), ttl=60)
+
+
+class TestSerialization:
+    """Tests for the compact message encoding."""
+
+    def test_round_trip(self):
+        """Messages should survive serialization unchanged, including unicode."""
+        messages = [
+            {"role": "user", "content": "Build a café finder ☕"},
+            {"role": "assistant", "content": "Sure!\n\n- Maps\n- Reviews"},
+        ]
+        assert deserialize_messages(serialize_messages(messages)) == messages
+
+    def test_large_history_is_compressed(self):
+        """A loaded PRD should take far less space than its raw text."""
+        prd = "## Requirements\n" + "- The system shall support teams.\n" * 500
+        messages = [{"role": "user", "content": prd}]
+        assert len(serialize_messages(messages)) < len(prd) / 10
+
+
+class TestConversationStore:
+    """Behavior shared by every backend."""
+
+    def test_interface_is_abstract(self):
+        with pytest.raises(TypeError):
+            ConversationStore()
+
+    def test_missing_session_is_empty(self, store):
+        assert store.get("unknown") == []
+
+    def test_set_then_get(self, store):
+        messages = [{"role": "user", "content": "Hi"}]
+        store.set("s1", messages)
+        assert store.get("s1") == messages
+
+    def test_get_returns_copy(self, store):
+        """Mutating a fetched list must not change stored history until set()."""
+        store.set("s1", [{"role": "user", "content": "Hi"}])
+        fetched = store.get("s1")
+        fetched.append({"role": "assistant", "content": "Hello"})
+        assert len(store.get("s1")) == 1
+
+    def test_sessions_are_isolated(self, store):
+        store.set("s1", [{"role": "user", "content": "One"}])
+        store.set("s2", [{"role": "user", "content": "Two"}])
+        assert store.get("s1")[0]["content"] == "One"
+        assert store.get("s2")[0]["content"] == "Two"
+
+    def test_setting_empty_list_clears_session(self, store):
+        store.set("s1", [{"role": "user", "content": "Hi"}])
+        store.set("s1", [])
+        assert store.get("s1") == []
+
+    def test_delete(self, store):
+        store.set("s1", [{"role": "user", "content": "Hi"}])
+        store.delete("s1")
+        assert store.get("s1") == []
+
+
+class TestRedisConversationStore:
+    """Redis-specific behavior."""
+
+    def test_sets_ttl(self, fake_redis):
+        store = RedisConversationStore(fake_redis, ttl=120)
+        store.set("s1", [{"role": "user", "content": "Hi"}])
+        assert 0 < fake_redis.ttl("prdy:conversation:s1") <= 120
+
+    def test_read_refreshes_ttl(self, fake_redis):
+        store = RedisConversationStore(fake_redis, ttl=120)
+        store.set("s1", [{"role": "user", "content": "Hi"}])
+        fake_redis.expire("prdy:conversation:s1", 5)
+        store.get("s1")
+        assert fake_redis.ttl("prdy:conversation:s1") > 5
+
+    def test_factory_picks_backend(self, fake_redis):
+        assert isinstance(create_conversation_store(fake_redis), RedisConversationStore)
+        assert isinstance(create_conversation_store(None), InMemoryConversationStore)
+
+    @patch.object(ClaudeService, 'chat')
+    def test_history_shared_through_redis(self, mock_chat, client, fake_redis, monkeypatch):
+        """Two app instances (workers) backed by one Redis see the same history."""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "conversation_store", RedisConversationStore(fake_redis))
+        mock_chat.return_value = "What are we building?"
+        client.post("/api/chat", json={"message": "Hi"})
+
+        # Simulate the next request landing on a different worker
+        monkeypatch.setattr(app_module, "conversation_store", RedisConversationStore(fake_redis))
+        response = client.post("/api/chat", json={"message": "A task app"})
+
+        assert response.get_json()["message_count"] == 4
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestInMemoryBounds:
+    """Eviction, expiry and accounting for the bounded in-process store."""
+
+    @staticmethod
+    def _messages(text):
+        return [{"role": "user", "content": text}]
+
+    def test_evicts_least_recently_used_session(self):
+        store = InMemoryConversationStore(max_sessions=2)
+        store.set("a", self._messages("A"))
+        store.set("b", self._messages("B"))
+        store.get("a")  # "b" is now the least recently used
+        store.set("c", self._messages("C"))
+
+        assert store.get("b") == []
+        assert store.get("a") and store.get("c")
+        assert store.stats()["evictions"] == 1
+
+    def test_evicts_to_stay_under_byte_budget(self):
+        big = self._messages("x" * 2000 + "".join(str(i) for i in range(2000)))
+        size = len(serialize_messages(big))
+        store = InMemoryConversationStore(max_bytes=int(size * 2.5))
+
+        for session_id in ["a", "b", "c"]:
+            store.set(session_id, big)
+
+        stats = store.stats()
+        assert stats["sessions"] == 2
+        assert stats["bytes"] == size * 2
+        assert store.get("a") == []
+
+    def test_newest_session_kept_even_if_over_budget(self):
+        store = InMemoryConversationStore(max_bytes=10)
+        store.set("a", self._messages("A long enough message"))
+        assert store.get("a")
+
+    def test_idle_sessions_expire(self):
+        clock = FakeClock()
+        store = InMemoryConversationStore(idle_ttl=60, clock=clock)
+        store.set("a", self._messages("A"))
+        store.set("b", self._messages("B"))
+
+        clock.now += 30
+        store.get("b")  # keeps "b" alive
+        clock.now += 45
+
+        assert store.get("a") == []
+        assert store.get("b")
+        assert store.stats()["expirations"] == 1
+
+    def test_byte_accounting_tracks_replacements_and_deletes(self):
+        store = InMemoryConversationStore()
+        store.set("a", self._messages("short"))
+        store.set("a", self._messages("a much longer message " * 20))
+        assert store.stats()["bytes"] == len(serialize_messages(store.get("a")))
+
+        store.delete("a")
+        assert store.stats()["bytes"] == 0
+
+    def test_hit_and_miss_counters(self):
+        store = InMemoryConversationStore()
+        store.get("missing")
+        store.set("a", self._messages("A"))
+        store.get("a")
+
+        stats = store.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    def test_health_reports_store_stats(self, client):
+        response = client.get("/health")
+        stats = response.get_json()["conversations"]
+        assert "hits" in stats and "misses" in stats
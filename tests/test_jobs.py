@@ -0,0 +1,170 @@
+"""Tests for background jobs."""
+import threading
+import pytest
+from unittest.mock import patch
+from services.claude_service import ClaudeService, APIError
+from services.job_service import JobError, JobService
+from services.research_service import ResearchService
+
+# client fixture is provided by conftest.py
+
+
+class TestJobService:
+    """Unit tests for the job service."""
+
+    @pytest.fixture(params=["memory", "redis"])
+    def service(self, request):
+        if request.param == "memory":
+            return JobService(max_workers=2)
+        fakeredis = pytest.importorskip("fakeredis")
+        return JobService(fakeredis.FakeRedis(), max_workers=2)
+
+    def test_submit_returns_immediately(self, service):
+        release = threading.Event()
+        job = service.submit("slow", release.wait, 5, owner="s1")
+
+        assert job["status"] == "queued"
+        assert service.get(job["id"], owner="s1")["status"] in ("queued", "running")
+
+        release.set()
+        service.wait(job["id"], timeout=5)
+        assert service.get(job["id"], owner="s1")["status"] == "succeeded"
+
+    def test_result_is_stored(self, service):
+        job = service.submit("add", lambda a, b: {"sum": a + b}, 2, 3, owner="s1")
+        service.wait(job["id"], timeout=5)
+
+        record = service.get(job["id"], owner="s1")
+        assert record["result"] == {"sum": 5}
+        assert record["finished"] >= record["started"] >= record["created"]
+
+    def test_job_error_payload(self, service):
+        def fail():
+            raise JobError({"error": "insufficient_context", "message": "Tell me more"})
+
+        job = service.submit("research", fail, owner="s1")
+        service.wait(job["id"], timeout=5)
+
+        record = service.get(job["id"], owner="s1")
+        assert record["status"] == "failed"
+        assert record["error"]["error"] == "insufficient_context"
+
+    def test_unexpected_exception_fails_job(self, service):
+        job = service.submit("boom", lambda: 1 / 0, owner="s1")
+        service.wait(job["id"], timeout=5)
+        assert "Job failed" in service.get(job["id"], owner="s1")["error"]["error"]
+
+    def test_jobs_are_private_to_owner(self, service):
+        job = service.submit("noop", lambda: None, owner="s1")
+        service.wait(job["id"], timeout=5)
+        assert service.get(job["id"], owner="s2") is None
+        assert service.get("missing", owner="s1") is None
+
+    def test_finished_jobs_release_their_futures(self, service):
+        jobs = [service.submit("noop", lambda: None, owner="s1") for _ in range(50)]
+        service._get_executor().shutdown(wait=True)
+
+        assert all(service.get(job["id"], owner="s1")["status"] == "succeeded" for job in jobs)
+        assert service._futures == {}
+
+    def test_store_errors_leave_job_to_time_out(self, service):
+        save = service.store.save
+
+        def flaky_save(job):
+            if job["status"] != "queued":
+                raise ConnectionError("store down")
+            save(job)
+
+        with patch.object(service.store, "save", side_effect=flaky_save):
+            job = service.submit("noop", lambda: None, owner="s1")
+            service.wait(job["id"], timeout=5)
+
+        # The update was lost, so the record is stuck until it times out
+        assert service.get(job["id"], owner="s1")["status"] == "queued"
+        service.timeout = 0
+        record = service.get(job["id"], owner="s1")
+        assert record["status"] == "failed"
+        assert record["error"] == {"error": "Job timed out"}
+
+
+class TestJobEndpoints:
+    """Tests for the job submission and polling endpoints."""
+
+    @staticmethod
+    def _finish(client, job_id):
+        from app import job_service
+        job_service.wait(job_id, timeout=5)
+        return client.get(f"/api/jobs/{job_id}").get_json()
+
+    @patch.object(ClaudeService, 'chat')
+    def _start_conversation(self, client, mock_chat):
+        mock_chat.return_value = "Tell me more."
+        client.post("/api/chat", json={"message": "A task manager for remote teams"})
+
+    def test_research_job_requires_conversation(self, client):
+        response = client.post("/api/jobs/research", json={"source": "conversation"})
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "no_context"
+
+    @patch.object(ResearchService, 'research_competitors')
+    @patch.object(ClaudeService, 'extract_product_context')
+    def test_research_job_writes_back_to_conversation(self, mock_extract, mock_research, client):
+        self._start_conversation(client)
+        mock_extract.return_value = {
+            "product_name": "TaskFlow",
+            "product_description": "Tasks for remote teams",
+            "search_category": "task management software",
+            "confidence": "high"
+        }
+        mock_research.return_value = "## 1. Key Competitors\n- Asana"
+
+        response = client.post("/api/jobs/research", json={"source": "conversation"})
+        assert response.status_code == 202
+
+        job = self._finish(client, response.get_json()["job_id"])
+        assert job["status"] == "succeeded"
+        assert job["result"]["analysis"].startswith("## 1. Key Competitors")
+        assert "owner" not in job
+
+        with patch.object(ClaudeService, 'chat') as mock_chat:
+            mock_chat.return_value = "Noted."
+            count = client.post("/api/chat", json={"message": "Thanks"}).get_json()["message_count"]
+        # 2 from the first exchange + 2 research messages + 2 from this exchange
+        assert count == 6
+
+    @patch.object(ClaudeService, 'extract_product_context')
+    def test_research_job_failure_is_reported(self, mock_extract, client):
+        self._start_conversation(client)
+        mock_extract.return_value = {"product_name": None, "confidence": "none"}
+
+        job_id = client.post("/api/jobs/research", json={"source": "conversation"}).get_json()["job_id"]
+        job = self._finish(client, job_id)
+
+        assert job["status"] == "failed"
+        assert job["error"]["error"] == "insufficient_context"
+
+    @patch.object(ClaudeService, 'generate_prd')
+    def test_generate_prd_job(self, mock_generate, client):
+        self._start_conversation(client)
+        mock_generate.return_value = "# TaskFlow - Product Requirements Document\n\n## 1. Summary"
+
+        response = client.post("/api/jobs/generate-prd")
+        assert response.status_code == 202
+
+        job = self._finish(client, response.get_json()["job_id"])
+        assert job["status"] == "succeeded"
+        assert job["result"]["filename"].startswith("taskflow-prd-")
+
+    @patch.object(ClaudeService, 'generate_prd')
+    def test_generate_prd_job_api_error(self, mock_generate, client):
+        self._start_conversation(client)
+        mock_generate.side_effect = APIError("API credit balance is too low")
+
+        job_id = client.post("/api/jobs/generate-prd").get_json()["job_id"]
+        job = self._finish(client, job_id)
+
+        assert job["status"] == "failed"
+        assert "credit balance" in job["error"]["error"]
+
+    def test_unknown_job_returns_404(self, client):
+        assert client.get("/api/jobs/does-not-exist").status_code == 404
@@ -0,0 +1,139 @@
+"""Tests for the load-test stub servers and driver."""
+import threading
+import pytest
+from werkzeug.serving import make_server
+from benchmarks.load import build_report, parse_mix, percentile, run_load
+from benchmarks.stubs import StubAnthropic, StubBehavior, StubPerplexity, _StubServer
+from services.claude_service import APIError, ClaudeService
+from services.prd_service import iter_sections
+from services.research_service import ResearchService
+
+FAST = StubBehavior(latency=0.01, token_rate=0)
+
+CONVERSATION = [
+    {"role": "user", "content": "A kanban board for construction crews"},
+    {"role": "assistant", "content": "Who uses it?"},
+]
+
+
+@pytest.fixture
+def stubs():
+    anthropic, perplexity = StubAnthropic(FAST), StubPerplexity(FAST)
+    yield anthropic, perplexity
+    anthropic.close()
+    perplexity.close()
+
+
+def claude_for(stub) -> ClaudeService:
+    service = ClaudeService()
+    service.client = service.client.with_options(base_url=stub.base_url, api_key="stub", max_retries=0)
+    return service
+
+
+class TestStubServers:
+    """The stubs answer the real clients like the real APIs."""
+
+    def test_base_server_is_abstract(self):
+        with pytest.raises(TypeError):
+            _StubServer()
+
+    def test_chat_and_stream(self, stubs):
+        service = claude_for(stubs[0])
+
+        reply = service.chat([{"role": "user", "content": "Hi"}])
+        streamed = "".join(service.chat_stream([{"role": "user", "content": "Hi"}]))
+
+        assert reply == streamed
+        assert len(reply.split()) == FAST.output_tokens
+        assert service.last_usage["output_tokens"] == FAST.output_tokens
+
+    def test_generation_and_extraction(self, stubs):
+        service = claude_for(stubs[0])
+
+        sections = list(iter_sections(service.generate_prd_stream(CONVERSATION)))
+        context = service.extract_product_context(messages=CONVERSATION)
+
+        assert sections[0].startswith("# StubApp - Product Requirements Document")
+        assert len(sections) == 6
+        assert context["product_name"] == "StubApp"
+        assert stubs[0].requests == 2
+
+    def test_perplexity(self, stubs, tmp_path):
+        service = ResearchService()
+        service.api_url = stubs[1].url
+        service.cache.cache_dir = str(tmp_path)
+
+        assert service.research_competitors("kanban", "boards").startswith("## 1. Key Competitors")
+
+    def test_error_injection(self, tmp_path):
+        behavior = StubBehavior(latency=0.01, token_rate=0, error_rate=1.0)
+        with StubAnthropic(behavior) as anthropic, StubPerplexity(behavior) as perplexity:
+            with pytest.raises(APIError):
+                claude_for(anthropic).chat([{"role": "user", "content": "Hi"}])
+
+            service = ResearchService()
+            service.api_url = perplexity.url
+            service.cache.cache_dir = str(tmp_path)
+            service.max_retries = 1
+            service.backoff_base = 0.01
+            assert service.research_competitors("kanban", "boards").startswith("Research failed")
+
+        assert anthropic.errors == 1
+        assert perplexity.errors == 2
+
+
+class TestReport:
+    """Tests for the report arithmetic."""
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile([3.0], 99) == 3.0
+
+    def test_parse_mix(self):
+        assert parse_mix("chat=3,generate=1") == {"chat": 3.0, "generate": 1.0}
+        with pytest.raises(Exception):
+            parse_mix("upload=1")
+
+    def test_build_report(self):
+        results = [
+            ("chat", 0.0, 1.0, True),
+            ("chat", 1.0, 3.0, True),
+            ("research", 0.0, 4.0, False),
+            ("generate", 5.0, 12.0, True),
+        ]
+
+        report = build_report(results, duration=10, elapsed=12)
+
+        assert report["total"]["requests"] == 4
+        assert report["total"]["errors"] == 1
+        # The generation finished after the window and doesn't count toward throughput
+        assert report["total"]["throughput"] == 0.2
+        assert report["operations"]["chat"]["p50"] == 1.0
+
+
+class TestRunLoad:
+    """A short end-to-end run against the app."""
+
+    def test_mixed_workload(self, client, stubs):
+        from app import app, claude_service, research_service
+        anthropic, perplexity = stubs
+        original = claude_service.client
+        claude_service.client = original.with_options(base_url=anthropic.base_url, api_key="stub")
+        research_service.api_url = perplexity.url
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            report = run_load(f"http://127.0.0.1:{server.server_port}", users=3, duration=1.5, capacity=3)
+        finally:
+            server.shutdown()
+            claude_service.client = original
+            research_service.api_url = ResearchService().api_url
+
+        assert report["total"]["requests"] > 3
+        assert report["total"]["errors"] == 0
+        assert report["operations"]["chat"]["throughput"] > 0
+        assert report["saturation"]["capacity"] == 3
+        assert 0 < report["saturation"]["mean_utilization"] <= 1
@@ -0,0 +1,176 @@
+"""Tests for the Prometheus metrics."""
+import os
+import runpy
+import subprocess
+import sys
+import requests
+from unittest.mock import MagicMock, patch
+from prometheus_client import REGISTRY
+from services import metrics
+from services.claude_service import ClaudeService
+from services.research_service import ResearchService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestRequestMetrics:
+    """Tests for the per-route request metrics and the /metrics endpoint."""
+
+    def test_requests_counted_by_route(self, client):
+        before = sample("prdy_http_requests_total", method="GET", route="/api/prds/<filename>", status="404")
+
+        client.get("/api/prds/missing-prd-20240101-100000.md")
+        client.get("/api/prds/other-prd-20240101-100000.md")
+
+        # Labelled with the URL rule, not the path, so filenames don't add series
+        assert sample(
+            "prdy_http_requests_total", method="GET", route="/api/prds/<filename>", status="404"
+        ) == before + 2
+        assert sample(
+            "prdy_http_request_duration_seconds_count", method="GET", route="/api/prds/<filename>"
+        ) >= 2
+        assert sample("prdy_http_requests_in_flight", route="/api/prds/<filename>") == 0
+
+    def test_streamed_response_recorded_when_closed(self, client):
+        from app import prd_service
+        prd = prd_service.save_prd("# TaskFlow - PRD")
+        before = sample("prdy_http_requests_total", method="GET", route="/api/prds/export", status="200")
+        in_flight = sample("prdy_http_requests_in_flight", route="/api/prds/export")
+
+        response = client.get(f"/api/prds/export?filename={prd}")
+        assert sample("prdy_http_requests_in_flight", route="/api/prds/export") == in_flight + 1
+        response.get_data()
+        response.close()
+
+        assert sample("prdy_http_requests_in_flight", route="/api/prds/export") == in_flight
+        assert sample(
+            "prdy_http_requests_total", method="GET", route="/api/prds/export", status="200"
+        ) == before + 1
+
+    def test_metrics_endpoint(self, client):
+        client.get("/health")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        assert 'prdy_http_requests_total{method="GET",route="/health",status="200"}' in response.get_data(as_text=True)
+
+    def test_storage_timed(self, client):
+        from app import prd_service
+        before = sample("prdy_storage_duration_seconds_count", operation="save_prd")
+
+        prd_service.save_prd("# TaskFlow - PRD")
+
+        assert sample("prdy_storage_duration_seconds_count", operation="save_prd") == before + 1
+
+
+class TestUpstreamMetrics:
+    """Tests for the Claude and Perplexity call metrics."""
+
+    def test_claude_tokens_and_latency(self):
+        service = ClaudeService()
+        usage = MagicMock(
+            input_tokens=120, output_tokens=30,
+            cache_read_input_tokens=100, cache_creation_input_tokens=0
+        )
+        response = MagicMock(content=[MagicMock(text="Sure.")], usage=usage)
+        input_before = sample("prdy_tokens_total", operation="chat", kind="input")
+        cached_before = sample("prdy_tokens_total", operation="chat", kind="cache_read")
+        calls_before = sample(
+            "prdy_upstream_duration_seconds_count", service="claude", operation="chat", outcome="ok"
+        )
+
+        with patch.object(service.client.messages, "create", return_value=response):
+            service.chat([{"role": "user", "content": "Hi"}])
+
+        assert sample("prdy_tokens_total", operation="chat", kind="input") == input_before + 120
+        assert sample("prdy_tokens_total", operation="chat", kind="cache_read") == cached_before + 100
+        assert sample(
+            "prdy_upstream_duration_seconds_count", service="claude", operation="chat", outcome="ok"
+        ) == calls_before + 1
+
+    def test_perplexity_errors_counted(self, tmp_path):
+        service = ResearchService()
+        service.cache.cache_dir = str(tmp_path)
+        before = sample(
+            "prdy_upstream_errors_total", service="perplexity",
+            operation="research_competitors", error="ConnectionError"
+        )
+
+        with patch("services.research_service.get_http_session") as session, \
+                patch.object(service, "_backoff_delay", return_value=0):
+            session.return_value.post.side_effect = requests.exceptions.ConnectionError("down")
+            assert service.research_competitors("TaskFlow", "Tasks").startswith("Research failed")
+
+        assert sample(
+            "prdy_upstream_errors_total", service="perplexity",
+            operation="research_competitors", error="ConnectionError"
+        ) == before + 1
+        assert sample("prdy_upstream_in_flight", service="perplexity", operation="research_competitors") == 0
+
+    def test_cancelled_stream(self):
+        before = sample(
+            "prdy_upstream_duration_seconds_count", service="claude", operation="test", outcome="cancelled"
+        )
+
+        def stream():
+            with metrics.track_upstream("claude", "test"):
+                yield "a"
+                yield "b"
+
+        deltas = stream()
+        next(deltas)
+        deltas.close()
+
+        assert sample(
+            "prdy_upstream_duration_seconds_count", service="claude", operation="test", outcome="cancelled"
+        ) == before + 1
+
+
+class TestMultiprocess:
+    """Values from every gunicorn worker are aggregated."""
+
+    def test_workers_aggregated(self, tmp_path):
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        record = (
+            "from services import metrics; "
+            "metrics.HTTP_REQUESTS.labels('GET', '/health', '200').inc(); "
+            "metrics.TOKENS.labels('chat', 'input').inc(50)"
+        )
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", record], cwd=ROOT, env=env, check=True)
+
+        output = subprocess.run(
+            [sys.executable, "-c", "from services import metrics; print(metrics.render()[0].decode())"],
+            cwd=ROOT, env=env, check=True, capture_output=True, text=True
+        ).stdout
+
+        assert 'prdy_http_requests_total{method="GET",route="/health",status="200"} 2.0' in output
+        assert 'prdy_tokens_total{kind="input",operation="chat"} 100.0' in output
+
+    def test_gunicorn_config_clears_only_its_own_directory(self, tmp_path, monkeypatch):
+        config = os.path.join(ROOT, "gunicorn.conf.py")
+        (tmp_path / "counter_1.db").write_bytes(b"")
+        (tmp_path / "notes.txt").write_text("keep")
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+        runpy.run_path(config)["on_starting"](None)
+        # The operator's directory is untouched
+        assert sorted(os.listdir(tmp_path)) == ["counter_1.db", "notes.txt"]
+
+        monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR")
+        hooks = runpy.run_path(config)
+        created = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+        assert created == hooks["metrics_dir"] and created != str(tmp_path)
+        for name in ("counter_1.db", "notes.txt"):
+            open(os.path.join(created, name), "w").close()
+        hooks["on_starting"](None)
+        assert os.listdir(created) == ["notes.txt"]
+        os.remove(os.path.join(created, "notes.txt"))
+        hooks["on_exit"](None)
+        assert not os.path.exists(created)
@@ -0,0 +1,97 @@
+"""Tests for the PRDService benchmark suite."""
+import json
+import os
+from benchmarks.prd_service import cases, compare, main, measure, product_names, run_suite, synthesize
+from services.prd_service import PRDService
+
+
+def run(calibration: float, **medians) -> dict:
+    return {"calibration": calibration, "results": {
+        "1000": {name: {"median": median, "min": median, "rounds": 5} for name, median in medians.items()}
+    }}
+
+
+class TestSynthesize:
+    """Tests for the synthetic output directories."""
+
+    def test_realistic_tree(self, tmp_path):
+        samples = synthesize(str(tmp_path), 300)
+
+        service = PRDService()
+        service.output_dir = str(tmp_path)
+        names = [name for name in os.listdir(tmp_path) if name.endswith(".md")]
+        archived = samples["packed"] + samples["loose"]
+        assert all(service._is_prd_file(n) or service._is_research_file(n) for n in names)
+        assert archived and not set(archived) & set(names)
+        assert service.get_prd(samples["packed"][0]).startswith("# ")
+        assert service.archive_stats()["files"] >= len(archived)
+        # Products have several PRD versions and their research grouped under the newest
+        prds = service.list_prds()
+        assert len({prd["filename"] for prd in prds}) == len(samples["active"])
+        assert any(prd["research"] for prd in prds)
+
+    def test_product_names_unique(self):
+        names = product_names(10_000)
+        assert len({prefix for _, prefix in names}) == 10_000
+
+
+class TestSuite:
+    """The suite runs every operation and leaves nothing behind."""
+
+    def test_every_operation_timed(self, tmp_path):
+        results = run_suite(300, rounds=1, workdir=str(tmp_path))
+
+        assert {"list_prds", "get_prd", "archive_prd_with_research", "restore_prd", "search"} <= set(results)
+        assert all(result["median"] >= 0 and result["rounds"] >= 1 for result in results.values())
+        assert os.listdir(tmp_path) == []
+
+
+    def test_cases_leave_the_tree_unchanged(self, tmp_path):
+        samples = synthesize(str(tmp_path), 300)
+        service = PRDService()
+        service.output_dir = str(tmp_path)
+
+        def snapshot():
+            return {
+                entry.name: (entry.stat().st_size, entry.stat().st_mtime_ns)
+                for entry in os.scandir(tmp_path) if entry.is_file()
+            }
+
+        before = snapshot()
+        for case in cases(service, samples):
+            if case.name in ("append_to_prd", "list_prds_page_resync", "save_prd"):
+                measure(case, rounds=3)
+
+        assert snapshot() == before
+        assert len(service.list_prds()) == len(samples["active"])
+
+class TestCompare:
+    """Tests for regression detection against the baseline."""
+
+    def test_regression_flagged(self):
+        rows = compare(run(1.0, list_prds=0.2, get_prd=0.0001), run(1.0, list_prds=0.1, get_prd=0.00005), 0.5)
+        status = {row["operation"]: row["status"] for row in rows}
+        # get_prd doubled too, but stays under the noise floor
+        assert status == {"list_prds": "REGRESSED", "get_prd": "ok"}
+
+    def test_baseline_scaled_by_calibration(self):
+        # Twice as slow on a machine that is twice as slow
+        rows = compare(run(2.0, list_prds=0.2), run(1.0, list_prds=0.1), 0.5)
+        assert rows[0]["status"] == "ok"
+        assert rows[0]["ratio"] == 1.0
+
+    def test_new_operations_pass(self):
+        rows = compare(run(1.0, search=0.5), {}, 0.5)
+        assert rows[0]["status"] == "new"
+
+    def test_check_exits_nonzero(self, tmp_path, capsys):
+        baseline = tmp_path / "baseline.json"
+        args = ["--sizes", "200", "--rounds", "1", "--workdir", str(tmp_path), "--baseline", str(baseline)]
+
+        assert main(args + ["--update-baseline"]) == 0
+        stored = json.loads(baseline.read_text())
+        stored["results"]["200"]["rebuild_index"]["median"] = 0.0
+        baseline.write_text(json.dumps(stored))
+
+        assert main(args + ["--check"]) == 1
+        assert "rebuild_index" in capsys.readouterr().out
@@ -0,0 +1,248 @@
+"""Tests for the PRD metadata index."""
+import os
+import sqlite3
+import pytest
+from unittest.mock import patch
+from services.prd_service import PRDService
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = PRDService()
+    service.output_dir = str(tmp_path)
+    return service
+
+
+def write_file(service, filename, content="# Test", mtime=None):
+    """Write a file behind the service's back, as another tool would."""
+    path = os.path.join(service.output_dir, filename)
+    with open(path, "w") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class TestPRDIndex:
+    """Incremental maintenance of the index."""
+
+    def test_writes_are_indexed(self, service):
+        prd = service.save_prd("# TaskFlow - Product Requirements Document")
+        research = service.save_research("## Competitors", "TaskFlow")
+
+        prds = service.list_prds()
+
+        assert [p["filename"] for p in prds] == [prd]
+        assert [r["filename"] for r in prds[0]["research"]] == [research]
+        assert {row["filename"]: row["parent"] for row in service.index.rows()}[research] == prd
+
+    def test_streamed_prd_is_indexed(self, service):
+        with service.open_prd_writer() as writer:
+            writer.write("# TaskFlow - Product Requirements Document\n")
+            filename = writer.commit()
+        assert service.list_prds()[0]["filename"] == filename
+
+    def test_append_updates_size(self, service):
+        prd = service.save_prd("# TaskFlow - PRD")
+        service.list_prds()
+
+        service.append_to_prd(prd, "## 8. Competitive Analysis\n" + "- Asana\n" * 50)
+
+        assert service.list_prds()[0]["size"] == os.path.getsize(os.path.join(service.output_dir, prd))
+
+    def test_archive_removes_rows(self, service):
+        prd = service.save_prd("# TaskFlow - PRD")
+        service.save_research("## Competitors", "TaskFlow")
+
+        service.archive_prd_with_research(prd)
+
+        assert service.list_prds() == []
+        assert service.index.rows() == []
+
+    def test_research_follows_newest_prd(self, service):
+        write_file(service, "taskflow-prd-20240101-100000.md", mtime=1000)
+        write_file(service, "taskflow-competitive-analysis-20240101-110000.md", mtime=1500)
+        write_file(service, "taskflow-prd-20240102-100000.md", mtime=2000)
+
+        prds = service.list_prds()
+
+        assert [p["filename"] for p in prds] == [
+            "taskflow-prd-20240102-100000.md", "taskflow-prd-20240101-100000.md"
+        ]
+        assert len(prds[0]["research"]) == 1
+        assert prds[1]["research"] == []
+
+        service.archive_prd("taskflow-prd-20240102-100000.md")
+        assert len(service.list_prds()[0]["research"]) == 1
+
+    def test_external_changes_are_synced(self, service):
+        write_file(service, "one-prd-20240101-100000.md")
+        assert len(service.list_prds()) == 1
+
+        write_file(service, "two-prd-20240101-100000.md")
+        os.remove(os.path.join(service.output_dir, "one-prd-20240101-100000.md"))
+
+        assert [p["filename"] for p in service.list_prds()] == ["two-prd-20240101-100000.md"]
+
+    def test_unchanged_directory_is_not_rescanned(self, service):
+        for i in range(5):
+            write_file(service, f"product{i}-prd-20240101-100000.md")
+        service.list_prds()
+
+        with patch("services.storage.FilesystemStorage.iter_entries") as mock_list:
+            assert len(service.list_prds()) == 5
+        mock_list.assert_not_called()
+
+    def test_rebuild_picks_up_in_place_edits(self, service):
+        write_file(service, "taskflow-prd-20240101-100000.md", "# Short")
+        service.list_prds()
+        # Same directory entries, so only a rebuild notices the new size
+        write_file(service, "taskflow-prd-20240101-100000.md", "# Much longer content " * 20)
+
+        assert service.rebuild_index() == 1
+        assert service.list_prds()[0]["size"] == len("# Much longer content " * 20)
+
+    def test_falls_back_to_scanning_when_index_fails(self, service):
+        write_file(service, "taskflow-prd-20240101-100000.md")
+        write_file(service, "taskflow-competitive-analysis-20240101-110000.md")
+
+        with patch("services.prd_index.PRDIndex.rows", side_effect=sqlite3.OperationalError("locked")):
+            prds = service.list_prds()
+
+        assert len(prds) == 1 and len(prds[0]["research"]) == 1
+
+    def test_index_follows_output_dir(self, service, tmp_path_factory):
+        service.save_prd("# TaskFlow - PRD")
+        service.output_dir = str(tmp_path_factory.mktemp("other"))
+        assert service.list_prds() == []
+
+
+class TestRebuildIndexCommand:
+    """Tests for the rebuild-index CLI command."""
+
+    def test_rebuild_index_command(self, client, temp_output_dir):
+        from app import app
+        with open(os.path.join(temp_output_dir, "taskflow-prd-20240101-100000.md"), "w") as f:
+            f.write("# TaskFlow")
+
+        result = app.test_cli_runner().invoke(args=["rebuild-index"])
+
+        assert "Indexed 1 file(s)" in result.output
+
+
+class TestPRDSearch:
+    """Tests for full-text search over saved files."""
+
+    PRD = """# TaskFlow - Product Requirements Document
+
+## 1. Executive Summary
+TaskFlow is a task management app for remote teams.
+
+## 5. Functional Requirements
+- Kanban boards
+- Time tracking
+"""
+
+    def test_finds_matching_section_with_highlight(self, service):
+        prd = service.save_prd(self.PRD)
+
+        results = service.search("kanban")
+
+        assert [r["filename"] for r in results] == [prd]
+        assert results[0]["kind"] == "prd"
+        section = results[0]["sections"][0]
+        assert section["heading"] == "5. Functional Requirements"
+        assert "<mark>Kanban</mark> boards" in section["snippet"]
+
+    def test_stemming_and_prefix_matching(self, service):
+        service.save_prd(self.PRD)
+        assert service.search("managing")
+        assert service.search("track")
+
+    def test_heading_matches_rank_first(self, service):
+        write_file(service, "body-prd-20240101-100000.md", "# Body\n\n## Notes\nWe discuss pricing once.")
+        write_file(service, "heading-prd-20240101-100000.md", "# Heading\n\n## Pricing\nTiers and plans.")
+
+        results = service.search("pricing")
+
+        assert [r["filename"] for r in results][0] == "heading-prd-20240101-100000.md"
+
+    def test_limit_filled_past_files_with_many_sections(self, service):
+        sections = "".join(f"## Pricing {i}\nPricing tier {i}.\n\n" for i in range(60))
+        write_file(service, "pricing-prd-20240101-100000.md", f"# Pricing\n\n{sections}")
+        for i in range(5):
+            write_file(service, f"p{i}-prd-20240101-100000.md", f"# P{i}\n\n## Notes\nWe discuss pricing once.")
+
+        results = service.search("pricing", limit=4)
+
+        assert len(results) == 4
+        assert results[0]["filename"] == "pricing-prd-20240101-100000.md"
+        assert len(results[0]["sections"]) == 3
+
+    def test_research_is_searchable(self, service):
+        service.save_prd(self.PRD)
+        research = service.save_research("## 1. Key Competitors\n- Asana", "TaskFlow")
+        assert [r["filename"] for r in service.search("asana")] == [research]
+
+    def test_index_follows_writes_and_archives(self, service):
+        prd = service.save_prd(self.PRD)
+        assert service.search("offline") == []
+
+        service.append_to_prd(prd, "## Offline Mode\nWorks without a connection.")
+        assert service.search("offline")[0]["filename"] == prd
+
+        service.archive_prd(prd)
+        assert service.search("offline") == []
+
+    def test_external_files_are_searchable(self, service):
+        service.list_prds()
+        write_file(service, "notes-prd-20240101-100000.md", "# Notes\n\nA habit tracker.")
+        assert service.search("habit")[0]["filename"] == "notes-prd-20240101-100000.md"
+
+    def test_snippets_are_html_escaped(self, service):
+        write_file(service, "xss-prd-20240101-100000.md", "# XSS\n\nA <script>alert(1)</script> widget.")
+        snippet = service.search("widget")[0]["sections"][0]["snippet"]
+        assert "<script>" not in snippet
+        assert "&lt;script&gt;" in snippet
+
+    def test_query_syntax_is_not_interpreted(self, service):
+        service.save_prd(self.PRD)
+        assert service.search('kanban "') != []
+        assert service.search('NEAR(kanban') == []
+        assert service.search("***") == []
+
+    def test_backfills_index_created_before_search(self, service):
+        write_file(service, "old-prd-20240101-100000.md", "# Old\n\nLegacy content.")
+        service.list_prds()
+        with sqlite3.connect(service.index.db_path) as conn:
+            conn.execute("DROP TABLE sections")
+            conn.execute("DROP TABLE documents")
+
+        service._index = None
+        assert service.search("legacy")[0]["filename"] == "old-prd-20240101-100000.md"
+
+
+class TestSearchEndpoint:
+    """Tests for /api/prds/search."""
+
+    def test_search_endpoint(self, client, temp_output_dir):
+        with open(os.path.join(temp_output_dir, "taskflow-prd-20240101-100000.md"), "w") as f:
+            f.write("# TaskFlow\n\n## Integrations\nSlack and GitHub.")
+
+        response = client.get("/api/prds/search?q=slack")
+
+        assert response.status_code == 200
+        results = response.get_json()["results"]
+        assert results[0]["filename"] == "taskflow-prd-20240101-100000.md"
+        assert results[0]["name"] == "Taskflow"
+        assert "<mark>Slack</mark>" in results[0]["sections"][0]["snippet"]
+
+    def test_search_index_io_error(self, client):
+        from app import prd_service
+        with patch.object(prd_service, "search", side_effect=OSError("disk I/O error")):
+            response = client.get("/api/prds/search?q=slack")
+        assert response.status_code == 500
+        assert "disk I/O error" in response.get_json()["error"]
+
+    def test_search_requires_query(self, client):
+        assert client.get("/api/prds/search").status_code == 400
+        assert client.get("/api/prds/search?q=x&limit=0").status_code == 400
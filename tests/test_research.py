@@ -1,4 +1,6 @@
 """Tests for web research service with mocked API calls."""
+import asyncio
+import httpx
 import pytest
 from unittest.mock import patch, MagicMock
 from services.research_service import ResearchService
@@ -250,3 +252,664 @@ class TestProductContextExtraction:
 
         assert result['product_name'] == 'TaskFlow'
         assert result['confidence'] == 'high'
+
+
+class TestProductContextMemoization:
+    """Tests for memoized product context extraction."""
+
+    @pytest.fixture
+    def service(self):
+        service = ClaudeService()
+        service.client = MagicMock()
+        response = MagicMock()
+        response.content = [MagicMock(text='{"product_name": "TaskFlow", "confidence": "high"}')]
+        response.usage = MagicMock(
+            input_tokens=100, output_tokens=20,
+            cache_read_input_tokens=0, cache_creation_input_tokens=0
+        )
+        service.client.messages.create.return_value = response
+        return service
+
+    def test_repeat_prd_extraction_skips_api_call(self, service):
+        prd = "# TaskFlow - Product Requirements Document\n\n## Overview\nTasks for teams."
+
+        first = service.extract_product_context(prd_content=prd)
+        second = service.extract_product_context(prd_content=prd)
+
+        assert first == second == {"product_name": "TaskFlow", "confidence": "high"}
+        assert service.client.messages.create.call_count == 1
+        assert service.context_cache.stats()["hits"] == 1
+
+    def test_key_covers_only_condensed_input(self, service):
+        """Changes past the first 4000 characters don't affect extraction."""
+        head = "# TaskFlow\n" + "x" * 4000
+        service.extract_product_context(prd_content=head + "tail one")
+        service.extract_product_context(prd_content=head + "tail two")
+        assert service.client.messages.create.call_count == 1
+
+        service.extract_product_context(prd_content="# Other product")
+        assert service.client.messages.create.call_count == 2
+
+    def test_conversation_keyed_on_recent_messages(self, service):
+        messages = [{"role": "user", "content": f"message {i}"} for i in range(12)]
+        service.extract_product_context(messages=messages)
+        # Older messages fall outside the last-10 window
+        service.extract_product_context(messages=[{"role": "user", "content": "old"}] + messages)
+        assert service.client.messages.create.call_count == 1
+
+        service.extract_product_context(messages=messages + [{"role": "user", "content": "new"}])
+        assert service.client.messages.create.call_count == 2
+
+    def test_cached_result_is_a_copy(self, service):
+        service.extract_product_context(prd_content="# TaskFlow")["product_name"] = "Changed"
+        assert service.extract_product_context(prd_content="# TaskFlow")["product_name"] == "TaskFlow"
+
+    def test_failures_are_not_cached(self, service):
+        service.client.messages.create.return_value.content = [MagicMock(text="not json")]
+        assert "error" in service.extract_product_context(prd_content="# TaskFlow")
+
+        service.client.messages.create.return_value.content = [MagicMock(text='{"product_name": "TaskFlow"}')]
+        assert service.extract_product_context(prd_content="# TaskFlow") == {"product_name": "TaskFlow"}
+
+    def test_lru_eviction(self):
+        from services.memo_cache import MemoCache
+        cache = MemoCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now the least recently used
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+    def test_shared_across_workers_through_redis(self, service):
+        fakeredis = pytest.importorskip("fakeredis")
+        from services.memo_cache import MemoCache
+        redis_client = fakeredis.FakeRedis()
+        service.context_cache = MemoCache(redis_client, ttl=60)
+        service.extract_product_context(prd_content="# TaskFlow")
+
+        # A second worker has its own process-local LRU but the same Redis
+        other = ClaudeService()
+        other.client = MagicMock()
+        other.context_cache = MemoCache(redis_client, ttl=60)
+
+        assert other.extract_product_context(prd_content="# TaskFlow")["product_name"] == "TaskFlow"
+        other.client.messages.create.assert_not_called()
+        assert 0 < max(redis_client.ttl(key) for key in redis_client.keys()) <= 60
+
+
+class TestLocalProductContextExtraction:
+    """Tests for the zero-LLM extractor used for saved PRDs."""
+
+    PRD = """# TaskFlow - Product Requirements Document
+
+**Generated:** 2024-01-13
+**Version:** 1.0
+
+---
+
+## 1. Executive Summary
+TaskFlow is a **premium** task management app for remote teams. It keeps
+distributed work visible. It also does much more.
+
+## 2. Problem Statement
+Teams lose track of work.
+"""
+
+    def test_standard_prd_is_high_confidence(self):
+        from services.prd_service import PRDService
+        context = PRDService().extract_product_context(self.PRD)
+
+        assert context == {
+            "product_name": "TaskFlow",
+            "product_description": "TaskFlow is a premium task management app for remote teams. It keeps distributed work visible.",
+            "search_category": "task management app for remote teams",
+            "confidence": "high"
+        }
+
+    def test_non_standard_title_is_medium_confidence(self):
+        from services.prd_service import PRDService
+        context = PRDService().extract_product_context(
+            "# TaskFlow - PRD\n\n## Overview\nAn ultimate budgeting tool that families share."
+        )
+
+        assert context["search_category"] == "budgeting tool"
+        assert context["confidence"] == "medium"
+
+    def test_missing_fields_are_low_confidence(self):
+        from services.prd_service import PRDService
+        service = PRDService()
+
+        assert service.extract_product_context("Just some notes")["confidence"] == "low"
+        # No "is a <category>" phrase to search on
+        no_category = "# TaskFlow - Product Requirements Document\n\n## 1. Executive Summary\nHelps teams ship."
+        assert service.extract_product_context(no_category)["confidence"] == "low"
+
+    @patch.object(ResearchService, 'research_competitors')
+    @patch.object(ClaudeService, 'extract_product_context')
+    def test_structured_prd_skips_claude(self, mock_extract, mock_research, client, temp_output_dir):
+        import os
+        filename = 'taskflow-prd-20240113-120000.md'
+        with open(os.path.join(temp_output_dir, filename), 'w') as f:
+            f.write(self.PRD)
+        mock_research.return_value = "analysis"
+
+        response = client.post('/api/research/context', json={'source': filename})
+
+        data = response.get_json()
+        assert response.status_code == 200
+        assert data['product_name'] == 'TaskFlow'
+        assert data['debug']['extraction'] == {"method": "local", "local_confidence": "high"}
+        assert mock_research.call_args.args[0] == 'task management app for remote teams'
+        mock_extract.assert_not_called()
+
+    @patch.object(ResearchService, 'research_competitors')
+    @patch.object(ClaudeService, 'extract_product_context')
+    def test_unstructured_prd_falls_back_to_claude(self, mock_extract, mock_research, client, temp_output_dir):
+        import os
+        filename = 'notes-prd-20240113-120000.md'
+        with open(os.path.join(temp_output_dir, filename), 'w') as f:
+            f.write("Some loose notes about a habit tracker.")
+        mock_extract.return_value = {
+            'product_name': 'Habit tracker',
+            'product_description': 'Tracks habits',
+            'search_category': 'habit tracker app',
+            'confidence': 'medium'
+        }
+        mock_research.return_value = "analysis"
+
+        response = client.post('/api/research/context', json={'source': filename})
+
+        assert response.get_json()['debug']['extraction'] == {"method": "claude", "local_confidence": "low"}
+        mock_extract.assert_called_once()
+
+
+class TestResearchCache:
+    """Tests for the disk-backed research cache."""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        from services.research_cache import ResearchCache
+        return ResearchCache(cache_dir=str(tmp_path / "research"), ttl=60, max_entries=3)
+
+    def test_key_normalizes_case_and_whitespace(self):
+        from services.research_cache import ResearchCache
+        assert ResearchCache.make_key("Task  Manager ", "For teams", "sonar") == \
+            ResearchCache.make_key("task manager", "for  TEAMS", "sonar")
+        assert ResearchCache.make_key("task manager", "for teams", "sonar") != \
+            ResearchCache.make_key("task manager", "for teams", "sonar-pro")
+
+    def test_miss_then_hit(self, cache):
+        assert cache.get("k") is None
+        cache.set("k", "## Competitors")
+        assert cache.get("k") == "## Competitors"
+
+    def test_expired_entries_are_dropped(self, cache):
+        import time
+        cache.set("k", "old")
+        with patch("services.research_cache.time.time", return_value=time.time() + 120):
+            assert cache.get("k") is None
+        assert cache.get("k") is None
+
+    def test_evicts_oldest_beyond_max_entries(self, cache):
+        import os
+        for i in range(5):
+            cache.set(f"k{i}", f"v{i}")
+            path = os.path.join(cache.cache_dir, f"k{i}.json")
+            os.utime(path, (1000 + i, 1000 + i))
+
+        cache.set("k5", "v5")
+
+        assert cache.get("k0") is None
+        assert cache.get("k5") == "v5"
+        assert len(os.listdir(cache.cache_dir)) == 3
+
+
+class TestResearchCompetitorsCaching:
+    """Tests for research_competitors cache integration."""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        service = ResearchService()
+        service.cache.cache_dir = str(tmp_path / "research")
+        return service
+
+    @pytest.fixture
+    def mock_post(self):
+        """Patch the pooled HTTP session's post method."""
+        with patch("services.research_service.get_http_session") as mock_session:
+            yield mock_session.return_value.post
+
+    @staticmethod
+    def _perplexity_response(content):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": content}}]}
+        return response
+
+    def test_repeat_research_uses_cache(self, mock_post, service):
+        mock_post.return_value = self._perplexity_response("## 1. Key Competitors")
+
+        first = service.research_competitors("task manager", "for teams")
+        second = service.research_competitors("Task Manager", "for teams")
+
+        assert first == second == "## 1. Key Competitors"
+        assert mock_post.call_count == 1
+
+    def test_force_refresh_bypasses_cache(self, mock_post, service):
+        mock_post.return_value = self._perplexity_response("v1")
+        service.research_competitors("task manager", "for teams")
+
+        mock_post.return_value = self._perplexity_response("v2")
+        result = service.research_competitors("task manager", "for teams", force_refresh=True)
+
+        assert result == "v2"
+        assert service.research_competitors("task manager", "for teams") == "v2"
+
+    def test_failures_are_not_cached(self, mock_post, service):
+        import requests
+        service.max_retries = 0
+        mock_post.side_effect = requests.exceptions.ConnectionError("down")
+        assert service.research_competitors("task manager", "").startswith("Research failed")
+
+        mock_post.side_effect = None
+        mock_post.return_value = self._perplexity_response("recovered")
+        assert service.research_competitors("task manager", "") == "recovered"
+
+    @patch.object(ResearchService, 'research_competitors')
+    @patch.object(ClaudeService, 'extract_product_context')
+    def test_context_endpoint_passes_force_refresh(self, mock_extract, mock_research, client):
+        with patch.object(ClaudeService, 'chat') as mock_chat:
+            mock_chat.return_value = "Hi there!"
+            client.post('/api/chat', json={'message': 'A task manager'})
+
+        mock_extract.return_value = {
+            'product_name': 'TaskFlow',
+            'product_description': 'Tasks for teams',
+            'search_category': 'task manager',
+            'confidence': 'high'
+        }
+        mock_research.return_value = "analysis"
+
+        response = client.post('/api/research/context', json={
+            'source': 'conversation', 'force_refresh': True
+        })
+
+        assert response.status_code == 200
+        assert mock_research.call_args.kwargs["force_refresh"] is True
+
+
+class StubPerplexity:
+    """Local HTTP server replaying scripted (status, headers, body) responses."""
+
+    def __init__(self, responses):
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.responses = list(responses)
+        self.client_ports = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.client_ports.append(self.client_address[1])
+                status, headers, content = stub.responses.pop(0)
+                body = json.dumps(
+                    {"choices": [{"message": {"content": content}}]}
+                ).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestResearchHTTPClient:
+    """Retry, backoff and connection reuse against a local stub server."""
+
+    @pytest.fixture
+    def make_service(self, tmp_path):
+        stubs = []
+
+        def make(responses):
+            stub = StubPerplexity(responses)
+            stubs.append(stub)
+            service = ResearchService()
+            service.api_url = stub.url
+            service.cache.cache_dir = str(tmp_path / "research")
+            service.backoff_base = 0.01
+            return service, stub
+
+        yield make
+        for stub in stubs:
+            stub.close()
+
+    def test_retries_transient_errors(self, make_service):
+        service, stub = make_service([
+            (503, {}, ""),
+            (502, {}, ""),
+            (200, {}, "## Competitors"),
+        ])
+
+        assert service.research_competitors("task manager", "for teams") == "## Competitors"
+
+        stats = service.http_stats()
+        assert stats["attempts"] == 3
+        assert stats["retries"] == 2
+        assert [a["status"] for a in stats["recent_attempts"]] == [503, 502, 200]
+        assert all(a["elapsed_ms"] >= 0 for a in stats["recent_attempts"])
+
+    def test_honors_retry_after(self, make_service):
+        import time
+        service, stub = make_service([
+            (429, {"Retry-After": "0.3"}, ""),
+            (200, {}, "ok"),
+        ])
+
+        started = time.monotonic()
+        assert service.research_competitors("task manager", "") == "ok"
+        assert time.monotonic() - started >= 0.3
+
+    def test_gives_up_after_max_retries(self, make_service):
+        service, stub = make_service([(500, {}, "")] * 3)
+        service.max_retries = 2
+
+        result = service.research_competitors("task manager", "")
+
+        assert result.startswith("Research failed")
+        assert service.http_stats()["failures"] == 1
+        assert stub.responses == []
+
+    def test_does_not_retry_client_errors(self, make_service):
+        service, stub = make_service([(401, {}, ""), (200, {}, "unused")])
+
+        assert service.research_competitors("task manager", "").startswith("Research failed")
+        assert len(stub.responses) == 1
+
+    def test_reuses_keep_alive_connection(self, make_service):
+        service, stub = make_service([(200, {}, "one"), (200, {}, "two")])
+
+        service.research_competitors("first product", "")
+        service.research_competitors("second product", "")
+
+        assert len(set(stub.client_ports)) == 1
+
+    def test_backoff_is_bounded(self):
+        service = ResearchService()
+        service.backoff_max = 2.0
+        assert all(0 <= service._backoff_delay(10) <= 2.0 for _ in range(50))
+        # The server's Retry-After is honored, not clamped
+        assert service._backoff_delay(0, retry_after="120") == 120
+
+    def test_gives_up_when_retry_after_exceeds_deadline(self, make_service):
+        import time
+        service, stub = make_service([(429, {"Retry-After": "60"}, ""), (200, {}, "unused")])
+        service.deadline = 5
+
+        started = time.monotonic()
+        assert service.research_competitors("task manager", "").startswith("Research failed")
+        assert time.monotonic() - started < 1
+        assert len(stub.responses) == 1
+        assert service.http_stats()["failures"] == 1
+
+    def test_read_timeouts_not_retried(self):
+        import requests
+        service = ResearchService()
+        service.backoff_base = 0.01
+        with patch("services.research_service.get_http_session") as session:
+            session.return_value.post.side_effect = requests.exceptions.ReadTimeout("read timed out")
+            with pytest.raises(requests.exceptions.ReadTimeout):
+                service._post({})
+
+        assert session.return_value.post.call_count == 1
+
+    def test_connection_errors_retried_within_deadline(self):
+        import requests
+        service = ResearchService()
+        service.backoff_base = 0.01
+        with patch("services.research_service.get_http_session") as session:
+            session.return_value.post.side_effect = requests.exceptions.ConnectTimeout("connect timed out")
+            with pytest.raises(requests.exceptions.ConnectTimeout):
+                service._post({}, timeout=60)
+
+        assert session.return_value.post.call_count == service.max_retries + 1
+        # Each attempt's timeout fits in what is left of the deadline
+        assert all(call.kwargs["timeout"] <= service.deadline for call in session.return_value.post.call_args_list)
+
+
+class TestParallelResearch:
+    """Tests for per-section parallel research."""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        service = ResearchService()
+        service.cache.cache_dir = str(tmp_path / "research")
+        service.max_retries = 0
+        return service
+
+    @pytest.fixture
+    def mock_post(self):
+        with patch("services.research_service.get_http_session") as mock_session:
+            yield mock_session.return_value.post
+
+    @staticmethod
+    def _answer_by_section(fail=(), delay=0.0):
+        """Answer each section query with its own title, failing the given ones."""
+        import re
+        import time
+        import requests
+
+        def post(url, headers, json, timeout):
+            title = re.search(r'Write only the "(.+?)" section', json["messages"][0]["content"]).group(1)
+            time.sleep(delay)
+            if title in fail:
+                raise requests.exceptions.ConnectionError("down")
+            response = MagicMock(status_code=200)
+            response.json.return_value = {"choices": [{"message": {"content": f"About {title}"}}]}
+            return response
+        return post
+
+    def test_sections_merged_in_report_order(self, mock_post, service):
+        from services.research_service import COMPETITOR_SECTIONS
+        mock_post.side_effect = self._answer_by_section()
+
+        result = service.research_competitors_parallel("task manager", "for teams")
+
+        titles = [title for title, _ in COMPETITOR_SECTIONS]
+        assert mock_post.call_count == len(titles)
+        assert result["content"] == "\n\n".join(f"## {t}\nAbout {t}" for t in titles)
+        assert [s["title"] for s in result["sections"]] == titles
+        assert all(s["ok"] and s["elapsed_ms"] >= 0 for s in result["sections"])
+
+    def test_sections_run_concurrently(self, mock_post, service):
+        import time
+        mock_post.side_effect = self._answer_by_section(delay=0.2)
+
+        started = time.monotonic()
+        service.research_competitors_parallel("task manager", "for teams")
+
+        assert time.monotonic() - started < 0.6
+
+    def test_failed_section_degrades_gracefully(self, mock_post, service):
+        mock_post.side_effect = self._answer_by_section(fail={"2. Pricing Landscape"})
+
+        result = service.research_competitors_parallel("task manager", "for teams")
+
+        assert "## 2. Pricing Landscape\n_This section could not be researched" in result["content"]
+        assert "About 1. Key Competitors" in result["content"]
+        assert [s["ok"] for s in result["sections"]] == [True, False, True, True, True]
+
+    def test_only_complete_reports_are_cached(self, mock_post, service):
+        mock_post.side_effect = self._answer_by_section(fail={"3. Feature Comparison"})
+        service.research_competitors_parallel("task manager", "for teams")
+
+        mock_post.side_effect = self._answer_by_section()
+        complete = service.research_competitors_parallel("task manager", "for teams")
+        assert complete["cached"] is False
+
+        cached = service.research_competitors_parallel("task manager", "for teams")
+        assert cached["cached"] is True
+        assert cached["content"] == complete["content"]
+
+    def test_all_sections_failing(self, mock_post, service):
+        from services.research_service import COMPETITOR_SECTIONS
+        mock_post.side_effect = self._answer_by_section(fail={title for title, _ in COMPETITOR_SECTIONS})
+
+        result = service.research_competitors_parallel("task manager", "")
+
+        assert result["content"].startswith("Research failed")
+        assert not any(s["ok"] for s in result["sections"])
+
+    @patch.object(ResearchService, 'research_competitors_parallel')
+    @patch.object(ClaudeService, 'extract_product_context')
+    def test_context_endpoint_reports_section_timings(self, mock_extract, mock_parallel, client):
+        with patch.object(ClaudeService, 'chat') as mock_chat:
+            mock_chat.return_value = "Hi there!"
+            client.post('/api/chat', json={'message': 'A task manager'})
+
+        mock_extract.return_value = {
+            'product_name': 'TaskFlow',
+            'product_description': 'Tasks for teams',
+            'search_category': 'task manager',
+            'confidence': 'high'
+        }
+        sections = [{"title": "1. Key Competitors", "ok": True, "elapsed_ms": 812.5}]
+        mock_parallel.return_value = {"content": "## 1. Key Competitors\n- Asana", "cached": False, "sections": sections}
+
+        response = client.post('/api/research/context', json={'source': 'conversation', 'parallel': True})
+
+        data = response.get_json()
+        assert response.status_code == 200
+        assert data["analysis"] == "## 1. Key Competitors\n- Asana"
+        assert data["debug"]["sections"] == sections
+        assert data["debug"]["parallel"] is True
+
+    @patch.object(ResearchService, 'research_competitors_parallel')
+    def test_string_flags_rejected(self, mock_parallel, client):
+        """"false" is truthy, so flags must be real booleans."""
+        for flags in ({'parallel': 'false'}, {'force_refresh': 'true'}, {'parallel': 1}):
+            for url in ('/api/research/context', '/api/jobs/research'):
+                response = client.post(url, json={'source': 'conversation', **flags})
+                assert response.status_code == 400
+                assert "booleans" in response.get_json()["error"]
+        mock_parallel.assert_not_called()
+
+
+class TestAsyncResearch:
+    """Async counterparts of the Perplexity calls, against the stub server."""
+
+    @pytest.fixture
+    def make_service(self, tmp_path):
+        stubs = []
+
+        def make(responses):
+            stub = StubPerplexity(responses)
+            stubs.append(stub)
+            service = ResearchService()
+            service.api_url = stub.url
+            service.cache.cache_dir = str(tmp_path / "research")
+            service.backoff_base = 0.01
+            return service, stub
+
+        yield make
+        for stub in stubs:
+            stub.close()
+
+    @staticmethod
+    def run(service, call):
+        """Await call() on a new event loop, closing the loop's client as callers should."""
+        async def main():
+            try:
+                return await call()
+            finally:
+                await service.aclose()
+        return asyncio.run(main())
+
+    def test_retries_and_caches_like_sync(self, make_service):
+        service, stub = make_service([(503, {}, ""), (200, {}, "## Competitors")])
+
+        result = self.run(service, lambda: service.aresearch_competitors("task manager", "for teams"))
+
+        assert result == "## Competitors"
+        assert service.http_stats()["retries"] == 1
+        # Shares the cache with the sync method
+        assert service.research_competitors("task manager", "for teams") == "## Competitors"
+        assert stub.responses == []
+
+    def test_failures_are_reported_not_raised(self, make_service):
+        service, stub = make_service([(401, {}, "")])
+
+        result = self.run(service, lambda: service.aresearch_competitors("task manager", ""))
+
+        assert result.startswith("Research failed")
+        assert service.http_stats()["failures"] == 1
+
+    def test_parallel_sections_on_one_loop(self, make_service):
+        from services.research_service import COMPETITOR_SECTIONS
+        service, stub = make_service([(200, {}, "Section body")] * len(COMPETITOR_SECTIONS))
+
+        result = self.run(service, lambda: service.aresearch_competitors_parallel("task manager", "for teams"))
+
+        assert [s["title"] for s in result["sections"]] == [title for title, _ in COMPETITOR_SECTIONS]
+        assert all(s["ok"] for s in result["sections"])
+        assert result["content"].startswith("## 1. Key Competitors\nSection body")
+        cached = self.run(service, lambda: service.aresearch_competitors_parallel("task manager", "for teams"))
+        assert cached["cached"]
+
+    def test_aclose_closes_the_loops_client(self, make_service):
+        service, _ = make_service([(200, {}, "## Competitors")])
+        clients = []
+
+        async def call():
+            clients.append(service._async_http())
+            return await service.aresearch_competitors("task manager", "")
+
+        self.run(service, call)
+
+        assert clients[0].is_closed
+        assert len(service._async_clients) == 0
+
+    def test_gives_up_when_retry_after_exceeds_deadline(self, make_service):
+        service, stub = make_service([(429, {"Retry-After": "60"}, ""), (200, {}, "unused")])
+        service.deadline = 5
+
+        result = self.run(service, lambda: service.aresearch_competitors("task manager", ""))
+
+        assert result.startswith("Research failed")
+        assert len(stub.responses) == 1
+
+    def test_only_connection_errors_retried(self):
+        service = ResearchService()
+        service.backoff_base = 0.01
+        for error, attempts in ((httpx.ReadTimeout, 1), (httpx.ConnectError, service.max_retries + 1)):
+            calls = []
+
+            def fail(request):
+                calls.append(request)
+                raise error("failed", request=request)
+
+            async def post():
+                async with httpx.AsyncClient(transport=httpx.MockTransport(fail)) as client:
+                    with patch.object(service, "_async_http", return_value=client):
+                        return await service._apost({})
+
+            with pytest.raises(error):
+                asyncio.run(post())
+            assert len(calls) == attempts
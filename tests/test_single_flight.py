@@ -0,0 +1,235 @@
+"""Tests for coalescing identical concurrent calls."""
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from redis.exceptions import ConnectionError as RedisConnectionError
+from services.claude_service import ClaudeService
+from services.research_service import ResearchService
+from services.single_flight import SingleFlight
+
+
+class SlowCall:
+    """Stand-in for an upstream call that blocks until released."""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_threads(count: int, target) -> list:
+    """Call target from count threads at once and collect results or errors."""
+    results = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis()
+
+
+class TestInProcess:
+    """Tests for callers in one process."""
+
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight()
+        call = SlowCall({"content": "report"})
+
+        threads, results = run_threads(5, lambda: flights.do("key", "research", call))
+        call.started.wait(5)
+        # Let the other callers arrive while the call is in flight
+        time.sleep(0.1)
+        call.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert call.calls == 1
+        assert results == [{"content": "report"}] * 5
+        # Each caller got its own copy
+        assert len({id(result) for result in results}) == 5
+        assert flights._flights == {}
+
+    def test_errors_shared_then_forgotten(self):
+        flights = SingleFlight()
+        call = SlowCall(error=ValueError("upstream down"))
+
+        threads, results = run_threads(3, lambda: flights.do("key", "research", call))
+        call.started.wait(5)
+        time.sleep(0.1)
+        call.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert call.calls == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        # The next call runs again
+        assert flights.do("key", "research", lambda: "fresh") == "fresh"
+
+    def test_different_keys_not_shared(self):
+        flights = SingleFlight()
+        assert flights.do("a", "research", lambda: 1) == 1
+        assert flights.do("b", "research", lambda: 2) == 2
+
+
+class TestAsync:
+    """Tests for coroutine callers on one event loop."""
+
+    def test_async_callers_share_one_call(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def research():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "report"
+
+        async def main():
+            return await asyncio.gather(*(flights.ado("key", "research", research) for _ in range(4)))
+
+        assert asyncio.run(main()) == ["report"] * 4
+        assert len(calls) == 1
+
+    def test_cancelled_leader_hands_over(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def research():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "report"
+
+        async def main():
+            leader = asyncio.create_task(flights.ado("key", "research", research))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(flights.ado("key", "research", research)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(*waiters), leader.cancelled()
+
+        # The first waiter runs the call and the others share it
+        assert asyncio.run(main()) == (["report"] * 3, True)
+        assert len(calls) == 2
+
+    def test_redis_calls_run_off_the_loop(self, redis_client):
+        flights = SingleFlight(redis_client, poll_interval=0.01)
+        threads = []
+        acquire = flights._acquire
+
+        def record(key):
+            threads.append(threading.current_thread())
+            return acquire(key)
+
+        async def research():
+            return "report"
+
+        with patch.object(flights, "_acquire", side_effect=record):
+            assert asyncio.run(flights.ado("key", "research", research)) == "report"
+
+        assert threads and threading.main_thread() not in threads
+        assert redis_client.get("prdy:flight:lock:key") is None
+
+class TestAcrossWorkers:
+    """Two SingleFlight instances on one Redis stand in for two workers."""
+
+    def test_second_worker_waits_for_the_first(self, redis_client):
+        first, second = (SingleFlight(redis_client, poll_interval=0.01) for _ in range(2))
+        call = SlowCall("report")
+        other = MagicMock(return_value="duplicate")
+
+        threads, results = run_threads(1, lambda: first.do("key", "research", call))
+        call.started.wait(5)
+        waiter, waited = run_threads(1, lambda: second.do("key", "research", other))
+        time.sleep(0.1)
+        call.release.set()
+        for thread in threads + waiter:
+            thread.join(5)
+
+        assert (results, waited) == (["report"], ["report"])
+        other.assert_not_called()
+        # The lock is released and the result expires
+        assert redis_client.get("prdy:flight:lock:key") is None
+        assert all(redis_client.ttl(key) > 0 for key in redis_client.keys())
+
+    def test_failed_holder_hands_over(self, redis_client):
+        first, second = (SingleFlight(redis_client, poll_interval=0.01) for _ in range(2))
+        call = SlowCall(error=ValueError("upstream down"))
+
+        threads, results = run_threads(1, lambda: first.do("key", "research", call))
+        call.started.wait(5)
+        waiter, waited = run_threads(1, lambda: second.do("key", "research", lambda: "retried"))
+        time.sleep(0.1)
+        call.release.set()
+        for thread in threads + waiter:
+            thread.join(5)
+
+        assert isinstance(results[0], ValueError)
+        assert waited == ["retried"]
+
+    def test_redis_errors_run_unshared(self):
+        broken = MagicMock()
+        broken.set.side_effect = RedisConnectionError("down")
+        assert SingleFlight(broken).do("key", "research", lambda: "report") == "report"
+
+
+class TestServices:
+    """Research and extraction share concurrent calls."""
+
+    def test_concurrent_research_refreshes_share_one_query(self, tmp_path):
+        service = ResearchService()
+        service.cache.cache_dir = str(tmp_path)
+        call = SlowCall("## 1. Key Competitors")
+
+        with patch.object(service, "_complete", side_effect=call):
+            threads, results = run_threads(
+                4, lambda: service.research_competitors("TaskFlow", "Tasks", force_refresh=True)
+            )
+            call.started.wait(5)
+            time.sleep(0.1)
+            call.release.set()
+            for thread in threads:
+                thread.join(5)
+
+        assert call.calls == 1
+        assert results == ["## 1. Key Competitors"] * 4
+
+    def test_concurrent_extractions_share_one_call(self):
+        service = ClaudeService()
+        service.client = MagicMock()
+        call = SlowCall(MagicMock(
+            content=[MagicMock(text='{"product_name": "TaskFlow", "confidence": "high"}')],
+            usage=MagicMock(input_tokens=10, output_tokens=5)
+        ))
+        service.client.messages.create.side_effect = call
+
+        threads, results = run_threads(3, lambda: service.extract_product_context(prd_content="# TaskFlow"))
+        call.started.wait(5)
+        time.sleep(0.1)
+        call.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert call.calls == 1
+        assert [result["product_name"] for result in results] == ["TaskFlow"] * 3
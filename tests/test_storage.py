@@ -0,0 +1,157 @@
+"""Tests for the pluggable PRD storage backends."""
+import pytest
+from services.prd_service import PRDService
+from services.storage import S3Storage, SQLiteStorage, Storage, StorageWriter, create_storage
+
+
+class TestStorageBackends:
+    """Behavior shared by every backend."""
+
+    def test_write_then_read(self, storage):
+        storage.write_text("a-prd-20240101-100000.md", "# Café ☕")
+        assert storage.read_text("a-prd-20240101-100000.md") == "# Café ☕"
+
+    def test_missing_file_reads_as_none(self, storage):
+        assert storage.read_text("missing.md") is None
+        assert storage.stat("missing.md") is None
+        assert list(storage.iter_chunks("missing.md")) == []
+
+    def test_streaming_write_commits_atomically(self, storage):
+        with storage.open_writer() as writer:
+            writer.write(b"# Title\n")
+            assert storage.list_names() == []
+            writer.write(b"body")
+            writer.commit("doc.md")
+        assert storage.read_bytes("doc.md") == b"# Title\nbody"
+
+    def test_uncommitted_write_is_discarded(self, storage):
+        with pytest.raises(RuntimeError):
+            with storage.open_writer() as writer:
+                writer.write(b"partial")
+                raise RuntimeError("stream failed")
+        assert storage.list_names() == []
+
+    def test_streaming_read(self, storage):
+        data = bytes(range(256)) * 1000
+        storage.write_bytes("big.md", iter([data[:100000], data[100000:]]))
+        chunks = list(storage.iter_chunks("big.md", chunk_size=65536))
+        assert len(chunks) > 1
+        assert b"".join(chunks) == data
+
+    def test_append(self, storage):
+        storage.write_text("doc.md", "one")
+        assert storage.append("doc.md", b" two")
+        assert storage.read_text("doc.md") == "one two"
+        assert storage.stat("doc.md").size == 7
+        assert not storage.append("missing.md", b"x")
+
+    def test_move_to_archive_hides_from_listing(self, storage):
+        storage.write_text("doc.md", "content")
+        assert storage.move("doc.md", "old/doc.md")
+        assert storage.list_names() == []
+        assert storage.list_names("old/") == ["old/doc.md"]
+        assert storage.read_text("old/doc.md") == "content"
+        assert not storage.move("doc.md", "old/doc.md")
+
+    def test_read_range(self, storage):
+        storage.write_bytes("doc.md", b"0123456789")
+        assert storage.read_range("doc.md", 3, 4) == b"3456"
+        assert storage.read_range("missing.md", 0, 1) is None
+
+    def test_nested_names(self, storage):
+        storage.write_text("old/segments/a.seg", "x")
+        assert storage.list_names("old/") == []
+        assert storage.list_names("old/segments/") == ["old/segments/a.seg"]
+
+    def test_listing_is_batched(self, storage):
+        for i in range(5):
+            storage.write_text(f"doc{i}.md", "x")
+        if isinstance(storage, S3Storage):
+            batches = list(storage.iter_entries())
+        else:
+            batches = list(storage.iter_entries(batch_size=2))
+            assert [len(batch) for batch in batches] == [2, 2, 1]
+        assert sorted(e.name for batch in batches for e in batch) == [f"doc{i}.md" for i in range(5)]
+
+    def test_change_token_tracks_additions_and_removals(self, storage):
+        before = storage.change_token()
+        storage.write_text("doc.md", "x")
+        after_write = storage.change_token()
+        assert after_write != before
+
+        storage.delete("doc.md")
+        assert storage.change_token() != after_write
+        assert storage.read_text("doc.md") is None
+
+
+class TestPRDServiceOnSharedStorage:
+    """PRDService running on non-filesystem backends."""
+
+    @pytest.fixture(params=["sqlite", "s3"])
+    def shared(self, request, tmp_path, monkeypatch):
+        monkeypatch.setattr("services.prd_service.CACHE_DIR", str(tmp_path / "cache"))
+        if request.param == "sqlite":
+            path = str(tmp_path / "prds.sqlite3")
+            return lambda: SQLiteStorage(path)
+        client = request.getfixturevalue("s3_client")
+        return lambda: S3Storage("prdy-test", "prds/", client=client)
+
+    def test_save_list_search_archive(self, shared):
+        service = PRDService(shared())
+        prd = service.save_prd("# TaskFlow - Product Requirements Document\n\n## Overview\nKanban for teams.")
+        research = service.save_research("## Competitors\n- Trello", "TaskFlow")
+        with service.open_prd_writer() as writer:
+            writer.write("# Other - Product Requirements Document\n")
+            streamed = writer.commit()
+
+        prds = {p["filename"]: p for p in service.list_prds()}
+        assert set(prds) == {prd, streamed}
+        assert [r["filename"] for r in prds[prd]["research"]] == [research]
+        assert service.search("kanban")[0]["filename"] == prd
+        assert service.append_to_prd(prd, "## More")
+        assert service.get_prd(prd).endswith("## More")
+
+        assert service.archive_prd_with_research(prd)["archived"] == [prd, research]
+        assert [p["filename"] for p in service.list_prds()] == [streamed]
+
+    def test_instances_share_storage(self, shared, tmp_path, monkeypatch):
+        """A PRD saved by one app instance appears in another's listing."""
+        first = PRDService(shared())
+        first.list_prds()
+
+        # A second instance has its own local index
+        monkeypatch.setattr("services.prd_service.CACHE_DIR", str(tmp_path / "other-cache"))
+        second = PRDService(shared())
+        assert second.list_prds() == []
+
+        filename = first.save_prd("# Shared - Product Requirements Document")
+        assert [p["filename"] for p in second.list_prds()] == [filename]
+        assert second.get_prd(filename).startswith("# Shared")
+
+
+class TestInterface:
+    """Backends must implement the whole interface."""
+
+    def test_incomplete_backend_rejected(self):
+        class ReadOnly(Storage):
+            def open_read(self, name):
+                return None
+
+        for cls in (Storage, StorageWriter, ReadOnly):
+            with pytest.raises(TypeError):
+                cls()
+
+
+class TestCreateStorage:
+    """Tests for backend selection."""
+
+    def test_filesystem_is_default(self):
+        assert create_storage("filesystem") is None
+
+    def test_sqlite_backend(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("services.storage.STORAGE_SQLITE_PATH", str(tmp_path / "x.sqlite3"))
+        assert isinstance(create_storage("sqlite"), SQLiteStorage)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_storage("ftp")
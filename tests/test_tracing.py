@@ -0,0 +1,220 @@
+"""Tests for request tracing, request ID propagation and JSON logs."""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from unittest.mock import MagicMock, patch
+from services import tracing
+from services.claude_service import ClaudeService
+from services.research_service import ResearchService
+
+
+@pytest.fixture
+def spans(tmp_path, monkeypatch):
+    """Export spans to a file and return a reader for them."""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "exporter", tracing.FileExporter(str(path)))
+
+    def read():
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+    return read
+
+
+class StubAnthropic:
+    """Local HTTP server answering Messages API calls and recording their headers."""
+
+    def __init__(self):
+        self.headers = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.headers.append(dict(self.headers))
+                body = json.dumps({
+                    "id": "msg_1", "type": "message", "role": "assistant", "model": "claude",
+                    "content": [{"type": "text", "text": "Sure."}],
+                    "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": 10, "output_tokens": 2}
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestSpans:
+    """Tests for span nesting and export."""
+
+    def test_nested_spans_share_a_trace(self, spans):
+        with tracing.span("outer") as outer:
+            with tracing.span("inner", size=3):
+                pass
+
+        inner, exported_outer = spans()
+        assert inner["name"] == "inner"
+        assert inner["trace_id"] == outer.trace_id
+        assert inner["parent_id"] == outer.span_id
+        assert inner["attributes"] == {"size": 3}
+        assert exported_outer["parent_id"] is None
+        assert tracing.current_span() is None
+
+    def test_errors_recorded(self, spans):
+        with pytest.raises(ValueError):
+            with tracing.span("failing"):
+                raise ValueError("bad input")
+
+        assert spans()[0]["status"] == "error"
+        assert spans()[0]["error"] == "ValueError: bad input"
+
+    def test_bound_threads_inherit_the_trace(self, spans):
+        with tracing.span("request") as parent:
+            worker = threading.Thread(target=tracing.bind(self._child_span))
+            worker.start()
+            worker.join()
+
+        child = next(span for span in spans() if span["name"] == "child")
+        assert child["parent_id"] == parent.span_id
+
+    @staticmethod
+    def _child_span():
+        with tracing.span("child"):
+            pass
+
+    def test_otlp_payload(self):
+        exporter = tracing.OTLPExporter("http://collector:4318/")
+        with patch.object(tracing, "exporter", exporter), \
+                patch("services.tracing.requests.post") as post:
+            tracing.set_request_id("req-1")
+            try:
+                with tracing.span("claude.chat", kind="client", service="claude"):
+                    pass
+            finally:
+                tracing.set_request_id(None)
+            exporter.flush()
+
+        url, payload = post.call_args.args[0], post.call_args.kwargs["json"]
+        span = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert url == "http://collector:4318/v1/traces"
+        assert payload["resourceSpans"][0]["resource"]["attributes"][0]["key"] == "service.name"
+        assert span["name"] == "claude.chat"
+        assert span["kind"] == 3
+        assert {"key": "request.id", "value": {"stringValue": "req-1"}} in span["attributes"]
+        assert int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
+
+
+class TestRequestTracing:
+    """Tests for route spans and request IDs."""
+
+    def test_request_id_echoed_or_generated(self, client):
+        assert client.get("/health", headers={"X-Request-ID": "abc-123"}).headers["X-Request-ID"] == "abc-123"
+        generated = client.get("/health", headers={"X-Request-ID": "bad id"}).headers["X-Request-ID"]
+        assert generated != "bad id"
+        assert len(client.get("/health").headers["X-Request-ID"]) == 32
+
+    def test_incoming_traceparent_continued(self, client, spans):
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+        client.get("/health", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"})
+
+        route = spans()[-1]
+        assert route["name"] == "GET /health"
+        assert route["kind"] == "server"
+        assert (route["trace_id"], route["parent_id"]) == (trace_id, parent_id)
+        assert route["attributes"]["http.status_code"] == 200
+
+    def test_context_research_breakdown(self, client, spans):
+        """A research request shows extraction, research and bookkeeping as child spans."""
+        perplexity_response = MagicMock(status_code=200)
+        perplexity_response.json.return_value = {"choices": [{"message": {"content": "## Competitors"}}]}
+
+        with patch.object(ClaudeService, "extract_product_context", return_value={
+            "product_name": "TaskFlow", "product_description": "Tasks", "confidence": "high"
+        }), patch.object(ClaudeService, "chat", return_value="Hello"), \
+                patch("services.research_service.get_http_session") as session:
+            session.return_value.post.return_value = perplexity_response
+            client.post("/api/chat", json={"message": "A task app"})
+            response = client.post(
+                "/api/research/context", json={"source": "conversation", "force_refresh": True},
+                headers={"X-Request-ID": "research-1"}
+            )
+
+        assert response.status_code == 200
+        exported = [span for span in spans() if span["request_id"] == "research-1"]
+        by_name = {span["name"]: span for span in exported}
+        route = by_name["POST /api/research/context"]
+        for phase in ("research.extract_context", "research.competitors", "research.update_conversation"):
+            assert by_name[phase]["parent_id"] == route["span_id"]
+        upstream = by_name["perplexity.research_competitors"]
+        assert upstream["parent_id"] == by_name["research.competitors"]["span_id"]
+
+        # Perplexity sees the request ID and the calling span
+        headers = session.return_value.post.call_args.kwargs["headers"]
+        assert headers["X-Request-ID"] == "research-1"
+        assert headers["traceparent"] == f"00-{route['trace_id']}-{upstream['span_id']}-01"
+
+    def test_claude_calls_carry_request_id(self, spans):
+        stub = StubAnthropic()
+        try:
+            service = ClaudeService()
+            service.client = service.client.with_options(base_url=stub.url, api_key="test")
+            tracing.set_request_id("chat-1")
+            try:
+                service.chat([{"role": "user", "content": "Hi"}])
+            finally:
+                tracing.set_request_id(None)
+        finally:
+            stub.close()
+
+        span = spans()[0]
+        assert span["name"] == "claude.chat"
+        assert stub.headers[0]["X-Request-ID"] == "chat-1"
+        assert stub.headers[0]["traceparent"] == f"00-{span['trace_id']}-{span['span_id']}-01"
+
+
+class TestJSONLogs:
+    """Tests for the structured log format."""
+
+    def test_log_line_carries_request_and_trace(self):
+        record = logging.makeLogRecord({
+            "name": "services.research_service", "levelname": "WARNING", "levelno": logging.WARNING,
+            "msg": "Perplexity API error", "error": "timeout", "section": "1. Key Competitors"
+        })
+        tracing.set_request_id("req-9")
+        try:
+            with tracing.span("perplexity.research_section") as current:
+                entry = json.loads(tracing.JSONFormatter().format(record))
+        finally:
+            tracing.set_request_id(None)
+
+        assert entry["message"] == "Perplexity API error"
+        assert entry["level"] == "WARNING"
+        assert entry["request_id"] == "req-9"
+        assert (entry["trace_id"], entry["span_id"]) == (current.trace_id, current.span_id)
+        assert entry["error"] == "timeout"
+        assert entry["section"] == "1. Key Competitors"
+
+    def test_services_log_instead_of_printing(self, tmp_path, caplog, capsys):
+        service = ResearchService()
+        service.cache.cache_dir = str(tmp_path)
+        with patch.object(service, "_complete", side_effect=KeyError("choices")):
+            service.research_competitors("TaskFlow", "Tasks")
+
+        assert capsys.readouterr().out == ""
+        assert caplog.records[-1].message == "Perplexity response parsing error"
+        assert caplog.records[-1].error == "'choices'"